@@ -0,0 +1,117 @@
+"""
+Compare the per-model DynamoDB codec with the generic conversion it replaced.
+
+Run from the repository root with: python -m benchmarks.bench_codecs
+"""
+
+import numbers
+import timeit
+import typing as t
+import uuid
+
+from boto3.dynamodb.types import Binary, Decimal
+
+from braid_triggers.codecs import _iterate_dict, model_codec
+from braid_triggers.models import (
+    ActionStatus,
+    ActionStatusValue,
+    Event,
+    InternalTrigger,
+    Token,
+    TokenSet,
+    TriggerState,
+)
+
+
+def _legacy_to_item(trigger: InternalTrigger) -> dict[str, t.Any]:
+    def dynamo_serialize(val: t.Any) -> t.Any:
+        if isinstance(val, numbers.Number):
+            val = Decimal(val)
+        elif isinstance(val, (bytes, bytearray)):
+            val = Binary(val)
+        elif val is not None:
+            val = str(val)
+        return val
+
+    return _iterate_dict(trigger.dict(), dynamo_serialize)
+
+
+def _legacy_from_item(item: dict[str, t.Any]) -> InternalTrigger:
+    def dynamo_deserialize(val: t.Any) -> t.Any:
+        if isinstance(val, Decimal):
+            val = float(val)
+            if int(val) == val:
+                val = int(val)
+        elif isinstance(val, Binary):
+            val = val.value
+        return val
+
+    return InternalTrigger(**_iterate_dict(item, dynamo_deserialize))
+
+
+def _template(width: int, depth: int) -> dict[str, t.Any]:
+    if depth == 0:
+        return {f"param_{i}": f"value {i}" for i in range(width)}
+    return {
+        f"section_{i}": _template(width, depth - 1)
+        | {"count.=": "event_count", "flags": [True, 1, 2.5]}
+        for i in range(width)
+    }
+
+
+def _trigger() -> InternalTrigger:
+    token = Token(
+        access_token="access", scope="scope", refresh_token="refresh", expiration_time=1
+    )
+    statuses = [
+        ActionStatus(
+            status=ActionStatusValue.SUCCEEDED,
+            creator_id="creator",
+            action_id=str(uuid.uuid4()),
+            details={"output": _template(4, 2)},
+        )
+        for _ in range(10)
+    ]
+    return InternalTrigger(
+        queue_id=uuid.uuid4(),
+        action_url="https://example.com/action",
+        action_scope="https://auth.globus.org/scopes/action",
+        event_filter="body['size'] > 10",
+        event_template=_template(6, 3),
+        trigger_id=str(uuid.uuid4()),
+        created_by=str(uuid.uuid4()),
+        globus_auth_scope="https://auth.globus.org/scopes/trigger",
+        state=TriggerState.ENABLED,
+        last_action_status=statuses[-1],
+        last_action_statuses=statuses,
+        last_event=Event(
+            body=_template(5, 2),
+            event_id="event",
+            sent_by_effective_identity="sender",
+            timestamp="2023-01-01T00:00:00",
+        ),
+        token_set=TokenSet(user_token=token, dependent_tokens={"scope": token}),
+        all_action_status=[],
+    )
+
+
+def main(number: int = 200) -> None:
+    trigger = _trigger()
+    codec = model_codec(InternalTrigger)
+    item = codec.to_item(trigger)
+    legacy_item = _legacy_to_item(trigger)
+
+    cases = {
+        "encode legacy": lambda: _legacy_to_item(trigger),
+        "encode codec": lambda: codec.to_item(trigger),
+        "decode legacy": lambda: _legacy_from_item(legacy_item),
+        "decode codec (validated)": lambda: codec.from_item(item, trusted=False),
+        "decode codec (trusted)": lambda: codec.from_item(item),
+    }
+    for name, case in cases.items():
+        elapsed = min(timeit.repeat(case, number=number, repeat=5))
+        print(f"{name:26} {elapsed / number * 1e6:10.1f} us/op")
+
+
+if __name__ == "__main__":
+    main()
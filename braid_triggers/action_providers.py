@@ -0,0 +1,98 @@
+"""
+Introspection of action providers. A GET of an action provider's URL returns a document
+describing it, from which we need the scope for calling it. Documents are cached,
+shared by all callers in the process, so creating many triggers for the same action
+fetches its document once.
+"""
+
+import logging
+import typing as t
+
+from aiohttp import ClientTimeout
+from pydantic import BaseModel
+
+from braid_triggers.aiohttp_session import read_json
+from braid_triggers.cache import AsyncCache
+from braid_triggers.metrics import register_gauge
+from braid_triggers.resilience import request
+from braid_triggers.settings import get_settings
+
+log = logging.getLogger(__name__)
+
+
+class ActionProviderInfo(BaseModel):
+    url: str
+    globus_auth_scope: str | None = None
+    synchronous: bool | None = None
+    input_schema: dict[str, t.Any] | None = None
+
+
+class ActionProviderIntrospectionError(Exception):
+    pass
+
+
+_action_provider_cache: AsyncCache[str, ActionProviderInfo] | None = None
+
+
+def _get_action_provider_cache() -> AsyncCache[str, ActionProviderInfo]:
+    global _action_provider_cache
+    if _action_provider_cache is None:
+        settings = get_settings()
+        _action_provider_cache = AsyncCache(
+            maxsize=settings.action_provider_cache_size,
+            ttl=settings.action_provider_cache_ttl_seconds,
+        )
+        register_gauge(
+            "action_providers.introspection_cache",
+            _action_provider_cache.stats.as_dict,
+        )
+    return _action_provider_cache
+
+
+async def _fetch_action_provider_info(url: str) -> ActionProviderInfo:
+    timeout = ClientTimeout(total=get_settings().action_provider_timeout_seconds)
+    try:
+        resp = await request("GET", url, timeout=timeout)
+        if not (200 <= resp.status < 300):
+            raise ActionProviderIntrospectionError(
+                f"Introspection of {url} returned status {resp.status}: "
+                f"{await resp.text()}"
+            )
+        doc = await read_json(resp)
+    except ActionProviderIntrospectionError:
+        raise
+    except Exception as e:
+        raise ActionProviderIntrospectionError(
+            f"Introspection of {url} failed due to {str(e)}"
+        ) from e
+    if not isinstance(doc, dict):
+        raise ActionProviderIntrospectionError(
+            f"Introspection of {url} returned {doc}, not an object"
+        )
+    return ActionProviderInfo(
+        url=url,
+        globus_auth_scope=doc.get("globus_auth_scope"),
+        synchronous=doc.get("synchronous"),
+        input_schema=doc.get("input_schema"),
+    )
+
+
+async def get_action_provider_info(
+    url: str, refresh: bool = False
+) -> ActionProviderInfo:
+    """Return the introspection document of the action provider at url, from the cache
+    unless refresh is True. Concurrent requests for the same url share one fetch.
+    Failures raise ActionProviderIntrospectionError and are remembered for a short time
+    so that a failing provider isn't fetched repeatedly.
+    """
+    settings = get_settings()
+    try:
+        return await _get_action_provider_cache().get_or_load(
+            url,
+            lambda: _fetch_action_provider_info(url),
+            error_ttl=settings.action_provider_error_ttl_seconds,
+            refresh=refresh,
+        )
+    except ActionProviderIntrospectionError as e:
+        log.warning(str(e))
+        raise
@@ -0,0 +1,134 @@
+"""
+A feed of what running triggers are doing: events received, filter decisions, actions
+run and action status changes. Pollers publish activity to the broker, which passes it
+to subscribers watching the trigger, such as clients of the activity stream API. Each
+subscriber has a bounded buffer; when a slow subscriber's buffer is full, its oldest
+activity is dropped rather than slowing down the pollers.
+"""
+
+import asyncio
+import time
+import typing as t
+from collections import deque
+
+from pydantic import BaseModel
+
+from braid_triggers.metrics import register_gauge
+
+
+class TriggerActivity(BaseModel):
+    trigger_id: str
+    # One of the *_ACTIVITY kinds below
+    kind: str
+    timestamp: float
+    details: dict[str, t.Any] = {}
+
+
+EVENT_RECEIVED_ACTIVITY = "event_received"
+FILTER_EVALUATED_ACTIVITY = "filter_evaluated"
+ACTION_STARTED_ACTIVITY = "action_started"
+ACTION_STATUS_ACTIVITY = "action_status"
+TRIGGER_STATE_ACTIVITY = "trigger_state"
+
+
+class Subscription:
+    def __init__(
+        self,
+        trigger_ids: t.AbstractSet[str] | None = None,
+        created_by: str | None = None,
+        maxsize: int = 1000,
+    ):
+        """Receives the activity of the triggers in trigger_ids, or if that is None, of
+        all triggers created by created_by
+        """
+        self.trigger_ids = trigger_ids
+        self.created_by = created_by
+        self._activity: deque[TriggerActivity] = deque(maxlen=maxsize)
+        self._available = asyncio.Event()
+        self.dropped = 0
+
+    def offer(self, activity: TriggerActivity) -> None:
+        if len(self._activity) == self._activity.maxlen:
+            self.dropped += 1
+        self._activity.append(activity)
+        self._available.set()
+
+    def take_dropped(self) -> int:
+        """Return the number of activities dropped since the last call"""
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    async def get(self, timeout: float | None = None) -> list[TriggerActivity]:
+        """Wait up to timeout seconds for activity, then return all that is available"""
+        if not self._activity:
+            try:
+                await asyncio.wait_for(self._available.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        activity = list(self._activity)
+        self._activity.clear()
+        self._available.clear()
+        return activity
+
+
+class ActivityBroker:
+    def __init__(self, buffer_size: int = 1000):
+        self.buffer_size = buffer_size
+        self._by_trigger_id: dict[str, set[Subscription]] = {}
+        self._by_creator: dict[str, set[Subscription]] = {}
+
+    def __len__(self) -> int:
+        return len(
+            set().union(*self._by_trigger_id.values(), *self._by_creator.values())
+        )
+
+    def subscribe(
+        self,
+        trigger_ids: t.Iterable[str] | None = None,
+        created_by: str | None = None,
+        maxsize: int | None = None,
+    ) -> Subscription:
+        """Subscribe to the triggers in trigger_ids, or to all the triggers created by
+        created_by. The subscription buffers at most maxsize activities.
+        """
+        ids = set(trigger_ids) if trigger_ids is not None else None
+        subscription = Subscription(
+            ids, created_by, maxsize=maxsize or self.buffer_size
+        )
+        if ids is not None:
+            for trigger_id in ids:
+                self._by_trigger_id.setdefault(trigger_id, set()).add(subscription)
+        elif created_by is not None:
+            self._by_creator.setdefault(created_by, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription.trigger_ids is not None:
+            keys, index = subscription.trigger_ids, self._by_trigger_id
+        else:
+            keys, index = {subscription.created_by}, self._by_creator
+        for key in keys:
+            subscriptions = index.get(key)
+            if subscriptions is None:
+                continue
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del index[key]
+
+    def publish(self, trigger_id: str, created_by: str, kind: str, **details) -> None:
+        by_trigger_id = self._by_trigger_id.get(trigger_id)
+        by_creator = self._by_creator.get(created_by)
+        # Most activity has no subscribers, so it is discarded as cheaply as possible
+        if not by_trigger_id and not by_creator:
+            return
+        subscriptions = (by_trigger_id or set()) | (by_creator or set())
+        activity = TriggerActivity(
+            trigger_id=trigger_id, kind=kind, timestamp=time.time(), details=details
+        )
+        for subscription in subscriptions:
+            subscription.offer(activity)
+
+
+broker = ActivityBroker()
+
+register_gauge("activity.subscribers", lambda: len(broker))
@@ -1,3 +1,133 @@
-from aiohttp import ClientSession
+"""
+The HTTP client session shared by all outbound requests (to Auth, Queues and action
+providers). It is created by init_session() at startup and closed by close_session()
+at shutdown, so its connection pool and DNS cache are reused across all requests.
+"""
 
-aio_session = ClientSession()
+import asyncio
+import logging
+import typing as t
+from urllib.parse import urlsplit
+
+from aiohttp import (
+    ClientResponse,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+    TraceConfig,
+)
+
+from braid_triggers.jsoncodec import loads
+from braid_triggers.metrics import counter, register_gauge
+from braid_triggers.settings import get_settings
+
+log = logging.getLogger(__name__)
+
+_session: ClientSession | None = None
+
+_requests = counter("http.requests", "Outbound HTTP requests")
+_connections_created = counter("http.connections_created", "New connections opened")
+_connections_reused = counter(
+    "http.connections_reused", "Requests on a pooled connection"
+)
+
+
+async def _on_request_start(session, context, params) -> None:
+    _requests.inc()
+
+
+async def _on_connection_create_end(session, context, params) -> None:
+    _connections_created.inc()
+
+
+async def _on_connection_reuseconn(session, context, params) -> None:
+    _connections_reused.inc()
+
+
+def _trace_config() -> TraceConfig:
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    return trace_config
+
+
+def _pool_stats() -> dict[str, t.Any] | None:
+    if _session is None or _session.closed:
+        return None
+    connector = _session.connector
+    # aiohttp doesn't provide a public API for how many connections are in use or idle
+    acquired = getattr(connector, "_acquired", ())
+    idle = getattr(connector, "_conns", {})
+    return {
+        "limit": connector.limit,
+        "limit_per_host": connector.limit_per_host,
+        "in_use": len(acquired),
+        "idle": sum(len(conns) for conns in idle.values()),
+    }
+
+
+register_gauge("http.pool", _pool_stats)
+
+
+def _create_session() -> ClientSession:
+    settings = get_settings()
+    connector = TCPConnector(
+        limit=settings.http_pool_size,
+        limit_per_host=settings.http_pool_size_per_host,
+        keepalive_timeout=settings.http_keepalive_seconds,
+        use_dns_cache=True,
+        ttl_dns_cache=settings.http_dns_cache_ttl_seconds,
+    )
+    return ClientSession(
+        connector=connector,
+        timeout=ClientTimeout(total=settings.http_timeout_seconds),
+        trace_configs=[_trace_config()],
+    )
+
+
+def get_session() -> ClientSession:
+    """Return the shared session, creating it if init_session() hasn't been called"""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+
+async def read_json(resp: ClientResponse) -> t.Any:
+    """Decode a JSON response body directly from its bytes with the fast JSON codec"""
+    return loads(await resp.read())
+
+
+async def init_session() -> ClientSession:
+    return get_session()
+
+
+async def close_session() -> None:
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def _warm_up_origin(origin: str, timeout: ClientTimeout) -> None:
+    try:
+        async with get_session().head(origin, timeout=timeout) as resp:
+            log.debug(f"Warm up of {origin} returned {resp.status}")
+    except Exception as e:
+        log.info(f"Warm up connection to {origin} failed: {str(e)}")
+
+
+async def warm_up(urls: t.Iterable[str], timeout: float = 5.0) -> None:
+    """Open a pooled connection to the host of each of urls, so that the first real
+    requests don't wait for DNS resolution and TLS handshakes. Failures are ignored.
+    """
+    origins = {
+        f"{parts.scheme}://{parts.netloc}"
+        for parts in (urlsplit(url) for url in urls)
+        if parts.scheme and parts.netloc
+    }
+    client_timeout = ClientTimeout(total=timeout)
+    await asyncio.gather(
+        *(_warm_up_origin(origin, client_timeout) for origin in sorted(origins))
+    )
@@ -1,15 +1,22 @@
+import asyncio
 import copy
+import hashlib
 import logging
 import time
 import typing as t
 from base64 import b64encode
 
-import cachetools
+from aiohttp import ClientError, ClientTimeout
 from fastapi import HTTPException
 
-from braid_triggers.aiohttp_session import aio_session
+from braid_triggers.aiohttp_session import read_json
+from braid_triggers.backends import KeyValueVersionConflict
+from braid_triggers.cache import AsyncCache, BatchLoader
 from braid_triggers.config import get_config_val
+from braid_triggers.metrics import register_gauge
 from braid_triggers.models import InternalTrigger, Token, TokenSet
+from braid_triggers.persistence import key_value_store, update_trigger_with_retry
+from braid_triggers.resilience import CircuitOpenError, request
 
 from .settings import get_settings
 
@@ -61,13 +68,7 @@ class AuthInfo(object):
     @property
     async def dependent_tokens(self) -> list[Token]:
         if self._dependent_tokens is None:
-            dep_tokens = await dependent_token_exchange(self.access_token)
-            self._dependent_tokens = []
-            for dep_token_result in dep_tokens:
-                dep_token_result[
-                    "expiration_time"
-                ] = time.time() + dep_token_result.pop("expires_in")
-                self._dependent_tokens.append(Token(**dep_token_result))
+            self._dependent_tokens = await exchange_dependent_tokens(self.access_token)
         return self._dependent_tokens
 
     @property
@@ -116,15 +117,27 @@ async def _perform_auth_request(
     body: t.Mapping | None = None,
     path_type: str = "api",
     body_type="json",
+    idempotent: bool | None = None,
 ):
     if not path.startswith("/"):
         path = "/" + path
     url = f"{AUTH_DOMAIN}v2/{path_type}{path}"
     auth_headers = _client_auth_header()
     body_param = {body_type: body}
-    response = await aio_session.request(
-        method, url, headers=auth_headers, timeout=30, **body_param
-    )
+    try:
+        response = await request(
+            method,
+            url,
+            idempotent=idempotent,
+            headers=auth_headers,
+            timeout=ClientTimeout(total=30),
+            **body_param,
+        )
+    except (CircuitOpenError, ClientError, asyncio.TimeoutError) as e:
+        log.error(f"Failed to {method} resource {url} due to {repr(e)}")
+        raise HTTPException(
+            status_code=503, detail=f"Unable to communicate with Globus Auth: {str(e)}"
+        )
     if not (200 <= response.status < 300):
         resp_text = await response.text()
         log.error(
@@ -137,7 +150,7 @@ async def _perform_auth_request(
             detail=f"Failed to Communicate with Globus Auth: {resp_text}",
         )
     try:
-        response_json = await response.json()
+        response_json = await read_json(response)
     except ValueError:
         log.error(
             f"Failed to parse response from Globus Auth for {method} resource {url} "
@@ -148,93 +161,471 @@ async def _perform_auth_request(
             detail="Failed to Communicate with Globus Auth",
         )
 
-    log.info(f"{method} to url {url} returned {response_json}")
+    # The response is not logged as it may contain tokens
+    log.info(f"{method} to url {url} returned status {response.status}")
     return response_json
 
 
-async def introspect_token(
-    token: str, client_id: str | None = None
-) -> dict[str, t.Any]:
-    params = {"token": token, "include": "identities_set"}
-    # Same algorithm as in dependent_token_exchange() to try with flow-specific client id
-    # and the Flows service client_id
-    for try_client_id in {client_id, None}:
-        response_json = await _perform_auth_request(
-            "/token/introspect",
-            "POST",
-            body=params,
-            path_type="oauth2",
-            body_type="data",
+_introspection_cache: AsyncCache[str, dict[str, t.Any]] | None = None
+
+
+def _get_introspection_cache() -> AsyncCache[str, dict[str, t.Any]]:
+    global _introspection_cache
+    if _introspection_cache is None:
+        settings = get_settings()
+        _introspection_cache = AsyncCache(
+            maxsize=settings.introspection_cache_size,
+            ttl=settings.introspection_cache_ttl_seconds,
         )
-        response_json = response_json
-        if response_json.get("active", False):
-            return response_json
-    msg = f"Expired or invalid Bearer token {response_json}"
-    log.warning(msg)
-    raise HTTPException(status_code=401, detail=msg)
+        register_gauge("auth.introspection_cache", _introspection_cache.stats.as_dict)
+    return _introspection_cache
+
+
+def _introspection_ttl(token_resp: dict[str, t.Any]) -> float:
+    settings = get_settings()
+    if not token_resp.get("active", False):
+        return settings.introspection_negative_ttl_seconds
+    ttl = settings.introspection_cache_ttl_seconds
+    exp = token_resp.get("exp")
+    if exp is not None:
+        ttl = min(ttl, exp - time.time())
+    return ttl
+
+
+async def _introspect_token(token: str) -> dict[str, t.Any]:
+    params = {"token": token, "include": "identities_set"}
+    return await _perform_auth_request(
+        "/token/introspect",
+        "POST",
+        body=params,
+        path_type="oauth2",
+        body_type="data",
+        idempotent=True,
+    )
+
+
+async def introspect_token(token: str) -> dict[str, t.Any]:
+    """Return the Globus Auth introspection of token, raising a 401 HTTPException if it
+    is not active. Responses are cached, keyed by a hash of the token, until the token
+    expires (or the cache ttl if sooner), and concurrent introspections of the same
+    token share one request.
+    """
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    response_json = await _get_introspection_cache().get_or_load(
+        token_hash, lambda: _introspect_token(token), ttl=_introspection_ttl
+    )
+    if not response_json.get("active", False):
+        msg = f"Expired or invalid Bearer token {response_json}"
+        log.warning(msg)
+        raise HTTPException(status_code=401, detail=msg)
+    # Callers get their own copy of the cached response
+    return copy.deepcopy(response_json)
 
 
 async def dependent_token_exchange(
-    token: str, offline_access: bool = True
+    token: str, offline_access: bool = True, scopes: t.Iterable[str] | None = None
 ) -> list[dict[str, t.Any]]:
+    """Exchange token for its dependent tokens, limited to those for scopes if given"""
     params = {
         "grant_type": "urn:globus:auth:grant_type:dependent_token",
         "token": token,
         "access_type": "offline" if offline_access else "online",
     }
+    if scopes is not None:
+        params["scope"] = " ".join(sorted(scopes))
+    # Repeating an exchange only results in another set of tokens, so it may be retried
     response_json = await _perform_auth_request(
-        "/token", "POST", body=params, path_type="oauth2", body_type="data"
+        "/token",
+        "POST",
+        body=params,
+        path_type="oauth2",
+        body_type="data",
+        idempotent=True,
     )
     return response_json
 
 
+# Matches the margin used by Token.requires_refresh()
+_REFRESH_MARGIN_SECONDS = 300
+
+# Keyed by (token hash, offline access, requested scopes or None for all of them)
+_DependentTokenKey = tuple[str, bool, t.Optional[t.FrozenSet[str]]]
+
+_dependent_token_cache: AsyncCache[_DependentTokenKey, list[Token]] | None = None
+
+
+def _get_dependent_token_cache() -> AsyncCache[_DependentTokenKey, list[Token]]:
+    global _dependent_token_cache
+    if _dependent_token_cache is None:
+        settings = get_settings()
+        _dependent_token_cache = AsyncCache(
+            maxsize=settings.dependent_token_cache_size,
+            ttl=settings.dependent_token_cache_ttl_seconds,
+        )
+        register_gauge(
+            "auth.dependent_token_cache", _dependent_token_cache.stats.as_dict
+        )
+    return _dependent_token_cache
+
+
+def _dependent_tokens_ttl(tokens: list[Token]) -> float:
+    # Keep the tokens only while all of them are still good for the refresh margin, so
+    # a cached token never needs refreshing immediately after it is stored on a trigger
+    ttl = get_settings().dependent_token_cache_ttl_seconds
+    now = time.time()
+    for token in tokens:
+        ttl = min(ttl, token.expiration_time - now - _REFRESH_MARGIN_SECONDS)
+    return ttl
+
+
+async def _exchange_dependent_tokens(
+    token: str, offline_access: bool, scopes: t.FrozenSet[str] | None
+) -> list[Token]:
+    dep_tokens = await dependent_token_exchange(
+        token, offline_access=offline_access, scopes=scopes
+    )
+    tokens: list[Token] = []
+    for dep_token_result in dep_tokens:
+        dep_token_result["expiration_time"] = time.time() + dep_token_result.pop(
+            "expires_in"
+        )
+        tokens.append(Token(**dep_token_result))
+    return tokens
+
+
+async def exchange_dependent_tokens(
+    token: str, offline_access: bool = True, scopes: t.Iterable[str] | None = None
+) -> list[Token]:
+    """Return the dependent tokens for token, or only those for scopes when given.
+    Results are cached in memory, keyed by a hash of the token and the requested
+    scopes, for as long as the dependent tokens remain valid, and concurrent exchanges
+    for the same token and scopes share one request. The returned tokens are copies.
+    """
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    requested = frozenset(scopes) if scopes is not None else None
+    tokens = await _get_dependent_token_cache().get_or_load(
+        (token_hash, offline_access, requested),
+        lambda: _exchange_dependent_tokens(token, offline_access, requested),
+        ttl=_dependent_tokens_ttl,
+    )
+    return [tkn.copy() for tkn in tokens]
+
+
+# Tokens obtained by a refresh grant, keyed by (trigger_id, scope) and kept until they
+# in turn need refreshing. Concurrent refreshes for the same trigger and scope share one
+# grant, and tasks holding an older copy of the trigger get the refreshed token rather
+# than refreshing again.
+_refreshed_tokens: AsyncCache[tuple[str, str], Token] | None = None
+
+
+def _get_refreshed_tokens() -> AsyncCache[tuple[str, str], Token]:
+    global _refreshed_tokens
+    if _refreshed_tokens is None:
+        settings = get_settings()
+        _refreshed_tokens = AsyncCache(
+            maxsize=settings.refreshed_token_cache_size,
+            ttl=settings.refreshed_token_cache_ttl_seconds,
+        )
+        register_gauge("auth.refreshed_token_cache", _refreshed_tokens.stats.as_dict)
+    return _refreshed_tokens
+
+
+# Dependent tokens shared by all the triggers of an identity, stored in the key-value
+# store as one entry per identity mapping scope to token
+_TOKEN_POOL_NAMESPACE = "token_pool"
+
+
+def token_owner(trigger: InternalTrigger) -> str:
+    """The key of whoever the trigger's dependent tokens belong to: the identity's pool
+    for a pooled trigger, else the trigger itself
+    """
+    if trigger.token_set.pool_identity is not None:
+        return f"pool:{trigger.token_set.pool_identity}"
+    return trigger.trigger_id
+
+
+def _refreshed_token_ttl(token: Token) -> float:
+    return token.expiration_time - time.time() - _REFRESH_MARGIN_SECONDS
+
+
+async def read_token_pool(identity: str) -> dict[str, Token]:
+    stored = await asyncio.to_thread(
+        key_value_store().get, _TOKEN_POOL_NAMESPACE, identity
+    )
+    return {scope: Token(**token) for scope, token in (stored or {}).items()}
+
+
+def _update_token_pool(
+    identity: str, tokens: t.Mapping[str, Token], max_attempts: int = 5
+) -> None:
+    """Add tokens to identity's pool, replacing any for the same scopes. The pool is
+    written conditionally on its version, and if another instance or task wrote it in
+    the meantime, it is read and updated again, up to max_attempts times after which
+    KeyValueVersionConflict is raised.
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, not {max_attempts}")
+    store = key_value_store()
+    updates = {scope: token.dict() for scope, token in tokens.items()}
+    for attempt in range(max_attempts):
+        pool, version = store.get_versioned(_TOKEN_POOL_NAMESPACE, identity)
+        pool = pool or {}
+        pool.update(updates)
+        try:
+            store.put_versioned(_TOKEN_POOL_NAMESPACE, identity, pool, version)
+        except KeyValueVersionConflict as conflict:
+            log.info(
+                f"pool={identity} Conflicting write on attempt {attempt + 1} of "
+                f"{max_attempts}"
+            )
+            last_conflict = conflict
+            continue
+        return
+    raise last_conflict
+
+
+async def pooled_token_set(identity: str, token_set: TokenSet) -> TokenSet:
+    """Add the dependent tokens of token_set to identity's token pool, replacing any for
+    the same scopes, and return a token set referencing the pool in place of them. When
+    pooling is disabled by the token_pool_enabled setting, token_set is returned as is.
+    """
+    if not get_settings().token_pool_enabled:
+        return token_set
+    await asyncio.to_thread(_update_token_pool, identity, token_set.dependent_tokens)
+    for scope, token in token_set.dependent_tokens.items():
+        _get_refreshed_tokens().set(
+            (f"pool:{identity}", scope), token, ttl=_refreshed_token_ttl(token)
+        )
+    return TokenSet(
+        user_token=token_set.user_token, dependent_tokens={}, pool_identity=identity
+    )
+
+
+async def _refresh_token(token: Token, scope: str, log_prefix: str) -> Token:
+    log.info(
+        f"{log_prefix} Refreshing token ...{token.access_token[-7:]} for scope {scope}"
+    )
+    refresh_reply = await refresh_token_grant(token.refresh_token)
+    expires_in = refresh_reply.pop("expires_in")
+    expiration_time = time.time() + expires_in
+    refresh_reply["expiration_time"] = expiration_time
+    token = Token(**refresh_reply)
+    log.info(
+        f"{log_prefix} Updated access token ...{token.access_token[-7:]} for scope "
+        f"{scope}"
+    )
+    return token
+
+
+async def _refresh_and_store_token(trigger_id: str, scope: str, token: Token) -> Token:
+    token = await _refresh_token(token, scope, f"trigger_id={trigger_id}")
+
+    def _set_token(latest: InternalTrigger) -> None:
+        latest.token_set.dependent_tokens[scope] = token
+
+    # Store the new token right away, updating only the token on the latest version of
+    # the trigger, so the refresh isn't lost if the caller never writes the trigger
+    try:
+        await asyncio.to_thread(update_trigger_with_retry, trigger_id, _set_token)
+    except Exception as e:
+        log.warning(
+            f"trigger_id={trigger_id} Failed to store refreshed token for scope "
+            f"{scope}: {str(e)}"
+        )
+    return token
+
+
+async def refresh_pooled_token(
+    identity: str, scope: str, force: bool = True
+) -> Token | None:
+    """Refresh the token for scope in identity's pool, storing the result. Unless force
+    is True, a token in the pool which doesn't need refreshing (e.g. because another
+    instance refreshed it) is used instead. Returns None if there is no such token.
+    """
+
+    async def _load() -> Token | None:
+        stale_token = (await read_token_pool(identity)).get(scope)
+        if stale_token is None:
+            return None
+        if not force and not stale_token.requires_refresh(_REFRESH_MARGIN_SECONDS):
+            return stale_token
+        token = await _refresh_token(stale_token, scope, f"pool={identity}")
+        try:
+            await asyncio.to_thread(_update_token_pool, identity, {scope: token})
+        except Exception as e:
+            log.warning(
+                f"pool={identity} Failed to store refreshed token for scope "
+                f"{scope}: {str(e)}"
+            )
+        return token
+
+    return await _get_refreshed_tokens().get_or_load(
+        (f"pool:{identity}", scope), _load, ttl=_refreshed_token_ttl, refresh=force
+    )
+
+
+async def _current_token(trigger: InternalTrigger, scope: str) -> Token | None:
+    identity = trigger.token_set.pool_identity
+    if identity is not None:
+        key = (token_owner(trigger), scope)
+        token = _get_refreshed_tokens().get(key)
+        if token is None:
+            token = (await read_token_pool(identity)).get(scope)
+            if token is not None:
+                _get_refreshed_tokens().set(key, token, ttl=_refreshed_token_ttl(token))
+        if token is not None:
+            return token
+    # Triggers which aren't pooled, or whose pool lacks the scope, use their own tokens
+    return trigger.token_set.dependent_tokens.get(scope)
+
+
 async def get_refreshed_access_token_for_scope(
     trigger: InternalTrigger, scope: str
 ) -> str | None:
-    token = trigger.token_set.dependent_tokens.get(scope)
+    token = await _current_token(trigger, scope)
     if token is None:
         log.warn(f"No token for scope {scope}")
         return None
-    refresh = token.requires_refresh()
-    if refresh:
-        log.info(
-            f"trigger_id={trigger.trigger_id} Refreshing token "
-            f"...{token.access_token[:-7]} for scope {scope}"
-        )
-        refresh_reply = await refresh_token_grant(token.refresh_token)
-        expires_in = refresh_reply.pop("expires_in")
-        expiration_time = time.time() + expires_in
-        refresh_reply["expiration_time"] = expiration_time
-        token = Token(**refresh_reply)
-        log.info(
-            f"trigger_id={trigger.trigger_id} Updated access token "
-            f"...{token.access_token[:-7]} for scope {scope}"
-        )
-        trigger.token_set.dependent_tokens[scope] = token
+    if token.requires_refresh(_REFRESH_MARGIN_SECONDS):
+        token = await refresh_token_for_scope(trigger, scope, force=False)
+        if token is None:
+            return None
     return token.access_token
 
 
+async def refresh_token_for_scope(
+    trigger: InternalTrigger, scope: str, force: bool = True
+) -> Token | None:
+    """Refresh the trigger's dependent token for scope, storing the result, or None if
+    the trigger has no token for scope. Unless force is True, a token refreshed for this
+    trigger (or its pool) and scope since the trigger was read is used instead. Either
+    way, a refresh already in progress is waited for rather than starting another.
+    """
+    if trigger.token_set.pool_identity is not None:
+        token = await refresh_pooled_token(
+            trigger.token_set.pool_identity, scope, force=force
+        )
+        if token is not None:
+            return token
+    stale_token = trigger.token_set.dependent_tokens.get(scope)
+    if stale_token is None:
+        return None
+    token = await _get_refreshed_tokens().get_or_load(
+        (trigger.trigger_id, scope),
+        lambda: _refresh_and_store_token(trigger.trigger_id, scope, stale_token),
+        ttl=_refreshed_token_ttl,
+        refresh=force,
+    )
+    trigger.token_set.dependent_tokens[scope] = token
+    return token
+
+
 async def refresh_token_grant(refresh_token: str) -> dict[str, t.Any]:
     url = "/token"
     params = {"grant_type": "refresh_token", "refresh_token": refresh_token}
     refresh_resp = await _perform_auth_request(
-        url, "POST", body=params, path_type="oauth2", body_type="data"
+        url, "POST", body=params, path_type="oauth2", body_type="data", idempotent=True
     )
     return refresh_resp
 
 
+# The scopes of this client, mapping the set of ids of a scope's dependent scopes to
+# its scope string. It is shared with other instances via the key-value store and
+# reloaded when scope_cache_ttl_seconds have passed since it was last loaded.
 _my_scope_cache: dict[t.FrozenSet, str] | None = None
+_my_scope_cache_expires_at = 0.0
+
+_CLIENT_SCOPES_NAMESPACE = "client_scopes"
+_SCOPE_IDS_NAMESPACE = "scope_ids"
+
 
+def _client_scopes_key() -> str:
+    return get_settings().globus_auth_client_id
+
+
+def _decode_client_scopes(stored: t.Mapping[str, str]) -> dict[t.FrozenSet, str]:
+    return {
+        frozenset(ids.split(",")) if ids else frozenset(): scope
+        for ids, scope in stored.items()
+    }
 
-async def initialize_scope_cache():
-    global _my_scope_cache
-    if not _my_scope_cache:
-        _my_scope_cache = {}
+
+def _merge_client_scopes(
+    client_scopes: t.Mapping[t.FrozenSet, str], max_attempts: int = 5
+) -> dict[t.FrozenSet, str]:
+    """Add client_scopes to the scopes stored for this client, returning all of them.
+    The entry is written conditionally on its version so that scopes stored by other
+    instances in the meantime are kept: it is read and merged again on a conflict, up to
+    max_attempts times after which KeyValueVersionConflict is raised.
+    """
+    store = key_value_store()
+    key = _client_scopes_key()
+    updates = {",".join(sorted(ids)): scope for ids, scope in client_scopes.items()}
+    for attempt in range(max_attempts):
+        stored, version = store.get_versioned(_CLIENT_SCOPES_NAMESPACE, key)
+        stored = stored or {}
+        stored.update(updates)
+        try:
+            store.put_versioned(
+                _CLIENT_SCOPES_NAMESPACE,
+                key,
+                stored,
+                version,
+                get_settings().scope_cache_ttl_seconds,
+            )
+        except KeyValueVersionConflict as conflict:
+            log.info(
+                f"client_scopes={key} Conflicting write on attempt {attempt + 1} of "
+                f"{max_attempts}"
+            )
+            last_conflict = conflict
+            continue
+        return _decode_client_scopes(stored)
+    raise last_conflict
+
+
+async def _store_client_scopes(client_scopes: dict[t.FrozenSet, str]) -> None:
+    """Share client_scopes with other instances, adding to client_scopes those which
+    they have stored
+    """
+    try:
+        merged = await asyncio.to_thread(_merge_client_scopes, client_scopes)
+    except KeyValueVersionConflict:
+        # The scopes are still known here, and other instances look them up from Auth
+        # once the entry expires
+        log.warning("Unable to store the scopes of this client", exc_info=True)
+        return
+    client_scopes.update(merged)
+
+
+async def initialize_scope_cache() -> dict[t.FrozenSet, str]:
+    """Load the scopes of this client if they haven't been loaded within the ttl, and
+    return them
+    """
+    global _my_scope_cache, _my_scope_cache_expires_at
+    if _my_scope_cache is not None and time.time() < _my_scope_cache_expires_at:
+        return _my_scope_cache
+    stored = await asyncio.to_thread(
+        key_value_store().get, _CLIENT_SCOPES_NAMESPACE, _client_scopes_key()
+    )
+    if stored is not None:
+        client_scopes = _decode_client_scopes(stored)
+    else:
+        client_scopes = {}
         scopes = await my_scopes()
+        if scopes is None:
+            raise HTTPException(
+                status_code=500,
+                detail="Globus Auth did not return the scopes of this client",
+            )
         for scope in scopes:
             dependent_scopes = scope.get("dependent_scopes")
             dependent_ids = frozenset([sc.get("scope") for sc in dependent_scopes])
-            _my_scope_cache[dependent_ids] = scope.get("scope_string")
+            client_scopes[dependent_ids] = scope.get("scope_string")
+        await _store_client_scopes(client_scopes)
+    _my_scope_cache = client_scopes
+    _my_scope_cache_expires_at = time.time() + get_settings().scope_cache_ttl_seconds
+    return client_scopes
 
 
 async def my_scopes():
@@ -286,11 +677,11 @@ async def get_scope_for_dependent_set(
     scope_name: str | None = None,
     scope_suffix: str | None = None,
 ) -> str:
-    await initialize_scope_cache()
+    client_scopes = await initialize_scope_cache()
     scope_ids = await lookup_scope_ids(dependent_scope_strings)
 
     scope_id_set = frozenset(scope_ids.values())
-    scope_string = _my_scope_cache.get(scope_id_set)
+    scope_string = client_scopes.get(scope_id_set)
     if scope_string is not None:
         return scope_string
 
@@ -307,6 +698,8 @@ async def get_scope_for_dependent_set(
         f"{dependent_scope_strings}"
     )
     scope_string = await create_scope(scope_name, scope_suffix, scope_id_set)
+    client_scopes[scope_id_set] = scope_string
+    await _store_client_scopes(client_scopes)
 
     return scope_string
 
@@ -346,35 +739,90 @@ async def create_scope(
         )
 
 
-_scope_id_cache = cachetools.TTLCache(maxsize=100, ttl=12 * 60 * 60)
+# Scope ids by scope string. Scope strings unknown to Auth are cached as "" (for the
+# shorter negative ttl) so that they aren't looked up on every request.
+_scope_id_cache: AsyncCache[str, str] | None = None
+_UNKNOWN_SCOPE = ""
+
+
+def _get_scope_id_cache() -> AsyncCache[str, str]:
+    global _scope_id_cache
+    if _scope_id_cache is None:
+        settings = get_settings()
+        _scope_id_cache = AsyncCache(
+            maxsize=settings.scope_id_cache_size,
+            ttl=settings.scope_cache_ttl_seconds,
+        )
+        register_gauge("auth.scope_id_cache", _scope_id_cache.stats.as_dict)
+    return _scope_id_cache
 
 
-async def lookup_scope_ids(scope_strings: t.MutableSequence[str]) -> dict[str, str]:
-    """Do an Auth request to lookup a set of scope strings and return back a Dict mapping
-    the input scope strings to their ids.
+async def _fetch_scope_ids(scope_strings: list[str]) -> dict[str, str]:
+    """Lookup scope ids via Auth, storing the results, including the scope strings not
+    found, in the key-value store.
     """
+    settings = get_settings()
+    scope_strings_param = ",".join(scope_strings)
+    scopes_response = await _perform_auth_request(
+        f"/scopes?scope_strings={scope_strings_param}", "GET"
+    )
+    scope_ids: dict[str, str] = {}
+    for scope in scopes_response.get("scopes", []):
+        scope_ids[scope.get("scope_string")] = scope.get("id")
+
+    def _store() -> None:
+        store = key_value_store()
+        for scope_string in scope_strings:
+            scope_id = scope_ids.get(scope_string)
+            if scope_id is not None:
+                ttl = settings.scope_cache_ttl_seconds
+            else:
+                ttl = settings.scope_cache_negative_ttl_seconds
+            store.put(_SCOPE_IDS_NAMESPACE, scope_string, scope_id, ttl)
+
+    await asyncio.to_thread(_store)
+    return scope_ids
+
+
+# Combines the Auth lookups of concurrent requests
+_scope_id_loader: BatchLoader[str, str] = BatchLoader(_fetch_scope_ids, max_batch=50)
+
+
+async def lookup_scope_ids(scope_strings: t.Iterable[str]) -> dict[str, str]:
+    """Return a dict mapping the input scope strings to their ids, omitting scope
+    strings which aren't known to Auth. Ids are looked up in the in-process cache,
+    then in the shared key-value store and lastly via Auth.
+    """
+    settings = get_settings()
+    scope_id_cache = _get_scope_id_cache()
     return_dict: dict[str, str] = {}
-    unknown_scopes = []
-    # Check for presence of the desired scope string in the cache and that it has been
-    # updated within the last 12 hours. 12 hour policy is pretty much arbitrary.
+    unknown_scopes: list[str] = []
     for scope_string in scope_strings:
-        scope_id = _scope_id_cache.get(scope_string)
-        if scope_id is not None:
-            return_dict[scope_string] = scope_id
-        else:
+        scope_id = scope_id_cache.get(scope_string)
+        if scope_id is None:
             unknown_scopes.append(scope_string)
-    # We got everything from cache, so we can just return
+        elif scope_id != _UNKNOWN_SCOPE:
+            return_dict[scope_string] = scope_id
     if len(unknown_scopes) == 0:
         return return_dict
 
-    unknown_scopes_list = ",".join(unknown_scopes)
-    scopes_response = await _perform_auth_request(
-        f"/scopes?scope_strings={unknown_scopes_list}", "GET"
+    stored = await asyncio.to_thread(
+        key_value_store().get_many, _SCOPE_IDS_NAMESPACE, unknown_scopes
     )
-    auth_scopes = scopes_response.get("scopes", [])
-    for scope in auth_scopes:
-        scope_string = scope.get("scope_string")
-        scope_id = scope.get("id")
-        return_dict[scope_string] = scope_id
-        _scope_id_cache[scope_string] = scope_id
+    not_stored = [s for s in unknown_scopes if s not in stored]
+    loaded = await _scope_id_loader.load(not_stored) if not_stored else {}
+
+    for scope_string in unknown_scopes:
+        scope_id = stored.get(scope_string, loaded.get(scope_string))
+        if scope_id is None:
+            scope_id_cache.set(
+                scope_string,
+                _UNKNOWN_SCOPE,
+                ttl=settings.scope_cache_negative_ttl_seconds,
+            )
+        else:
+            scope_id_cache.set(
+                scope_string, scope_id, ttl=settings.scope_cache_ttl_seconds
+            )
+            return_dict[scope_string] = scope_id
     return return_dict
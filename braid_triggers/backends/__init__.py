@@ -0,0 +1,21 @@
+"""
+Implementations of trigger storage, and of a key-value store for other shared state.
+The backend in use is chosen by the persistence_backend setting and accessed via
+braid_triggers.persistence.
+"""
+
+from .base import (
+    KeyValueStore,
+    KeyValueVersionConflict,
+    QueryElement,
+    TriggerBackend,
+    TriggerVersionConflict,
+)
+
+__all__ = (
+    "KeyValueStore",
+    "KeyValueVersionConflict",
+    "QueryElement",
+    "TriggerBackend",
+    "TriggerVersionConflict",
+)
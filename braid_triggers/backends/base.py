@@ -0,0 +1,229 @@
+import abc
+import base64
+import json
+import time
+import typing as t
+import uuid
+from enum import Enum
+
+from braid_triggers.models import InternalTrigger
+
+
+class TriggerVersionConflict(Exception):
+    """A conditional write of a trigger failed because the stored trigger is not the
+    version the write was based on (or, when creating, a trigger already exists).
+    """
+
+    def __init__(self, trigger_id: str, version: int):
+        self.trigger_id = trigger_id
+        self.version = version
+        super().__init__(
+            f"Trigger {trigger_id} has been modified since version {version}"
+        )
+
+
+class KeyValueVersionConflict(Exception):
+    """A conditional write to a key-value store failed because the entry is not at the
+    version the write was based on
+    """
+
+    def __init__(self, namespace: str, key: str, version: int):
+        self.namespace = namespace
+        self.key = key
+        self.version = version
+        super().__init__(
+            f"Entry {key} in {namespace} has been modified since version {version}"
+        )
+
+
+# A query is a list of these, each mapping property names to either a value or a
+# list/tuple/set of values. A trigger matches when all the properties of any one of the
+# elements match.
+QueryElement = t.Mapping[str, t.Any]
+
+
+def query_value(val: t.Any) -> t.Any:
+    """Normalize a value for comparison against the query values. Values are stored as
+    their str form (e.g. for enums and uuids).
+    """
+    if isinstance(val, Enum):
+        return val.value
+    if isinstance(val, uuid.UUID):
+        return str(val)
+    return val
+
+
+def matches_query_element(
+    values: t.Mapping[str, t.Any], query_element: QueryElement
+) -> bool:
+    for k, v in query_element.items():
+        val = query_value(values.get(k))
+        if isinstance(v, (tuple, list, set)):
+            if val not in {query_value(qv) for qv in v}:
+                return False
+        elif val != query_value(v):
+            return False
+    return True
+
+
+def version_matches(stored_version: int | None, expected_version: int) -> bool:
+    """Whether a write based on expected_version may replace a trigger stored with
+    stored_version. Triggers written before versioning have no (None) version.
+    """
+    if stored_version is None:
+        return expected_version == 0
+    return stored_version == expected_version
+
+
+def encode_marker(key: t.Mapping[str, t.Any]) -> str:
+    """Create an opaque, URL safe, pagination marker from the key of the last item"""
+    key_json = json.dumps(key, sort_keys=True)
+    return base64.urlsafe_b64encode(key_json.encode("utf-8")).decode("ascii")
+
+
+def decode_marker(marker: str) -> dict[str, t.Any]:
+    """Reverse encode_marker. Raises ValueError if the marker is not one we created."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(marker.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid pagination marker {marker}: {str(e)}") from e
+    if not isinstance(key, dict):
+        raise ValueError(f"Invalid pagination marker {marker}")
+    return key
+
+
+def project_fields(
+    values: t.Mapping[str, t.Any], fields: t.Iterable[str] | None
+) -> dict[str, t.Any]:
+    """Limit values to those in fields (plus trigger_id), or all values if fields is
+    None
+    """
+    if fields is None:
+        return dict(values)
+    return {f: values[f] for f in ("trigger_id", *fields) if f in values}
+
+
+class TriggerBackend(abc.ABC):
+    """The storage operations for triggers. Every implementation must provide the same
+    semantics, in particular for the versioned, conditional writes made by put().
+    """
+
+    def init(self, create: bool = False) -> None:
+        """Prepare the backend for use, creating its storage when create is True"""
+
+    @abc.abstractmethod
+    def get(self, trigger_id: str) -> InternalTrigger | None:
+        """Return the stored trigger or None if there is no trigger with the id"""
+
+    @abc.abstractmethod
+    def create(self, trigger: InternalTrigger) -> None:
+        """Store a new trigger, raising TriggerVersionConflict if the id is in use"""
+
+    @abc.abstractmethod
+    def put(self, trigger: InternalTrigger, expected_version: int) -> None:
+        """Replace a stored trigger. Raises TriggerVersionConflict if the trigger does
+        not exist or is not stored with expected_version.
+        """
+
+    def get_many(self, trigger_ids: t.Iterable[str]) -> dict[str, InternalTrigger]:
+        """Return the stored triggers with the ids, by id, omitting those which don't
+        exist. Backends which can read many items at once override this.
+        """
+        triggers: dict[str, InternalTrigger] = {}
+        for trigger_id in dict.fromkeys(trigger_ids):
+            trigger = self.get(trigger_id)
+            if trigger is not None:
+                triggers[trigger_id] = trigger
+        return triggers
+
+    @abc.abstractmethod
+    def delete(self, trigger_id: str) -> InternalTrigger | None:
+        """Remove a trigger, returning what was stored or None if it didn't exist"""
+
+    def delete_many(self, trigger_ids: t.Iterable[str]) -> None:
+        """Remove the triggers with the ids, ignoring those which don't exist"""
+        for trigger_id in trigger_ids:
+            self.delete(trigger_id)
+
+    @abc.abstractmethod
+    def query(self, query_elements: t.Sequence[QueryElement]) -> list[InternalTrigger]:
+        """Return every trigger matching any of the query_elements, each at most once.
+        An empty query matches every trigger.
+        """
+
+    @abc.abstractmethod
+    def list_page(
+        self,
+        created_by: str,
+        *,
+        state: str | None = None,
+        limit: int = 100,
+        marker: str | None = None,
+        fields: t.Iterable[str] | None = None,
+    ) -> tuple[list[dict[str, t.Any]], str | None]:
+        """Return up to limit triggers created by created_by (and in state, if
+        provided) along with an opaque marker for retrieving the next page, or None if
+        there are no more. When fields is provided, only those fields and trigger_id
+        are present in the results.
+        """
+
+
+class KeyValueStore(abc.ABC):
+    """Storage for small JSON-compatible values shared by all instances of the service,
+    such as cached lookups. Keys are grouped into namespaces. An entry may be given a
+    ttl after which it is no longer returned. None is a valid value, e.g. to remember
+    that a lookup found nothing.
+    """
+
+    def init(self, create: bool = False) -> None:
+        """Prepare the store for use, creating its storage when create is True"""
+
+    @abc.abstractmethod
+    def get_many(self, namespace: str, keys: t.Iterable[str]) -> dict[str, t.Any]:
+        """Return the values of those keys which have an unexpired entry"""
+
+    def get(self, namespace: str, key: str, default: t.Any = None) -> t.Any:
+        return self.get_many(namespace, [key]).get(key, default)
+
+    @abc.abstractmethod
+    def items(self, namespace: str) -> dict[str, t.Any]:
+        """Return all unexpired entries of namespace"""
+
+    @abc.abstractmethod
+    def put(
+        self, namespace: str, key: str, value: t.Any, ttl: float | None = None
+    ) -> None:
+        """Store value for key, replacing any existing entry"""
+
+    @abc.abstractmethod
+    def get_versioned(self, namespace: str, key: str) -> tuple[t.Any, int]:
+        """Return the value of key, or None if it has no unexpired entry, along with
+        the entry's version for put_versioned(). The version of a missing or expired
+        entry, or one written by put(), is 0.
+        """
+
+    @abc.abstractmethod
+    def put_versioned(
+        self,
+        namespace: str,
+        key: str,
+        value: t.Any,
+        expected_version: int,
+        ttl: float | None = None,
+    ) -> int:
+        """Store value for key, provided the entry is still at expected_version, and
+        return its new version. Raises KeyValueVersionConflict if the entry has been
+        written since. Entries written this way should not also be written by put().
+        """
+
+    @abc.abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        pass
+
+
+def expiration_time(ttl: float | None) -> float | None:
+    return time.time() + ttl if ttl is not None else None
+
+
+def is_expired(expires_at: float | None) -> bool:
+    return expires_at is not None and expires_at <= time.time()
@@ -0,0 +1,650 @@
+import json
+import logging
+import random
+import time
+import typing as t
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError, EndpointConnectionError
+from mypy_boto3_dynamodb import DynamoDBServiceResource
+from mypy_boto3_dynamodb.service_resource import Table as DynamoTable
+from pydantic import BaseModel
+
+from braid_triggers.aws_ops import boto3_resource
+from braid_triggers.codecs import from_dynamo_dict, model_codec, to_dynamo_dict
+from braid_triggers.models import InternalTrigger
+
+from . import base
+from .base import (
+    KeyValueStore,
+    KeyValueVersionConflict,
+    TriggerBackend,
+    TriggerVersionConflict,
+    expiration_time,
+    is_expired,
+)
+
+log = logging.getLogger(__name__)
+
+_TRIGGER_KEY_SCHEMA = ({"AttributeName": "trigger_id", "KeyType": "HASH"},)
+_TRIGGER_ATTRIBUTE_DEFINITIONS = (
+    {"AttributeName": "trigger_id", "AttributeType": "S"},
+    {"AttributeName": "created_by", "AttributeType": "S"},
+    {"AttributeName": "state", "AttributeType": "S"},
+)
+
+_CREATED_BY_INDEX = "created_by-index"
+_STATE_INDEX = "state-index"
+
+# Map from the attribute name to the name of the Global Secondary Index which has that
+# attribute as its hash key. Queries on these attributes use the index rather than a
+# scan of the whole table.
+TRIGGER_INDEXES: dict[str, str] = {
+    "created_by": _CREATED_BY_INDEX,
+    "state": _STATE_INDEX,
+}
+
+
+def _global_secondary_index(attribute_name: str, index_name: str) -> dict[str, t.Any]:
+    return {
+        "IndexName": index_name,
+        "KeySchema": [{"AttributeName": attribute_name, "KeyType": "HASH"}],
+        "Projection": {"ProjectionType": "ALL"},
+    }
+
+
+_TRIGGER_GLOBAL_SECONDARY_INDEXES = tuple(
+    _global_secondary_index(attr_name, index_name)
+    for attr_name, index_name in TRIGGER_INDEXES.items()
+)
+
+
+def create_table(
+    table_name: str,
+    key_schema: t.Iterable[t.Mapping[str, str]],
+    attribute_definitions: t.Iterable[t.Mapping[str, str]],
+    billing_mode="PAY_PER_REQUEST",
+    global_secondary_indexes: t.Iterable[t.Mapping[str, t.Any]] = (),
+    **kwargs,
+) -> DynamoTable:
+    global_secondary_indexes = list(global_secondary_indexes)
+    if global_secondary_indexes:
+        kwargs["GlobalSecondaryIndexes"] = global_secondary_indexes
+    try:
+        client = boto3_resource("dynamodb", DynamoDBServiceResource)
+        client.create_table(
+            TableName=table_name,
+            AttributeDefinitions=attribute_definitions,
+            KeySchema=key_schema,
+            BillingMode=billing_mode,
+            **kwargs,
+        )
+    except ClientError as ce:
+        error_code = ce.response.get("Error", {}).get("Code")
+        if error_code == "ResourceInUseException":
+            log.info(f"Table {table_name} already exists")
+            ensure_indexes(table_name, attribute_definitions, global_secondary_indexes)
+        else:
+            log.info(
+                f"Error creating dynamo table {table_name}, may be because "
+                f"it exists already: {str(ce)}"
+            )
+
+    except EndpointConnectionError as err:
+        log.info(f"Error creating dynamo table {table_name}: {err}")
+
+    table: DynamoTable = client.Table(table_name)
+    return table
+
+
+def ensure_indexes(
+    table_name: str,
+    attribute_definitions: t.Iterable[t.Mapping[str, str]],
+    global_secondary_indexes: t.Iterable[t.Mapping[str, t.Any]],
+) -> None:
+    """Add any of the global_secondary_indexes which are not yet present on an existing
+    table. Dynamo only permits creating a single index per update, so each missing
+    index is requested separately. Failures are logged so that a later start can retry.
+    """
+    table = get_table(table_name)
+    try:
+        existing = {
+            gsi.get("IndexName") for gsi in (table.global_secondary_indexes or [])
+        }
+    except ClientError as ce:
+        log.info(f"Unable to describe indexes on table {table_name}: {str(ce)}")
+        return
+    for gsi in global_secondary_indexes:
+        index_name = gsi.get("IndexName")
+        if index_name in existing:
+            continue
+        try:
+            table.update(
+                AttributeDefinitions=list(attribute_definitions),
+                GlobalSecondaryIndexUpdates=[{"Create": gsi}],
+            )
+            log.info(f"Creating index {index_name} on table {table_name}")
+        except ClientError as ce:
+            log.warning(
+                f"Unable to create index {index_name} on table {table_name}: {str(ce)}"
+            )
+
+
+def get_table(
+    table_name: str,
+) -> DynamoTable:
+    client = boto3_resource("dynamodb", DynamoDBServiceResource)
+
+    table: DynamoTable = client.Table(table_name)
+    return table
+
+
+T = t.TypeVar("T", bound=BaseModel)
+
+
+def _pydantic_model_to_dynamo_dict(model: BaseModel) -> dict[str, t.Any]:
+    return model_codec(type(model)).to_item(model)
+
+
+def lookup_by_key(inst_class: t.Type[T], table: DynamoTable, **kwargs) -> T | None:
+    k, v = next(iter(kwargs.items()))
+    response = table.query(KeyConditionExpression=Key(k).eq(v))
+    items = response.get("Items")
+
+    instance: T | None = None
+    if len(items) > 0:
+        try:
+            instance = model_codec(inst_class).from_item(items[0])
+            return instance
+        except Exception as e:
+            log.error(f"Cannot create Trigger from {items[0]} got {str(e)}")
+    return instance
+
+
+def _paginate_items(
+    operation: t.Callable[..., t.Mapping[str, t.Any]], **kwargs
+) -> t.Iterator[dict[str, t.Any]]:
+    """Call a dynamo query or scan operation repeatedly, following the LastEvaluatedKey
+    of each response, yielding every item. Dynamo limits each response to 1MB, so a
+    single call may silently return only part of the matching items.
+    """
+    while True:
+        response = operation(**kwargs)
+        yield from response.get("Items", [])
+        last_key = response.get("LastEvaluatedKey")
+        if last_key is None:
+            return
+        kwargs["ExclusiveStartKey"] = last_key
+
+
+QueryElement = t.Union[BaseModel, dict]
+
+
+def _attr_condition(name: str, val: t.Any):
+    if isinstance(val, (tuple, list, set)):
+        return Attr(name).is_in([base.query_value(v) for v in val])
+    return Attr(name).eq(base.query_value(val))
+
+
+def _and_conditions(conditions: t.Iterable[t.Any]):
+    expression = None
+    for condition in conditions:
+        if expression is None:
+            expression = condition
+        else:
+            expression = expression & condition
+    return expression
+
+
+def _items_for_query_element(
+    table: DynamoTable,
+    query_val: dict[str, t.Any],
+    indexes: t.Mapping[str, str],
+) -> t.Iterator[dict[str, t.Any]]:
+    """Yield all items matching every property of query_val. When one of the properties
+    has an index, a query on that index is performed for each of its values with the
+    remaining properties as a filter. Otherwise, we must fall back to a scan.
+    """
+    index_attr = next((k for k in indexes if k in query_val), None)
+    if index_attr is not None:
+        index_vals = query_val[index_attr]
+        if not isinstance(index_vals, (tuple, list, set)):
+            index_vals = [index_vals]
+        filter_expression = _and_conditions(
+            _attr_condition(k, v) for k, v in query_val.items() if k != index_attr
+        )
+        query_kwargs: dict[str, t.Any] = {"IndexName": indexes[index_attr]}
+        if filter_expression is not None:
+            query_kwargs["FilterExpression"] = filter_expression
+        try:
+            # dict.fromkeys removes duplicate values while preserving order
+            for index_val in dict.fromkeys(index_vals):
+                yield from _paginate_items(
+                    table.query,
+                    KeyConditionExpression=Key(index_attr).eq(
+                        base.query_value(index_val)
+                    ),
+                    **query_kwargs,
+                )
+            return
+        except ClientError as ce:
+            error_code = ce.response.get("Error", {}).get("Code")
+            if error_code != "ValidationException":
+                raise
+            # Most likely the index doesn't exist (yet), so a scan is all we can do
+            log.warning(
+                f"Query on index {indexes[index_attr]} failed due to {str(ce)}, "
+                "falling back to scan"
+            )
+
+    filter_expression = _and_conditions(
+        _attr_condition(k, v) for k, v in query_val.items()
+    )
+    scan_kwargs = {}
+    if filter_expression is not None:
+        scan_kwargs["FilterExpression"] = filter_expression
+    yield from _paginate_items(table.scan, **scan_kwargs)
+
+
+def query_for_class(
+    inst_class: t.Type[T],
+    table: DynamoTable,
+    *,
+    query_vals: QueryElement | t.Iterable[QueryElement] | None = None,
+    indexes: t.Mapping[str, str] | None = None,
+    key_names: t.Sequence[str] = (),
+    **kwargs,
+) -> list[T]:
+    """Perform a query of a dynamo table returning instances of the provided class. That
+    class must take as constructor params the properties of the items returned from the
+    query.
+
+    The values to be queried can be provided in a variety of ways: in query_vals, there
+    can be a single instance of a dict or a pydantic BaseModel instance. If a list of
+    these is provided, the query will return values matching any of these.
+
+    kwargs may also be provided for the query. If they are, they are treated as another
+    element of the query_vals list and so will form another condition that may be
+    matched.
+
+    The only forms of matching provided are exact match against the values or a
+    list/set/tuple of values. If a set of values is given, then the match for the
+    property is the value being in the set.
+
+    indexes maps attribute names to the names of Global Secondary Indexes with that
+    attribute as their hash key. When a query element contains one of these attributes,
+    the index is queried rather than scanning the entire table. All result pages are
+    read. When key_names is provided, the values of those properties are used to remove
+    items which matched more than one of the query elements.
+    """
+    if indexes is None:
+        indexes = {}
+    if query_vals is None:
+        query_vals = []
+    elif isinstance(query_vals, (dict, BaseModel)):
+        query_vals = [query_vals]
+    else:
+        query_vals = list(query_vals)
+    if len(kwargs) > 0:
+        query_vals.append(kwargs)
+    if len(query_vals) == 0:
+        # No conditions at all means everything matches
+        query_vals = [{}]
+
+    codec = model_codec(inst_class)
+    instances: list[T] = []
+    seen_keys: set[tuple] = set()
+    for query_val in query_vals:
+        if not isinstance(query_val, dict):
+            try:
+                query_val = query_val.dict()
+            except Exception as e:
+                log.error(
+                    f"Failed converting {query_val} via dict() due to {str(e)}, skipping..."
+                )
+                continue
+        for item in _items_for_query_element(table, query_val, indexes):
+            if key_names:
+                item_key = tuple(item.get(k) for k in key_names)
+                if item_key in seen_keys:
+                    continue
+                seen_keys.add(item_key)
+            instances.append(codec.from_item(item))
+    return instances
+
+
+def encode_marker(last_evaluated_key: t.Mapping[str, t.Any]) -> str:
+    return base.encode_marker(from_dynamo_dict(dict(last_evaluated_key)))
+
+
+def decode_marker(marker: str) -> dict[str, t.Any]:
+    return to_dynamo_dict(base.decode_marker(marker))
+
+
+def _projection_params(fields: t.Iterable[str]) -> dict[str, t.Any]:
+    # Field names like "state" are dynamo reserved words, so every name is referenced
+    # via a placeholder. boto3 uses #n<num> for its own placeholders so we avoid those.
+    names = {f"#p{i}": field for i, field in enumerate(fields)}
+    return {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
+
+
+_BATCH_GET_MAX_KEYS = 100
+# Keys BatchGetItem leaves unprocessed (most often when it is throttled) are requested
+# again after a jittered delay which doubles on each attempt, giving up after the last
+# attempt rather than reporting the items as missing.
+_BATCH_GET_MAX_ATTEMPTS = 8
+_BATCH_GET_BASE_DELAY_SECONDS = 0.05
+
+
+def batch_get_items(
+    table_name: str, keys: t.Sequence[t.Mapping[str, t.Any]]
+) -> t.Iterator[dict[str, t.Any]]:
+    """Read the items with keys using BatchGetItem, in batches of the most keys it
+    allows, retrying any keys it leaves unprocessed. Items are yielded in no particular
+    order, and missing items are skipped. Raises RuntimeError if keys are still
+    unprocessed after the last attempt.
+    """
+    client = boto3_resource("dynamodb", DynamoDBServiceResource)
+    for start in range(0, len(keys), _BATCH_GET_MAX_KEYS):
+        request_items: t.Mapping[str, t.Any] | None = {
+            table_name: {"Keys": list(keys[start:][:_BATCH_GET_MAX_KEYS])}
+        }
+        for attempt in range(_BATCH_GET_MAX_ATTEMPTS):
+            if attempt > 0:
+                delay = _BATCH_GET_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+                time.sleep(random.uniform(0, delay))
+            response = client.batch_get_item(RequestItems=request_items)
+            yield from response.get("Responses", {}).get(table_name, [])
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+        else:
+            raise RuntimeError(
+                f"Keys of table {table_name} still unprocessed after "
+                f"{_BATCH_GET_MAX_ATTEMPTS} attempts: {request_items}"
+            )
+
+
+class DynamoTriggerBackend(TriggerBackend):
+    """Stores triggers in a DynamoDB table with indexes on created_by and state"""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def init(self, create: bool = False) -> None:
+        if create:
+            create_table(
+                table_name=self.table_name,
+                key_schema=_TRIGGER_KEY_SCHEMA,
+                attribute_definitions=_TRIGGER_ATTRIBUTE_DEFINITIONS,
+                global_secondary_indexes=_TRIGGER_GLOBAL_SECONDARY_INDEXES,
+            )
+
+    @property
+    def table(self) -> DynamoTable:
+        return get_table(self.table_name)
+
+    def get(self, trigger_id: str) -> InternalTrigger | None:
+        # Strongly consistent, so that a read following a conflicting write sees it
+        response = self.table.get_item(
+            Key={"trigger_id": trigger_id}, ConsistentRead=True
+        )
+        item = response.get("Item")
+        if item is None:
+            return None
+        try:
+            return model_codec(InternalTrigger).from_item(item)
+        except Exception as e:
+            log.error(f"Cannot create Trigger from {item} got {str(e)}")
+            return None
+
+    def get_many(self, trigger_ids: t.Iterable[str]) -> dict[str, InternalTrigger]:
+        codec = model_codec(InternalTrigger)
+        keys = [{"trigger_id": trigger_id} for trigger_id in dict.fromkeys(trigger_ids)]
+        triggers = (
+            codec.from_item(item) for item in batch_get_items(self.table_name, keys)
+        )
+        return {trigger.trigger_id: trigger for trigger in triggers}
+
+    def _conditional_put(
+        self, trigger: InternalTrigger, condition, expected_version: int
+    ) -> None:
+        try:
+            self.table.put_item(
+                Item=_pydantic_model_to_dynamo_dict(trigger),
+                ConditionExpression=condition,
+            )
+        except ClientError as ce:
+            error_code = ce.response.get("Error", {}).get("Code")
+            if error_code == "ConditionalCheckFailedException":
+                raise TriggerVersionConflict(
+                    trigger.trigger_id, expected_version
+                ) from ce
+            raise
+
+    def create(self, trigger: InternalTrigger) -> None:
+        self._conditional_put(trigger, Attr("trigger_id").not_exists(), 0)
+
+    def put(self, trigger: InternalTrigger, expected_version: int) -> None:
+        if expected_version == 0:
+            # Triggers stored before versioning have no version attribute
+            condition = Attr("trigger_id").exists() & (
+                Attr("version").not_exists() | Attr("version").eq(0)
+            )
+        else:
+            condition = Attr("version").eq(expected_version)
+        self._conditional_put(trigger, condition, expected_version)
+
+    def delete(self, trigger_id: str) -> InternalTrigger | None:
+        del_resp = self.table.delete_item(
+            Key={
+                "trigger_id": trigger_id,
+            },
+            ReturnValues="ALL_OLD",
+        )
+        item = del_resp.get("Attributes")
+        if item is None:
+            return None
+        return model_codec(InternalTrigger).from_item(item)
+
+    def delete_many(self, trigger_ids: t.Iterable[str]) -> None:
+        # The batch writer sends BatchWriteItem requests of up to 25 deletes, resending
+        # any unprocessed items
+        with self.table.batch_writer() as batch:
+            for trigger_id in dict.fromkeys(trigger_ids):
+                batch.delete_item(Key={"trigger_id": trigger_id})
+
+    def query(self, query_elements: t.Sequence[t.Mapping[str, t.Any]]):
+        return query_for_class(
+            InternalTrigger,
+            self.table,
+            query_vals=[dict(q) for q in query_elements],
+            indexes=TRIGGER_INDEXES,
+            key_names=("trigger_id",),
+        )
+
+    def list_page(
+        self,
+        created_by: str,
+        *,
+        state: str | None = None,
+        limit: int = 100,
+        marker: str | None = None,
+        fields: t.Iterable[str] | None = None,
+    ) -> tuple[list[dict[str, t.Any]], str | None]:
+        # The marker is an encoding of the LastEvaluatedKey from the created_by index
+        table = self.table
+        query_kwargs: dict[str, t.Any] = {
+            "IndexName": TRIGGER_INDEXES["created_by"],
+            "KeyConditionExpression": Key("created_by").eq(created_by),
+        }
+        if state is not None:
+            query_kwargs["FilterExpression"] = Attr("state").eq(str(state))
+        if fields is not None:
+            query_kwargs.update(
+                _projection_params(dict.fromkeys(["trigger_id", *fields]))
+            )
+        if marker is not None:
+            start_key = decode_marker(marker)
+            if start_key.get("created_by") != created_by:
+                raise ValueError(f"Invalid pagination marker {marker}")
+            query_kwargs["ExclusiveStartKey"] = start_key
+
+        codec = model_codec(InternalTrigger)
+        items: list[dict[str, t.Any]] = []
+        last_key: t.Mapping[str, t.Any] | None = None
+        while len(items) < limit:
+            # Limiting the evaluation to the number of items still needed means that when
+            # we fill the page, the last evaluated item is also the last returned item, so
+            # the marker is correct even when a filter removes some items.
+            response = table.query(Limit=limit - len(items), **query_kwargs)
+            items.extend(codec.decode_values(i) for i in response.get("Items", []))
+            last_key = response.get("LastEvaluatedKey")
+            if last_key is None:
+                break
+            query_kwargs["ExclusiveStartKey"] = last_key
+
+        next_marker = encode_marker(last_key) if last_key is not None else None
+        return items, next_marker
+
+
+_KV_KEY_SCHEMA = (
+    {"AttributeName": "namespace", "KeyType": "HASH"},
+    {"AttributeName": "key", "KeyType": "RANGE"},
+)
+_KV_ATTRIBUTE_DEFINITIONS = (
+    {"AttributeName": "namespace", "AttributeType": "S"},
+    {"AttributeName": "key", "AttributeType": "S"},
+)
+_KV_EXPIRES_AT = "expires_at"
+_KV_VERSION = "version"
+
+
+class DynamoKeyValueStore(KeyValueStore):
+    """Keeps entries in a DynamoDB table keyed on (namespace, key). The table's TTL
+    setting removes expired entries, but only eventually, so reads also check the
+    expiration time.
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def init(self, create: bool = False) -> None:
+        if not create:
+            return
+        create_table(
+            table_name=self.table_name,
+            key_schema=_KV_KEY_SCHEMA,
+            attribute_definitions=_KV_ATTRIBUTE_DEFINITIONS,
+        )
+        try:
+            client = boto3_resource("dynamodb", DynamoDBServiceResource).meta.client
+            client.update_time_to_live(
+                TableName=self.table_name,
+                TimeToLiveSpecification={
+                    "Enabled": True,
+                    "AttributeName": _KV_EXPIRES_AT,
+                },
+            )
+        except ClientError as ce:
+            # Raised when TTL is already enabled
+            log.info(f"Unable to enable TTL on table {self.table_name}: {str(ce)}")
+
+    @property
+    def table(self) -> DynamoTable:
+        return get_table(self.table_name)
+
+    def get_many(self, namespace: str, keys: t.Iterable[str]) -> dict[str, t.Any]:
+        values: dict[str, t.Any] = {}
+        for item in batch_get_items(
+            self.table_name,
+            [{"namespace": namespace, "key": key} for key in dict.fromkeys(keys)],
+        ):
+            expires_at = item.get(_KV_EXPIRES_AT)
+            if expires_at is not None and is_expired(float(expires_at)):
+                continue
+            values[item["key"]] = json.loads(item["value"])
+        return values
+
+    def items(self, namespace: str) -> dict[str, t.Any]:
+        values: dict[str, t.Any] = {}
+        for item in _paginate_items(
+            self.table.query, KeyConditionExpression=Key("namespace").eq(namespace)
+        ):
+            expires_at = item.get(_KV_EXPIRES_AT)
+            if expires_at is not None and is_expired(float(expires_at)):
+                continue
+            values[item["key"]] = json.loads(item["value"])
+        return values
+
+    @staticmethod
+    def _item(
+        namespace: str, key: str, value: t.Any, ttl: float | None
+    ) -> dict[str, t.Any]:
+        item: dict[str, t.Any] = {
+            "namespace": namespace,
+            "key": key,
+            "value": json.dumps(value),
+        }
+        expires_at = expiration_time(ttl)
+        if expires_at is not None:
+            # TTL requires a number of seconds since the epoch
+            item[_KV_EXPIRES_AT] = Decimal(int(expires_at) + 1)
+        return item
+
+    def put(
+        self, namespace: str, key: str, value: t.Any, ttl: float | None = None
+    ) -> None:
+        self.table.put_item(Item=self._item(namespace, key, value, ttl))
+
+    def get_versioned(self, namespace: str, key: str) -> tuple[t.Any, int]:
+        # A strongly consistent read, so the version is the latest
+        item = self.table.get_item(
+            Key={"namespace": namespace, "key": key}, ConsistentRead=True
+        ).get("Item")
+        if item is None:
+            return None, 0
+        expires_at = item.get(_KV_EXPIRES_AT)
+        if expires_at is not None and is_expired(float(expires_at)):
+            return None, 0
+        return json.loads(item["value"]), int(item.get(_KV_VERSION, 0))
+
+    def put_versioned(
+        self,
+        namespace: str,
+        key: str,
+        value: t.Any,
+        expected_version: int,
+        ttl: float | None = None,
+    ) -> int:
+        version = expected_version + 1
+        item = self._item(namespace, key, value, ttl)
+        item[_KV_VERSION] = version
+        # Expiration times are stored as whole seconds
+        now = Decimal(int(time.time()))
+        if expected_version == 0:
+            # A missing or expired entry, or one written by put(), is at version 0
+            condition = (
+                Attr(_KV_VERSION).not_exists()
+                | Attr(_KV_VERSION).eq(0)
+                | Attr(_KV_EXPIRES_AT).lte(now)
+            )
+        else:
+            condition = Attr(_KV_VERSION).eq(expected_version) & (
+                Attr(_KV_EXPIRES_AT).not_exists() | Attr(_KV_EXPIRES_AT).gt(now)
+            )
+        try:
+            self.table.put_item(Item=item, ConditionExpression=condition)
+        except ClientError as ce:
+            error_code = ce.response.get("Error", {}).get("Code")
+            if error_code == "ConditionalCheckFailedException":
+                raise KeyValueVersionConflict(namespace, key, expected_version) from ce
+            raise
+        return version
+
+    def delete(self, namespace: str, key: str) -> None:
+        self.table.delete_item(Key={"namespace": namespace, "key": key})
@@ -0,0 +1,174 @@
+import copy
+import threading
+import typing as t
+
+from braid_triggers.models import InternalTrigger
+
+from .base import (
+    KeyValueStore,
+    KeyValueVersionConflict,
+    QueryElement,
+    TriggerBackend,
+    TriggerVersionConflict,
+    decode_marker,
+    encode_marker,
+    expiration_time,
+    is_expired,
+    matches_query_element,
+    project_fields,
+    query_value,
+    version_matches,
+)
+
+
+class MemoryTriggerBackend(TriggerBackend):
+    """Keeps triggers in a dict in this process. Intended for tests and local
+    development; nothing is shared between processes or kept across restarts.
+    """
+
+    def __init__(self):
+        self._triggers: dict[str, InternalTrigger] = {}
+        # Operations may run in worker threads (via asyncio.to_thread)
+        self._lock = threading.Lock()
+
+    def get(self, trigger_id: str) -> InternalTrigger | None:
+        with self._lock:
+            trigger = self._triggers.get(trigger_id)
+            return trigger.copy(deep=True) if trigger is not None else None
+
+    def create(self, trigger: InternalTrigger) -> None:
+        with self._lock:
+            if trigger.trigger_id in self._triggers:
+                raise TriggerVersionConflict(trigger.trigger_id, 0)
+            self._triggers[trigger.trigger_id] = trigger.copy(deep=True)
+
+    def put(self, trigger: InternalTrigger, expected_version: int) -> None:
+        with self._lock:
+            stored = self._triggers.get(trigger.trigger_id)
+            if stored is None or not version_matches(stored.version, expected_version):
+                raise TriggerVersionConflict(trigger.trigger_id, expected_version)
+            self._triggers[trigger.trigger_id] = trigger.copy(deep=True)
+
+    def delete(self, trigger_id: str) -> InternalTrigger | None:
+        with self._lock:
+            return self._triggers.pop(trigger_id, None)
+
+    def query(self, query_elements: t.Sequence[QueryElement]) -> list[InternalTrigger]:
+        with self._lock:
+            triggers = list(self._triggers.values())
+        if query_elements:
+            triggers = [
+                trigger
+                for trigger in triggers
+                if any(matches_query_element(trigger.dict(), q) for q in query_elements)
+            ]
+        return [trigger.copy(deep=True) for trigger in triggers]
+
+    def list_page(
+        self,
+        created_by: str,
+        *,
+        state: str | None = None,
+        limit: int = 100,
+        marker: str | None = None,
+        fields: t.Iterable[str] | None = None,
+    ) -> tuple[list[dict[str, t.Any]], str | None]:
+        start_after = None
+        if marker is not None:
+            start_key = decode_marker(marker)
+            if start_key.get("created_by") != created_by:
+                raise ValueError(f"Invalid pagination marker {marker}")
+            start_after = start_key.get("trigger_id")
+        with self._lock:
+            triggers = sorted(
+                (
+                    trigger
+                    for trigger in self._triggers.values()
+                    if trigger.created_by == created_by
+                    and (state is None or query_value(trigger.state) == str(state))
+                    and (start_after is None or trigger.trigger_id > start_after)
+                ),
+                key=lambda trigger: trigger.trigger_id,
+            )
+            items = [project_fields(trigger.dict(), fields) for trigger in triggers]
+        next_marker = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_marker = encode_marker(
+                {"created_by": created_by, "trigger_id": items[-1]["trigger_id"]}
+            )
+        return items, next_marker
+
+
+class MemoryKeyValueStore(KeyValueStore):
+    """Keeps entries in a dict in this process, so nothing is actually shared"""
+
+    def __init__(self):
+        # (value, expiration time, version) by (namespace, key)
+        self._entries: dict[tuple[str, str], tuple[t.Any, float | None, int]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(
+        self, namespace: str, key: str
+    ) -> tuple[t.Any, float | None, int] | None:
+        """The unexpired entry for key, removing it if expired. Requires the lock."""
+        entry = self._entries.get((namespace, key))
+        if entry is not None and is_expired(entry[1]):
+            del self._entries[(namespace, key)]
+            return None
+        return entry
+
+    def get_many(self, namespace: str, keys: t.Iterable[str]) -> dict[str, t.Any]:
+        values: dict[str, t.Any] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entry(namespace, key)
+                if entry is not None:
+                    values[key] = copy.deepcopy(entry[0])
+        return values
+
+    def items(self, namespace: str) -> dict[str, t.Any]:
+        with self._lock:
+            keys = [key for ns, key in self._entries if ns == namespace]
+        return self.get_many(namespace, keys)
+
+    def put(
+        self, namespace: str, key: str, value: t.Any, ttl: float | None = None
+    ) -> None:
+        with self._lock:
+            self._entries[(namespace, key)] = (
+                copy.deepcopy(value),
+                expiration_time(ttl),
+                0,
+            )
+
+    def get_versioned(self, namespace: str, key: str) -> tuple[t.Any, int]:
+        with self._lock:
+            entry = self._entry(namespace, key)
+            if entry is None:
+                return None, 0
+            return copy.deepcopy(entry[0]), entry[2]
+
+    def put_versioned(
+        self,
+        namespace: str,
+        key: str,
+        value: t.Any,
+        expected_version: int,
+        ttl: float | None = None,
+    ) -> int:
+        with self._lock:
+            entry = self._entry(namespace, key)
+            version = entry[2] if entry is not None else 0
+            if version != expected_version:
+                raise KeyValueVersionConflict(namespace, key, expected_version)
+            self._entries[(namespace, key)] = (
+                copy.deepcopy(value),
+                expiration_time(ttl),
+                expected_version + 1,
+            )
+        return expected_version + 1
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._entries.pop((namespace, key), None)
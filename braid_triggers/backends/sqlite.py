@@ -0,0 +1,379 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import typing as t
+
+from braid_triggers.models import InternalTrigger
+
+from .base import (
+    KeyValueStore,
+    KeyValueVersionConflict,
+    QueryElement,
+    TriggerBackend,
+    TriggerVersionConflict,
+    decode_marker,
+    encode_marker,
+    expiration_time,
+    matches_query_element,
+    project_fields,
+    query_value,
+)
+
+log = logging.getLogger(__name__)
+
+# Properties stored in their own columns so that they can be used in where clauses. The
+# full trigger is stored as JSON in the data column.
+_COLUMNS = ("trigger_id", "created_by", "state")
+
+# Older versions of SQLite allow at most 999 parameters in a statement
+_MAX_QUERY_PARAMETERS = 500
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS triggers (
+        trigger_id TEXT PRIMARY KEY,
+        created_by TEXT NOT NULL,
+        state TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        data TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS triggers_created_by ON triggers (created_by, trigger_id)",
+    "CREATE INDEX IF NOT EXISTS triggers_state ON triggers (state)",
+)
+
+
+_KV_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS kv (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires_at REAL,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (namespace, key)
+    )
+    """,
+)
+
+
+def _connect(path: str, schema: t.Iterable[str]) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=64,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only risks losing the latest commits on power loss
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema:
+        conn.execute(statement)
+    return conn
+
+
+def _column_values(trigger: InternalTrigger) -> tuple[t.Any, ...]:
+    return (
+        trigger.trigger_id,
+        trigger.created_by,
+        str(trigger.state),
+        trigger.version,
+        trigger.json(),
+    )
+
+
+def _where_clause(query_element: QueryElement) -> tuple[str, list[t.Any]]:
+    clauses: list[str] = []
+    params: list[t.Any] = []
+    for name, val in query_element.items():
+        if name not in _COLUMNS:
+            continue
+        if isinstance(val, (tuple, list, set)):
+            vals = [query_value(v) for v in val]
+            clauses.append(f"{name} IN ({', '.join('?' for _ in vals)})")
+            params.extend(vals)
+        else:
+            clauses.append(f"{name} = ?")
+            params.append(query_value(val))
+    return " AND ".join(clauses) or "1", params
+
+
+class SQLiteTriggerBackend(TriggerBackend):
+    """Stores triggers in a local SQLite database. The database uses write-ahead logging
+    so that reads are not blocked by a writer. A single connection is shared by all
+    threads, so operations are serialized by a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.init(create=True)
+        assert self._conn is not None
+        return self._conn
+
+    def init(self, create: bool = False) -> None:
+        with self._lock:
+            if self._conn is None:
+                # Unlike dynamo, there is no separate step to create the database, so
+                # the table is always created if needed
+                self._conn = _connect(self.path, _SCHEMA)
+                log.info(f"Using SQLite trigger database {self.path}")
+
+    def get(self, trigger_id: str) -> InternalTrigger | None:
+        conn = self.conn
+        with self._lock:
+            row = conn.execute(
+                "SELECT data FROM triggers WHERE trigger_id = ?", (trigger_id,)
+            ).fetchone()
+        return InternalTrigger.parse_raw(row[0]) if row is not None else None
+
+    def get_many(self, trigger_ids: t.Iterable[str]) -> dict[str, InternalTrigger]:
+        conn = self.conn
+        ids = list(dict.fromkeys(trigger_ids))
+        triggers: dict[str, InternalTrigger] = {}
+        for start in range(0, len(ids), _MAX_QUERY_PARAMETERS):
+            batch_ids = ids[start:][:_MAX_QUERY_PARAMETERS]
+            with self._lock:
+                rows = conn.execute(
+                    "SELECT trigger_id, data FROM triggers "
+                    f"WHERE trigger_id IN ({', '.join('?' for _ in batch_ids)})",
+                    batch_ids,
+                ).fetchall()
+            for trigger_id, data in rows:
+                triggers[trigger_id] = InternalTrigger.parse_raw(data)
+        return triggers
+
+    def create(self, trigger: InternalTrigger) -> None:
+        conn = self.conn
+        with self._lock:
+            try:
+                conn.execute(
+                    "INSERT INTO triggers "
+                    "(trigger_id, created_by, state, version, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    _column_values(trigger),
+                )
+            except sqlite3.IntegrityError as ie:
+                raise TriggerVersionConflict(trigger.trigger_id, 0) from ie
+
+    def put(self, trigger: InternalTrigger, expected_version: int) -> None:
+        conn = self.conn
+        trigger_id, created_by, state, version, data = _column_values(trigger)
+        with self._lock:
+            cursor = conn.execute(
+                "UPDATE triggers SET created_by = ?, state = ?, version = ?, data = ? "
+                "WHERE trigger_id = ? AND version = ?",
+                (created_by, state, version, data, trigger_id, expected_version),
+            )
+        if cursor.rowcount == 0:
+            raise TriggerVersionConflict(trigger_id, expected_version)
+
+    def delete(self, trigger_id: str) -> InternalTrigger | None:
+        conn = self.conn
+        with self._lock:
+            row = conn.execute(
+                "SELECT data FROM triggers WHERE trigger_id = ?", (trigger_id,)
+            ).fetchone()
+            conn.execute("DELETE FROM triggers WHERE trigger_id = ?", (trigger_id,))
+        return InternalTrigger.parse_raw(row[0]) if row is not None else None
+
+    def delete_many(self, trigger_ids: t.Iterable[str]) -> None:
+        conn = self.conn
+        with self._lock:
+            conn.executemany(
+                "DELETE FROM triggers WHERE trigger_id = ?",
+                [(trigger_id,) for trigger_id in trigger_ids],
+            )
+
+    def query(self, query_elements: t.Sequence[QueryElement]) -> list[InternalTrigger]:
+        conn = self.conn
+        if not query_elements:
+            query_elements = [{}]
+        triggers: dict[str, InternalTrigger] = {}
+        for query_element in query_elements:
+            where, params = _where_clause(query_element)
+            with self._lock:
+                rows = conn.execute(
+                    f"SELECT trigger_id, data FROM triggers WHERE {where}", params
+                ).fetchall()
+            for trigger_id, data in rows:
+                if trigger_id in triggers:
+                    continue
+                trigger = InternalTrigger.parse_raw(data)
+                # Properties without a column are matched here
+                if matches_query_element(trigger.dict(), query_element):
+                    triggers[trigger_id] = trigger
+        return list(triggers.values())
+
+    def list_page(
+        self,
+        created_by: str,
+        *,
+        state: str | None = None,
+        limit: int = 100,
+        marker: str | None = None,
+        fields: t.Iterable[str] | None = None,
+    ) -> tuple[list[dict[str, t.Any]], str | None]:
+        conn = self.conn
+        sql = "SELECT data FROM triggers WHERE created_by = ?"
+        params: list[t.Any] = [created_by]
+        if state is not None:
+            sql += " AND state = ?"
+            params.append(str(state))
+        if marker is not None:
+            start_key = decode_marker(marker)
+            if start_key.get("created_by") != created_by:
+                raise ValueError(f"Invalid pagination marker {marker}")
+            sql += " AND trigger_id > ?"
+            params.append(start_key.get("trigger_id"))
+        # Read one more than needed to find whether there is a next page
+        sql += " ORDER BY trigger_id LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = conn.execute(sql, params).fetchall()
+
+        items = [
+            project_fields(InternalTrigger.parse_raw(data).dict(), fields)
+            for data, in rows[:limit]
+        ]
+        next_marker = None
+        if len(rows) > limit:
+            next_marker = encode_marker(
+                {"created_by": created_by, "trigger_id": items[-1]["trigger_id"]}
+            )
+        return items, next_marker
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class SQLiteKeyValueStore(KeyValueStore):
+    """Keeps entries in a table of a SQLite database, which may be the same database as
+    used by SQLiteTriggerBackend. Values are stored as JSON.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.init(create=True)
+        assert self._conn is not None
+        return self._conn
+
+    def init(self, create: bool = False) -> None:
+        with self._lock:
+            if self._conn is None:
+                self._conn = _connect(self.path, _KV_SCHEMA)
+                columns = {
+                    row[1] for row in self._conn.execute("PRAGMA table_info(kv)")
+                }
+                if "version" not in columns:
+                    # Databases created before entries were versioned
+                    self._conn.execute(
+                        "ALTER TABLE kv ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+                    )
+                self._conn.execute(
+                    "DELETE FROM kv WHERE expires_at <= ?", (time.time(),)
+                )
+
+    def get_many(self, namespace: str, keys: t.Iterable[str]) -> dict[str, t.Any]:
+        conn = self.conn
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._lock:
+            rows = conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ? "
+                f"AND key IN ({', '.join('?' for _ in keys)}) "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, *keys, time.time()),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def items(self, namespace: str) -> dict[str, t.Any]:
+        conn = self.conn
+        with self._lock:
+            rows = conn.execute(
+                "SELECT key, value FROM kv WHERE namespace = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time()),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def put(
+        self, namespace: str, key: str, value: t.Any, ttl: float | None = None
+    ) -> None:
+        conn = self.conn
+        with self._lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expiration_time(ttl)),
+            )
+
+    def get_versioned(self, namespace: str, key: str) -> tuple[t.Any, int]:
+        conn = self.conn
+        with self._lock:
+            row = conn.execute(
+                "SELECT value, version FROM kv WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), row[1]
+
+    def put_versioned(
+        self,
+        namespace: str,
+        key: str,
+        value: t.Any,
+        expected_version: int,
+        ttl: float | None = None,
+    ) -> int:
+        conn = self.conn
+        version = expected_version + 1
+        params = (json.dumps(value), expiration_time(ttl), version)
+        now = time.time()
+        with self._lock:
+            if expected_version == 0:
+                # A missing or expired entry is at version 0
+                cursor = conn.execute(
+                    "INSERT INTO kv (value, expires_at, version, namespace, key) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (namespace, key) DO UPDATE "
+                    "SET value = excluded.value, expires_at = excluded.expires_at, "
+                    "version = excluded.version "
+                    "WHERE kv.version = 0 OR kv.expires_at <= ?",
+                    (*params, namespace, key, now),
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE kv SET value = ?, expires_at = ?, version = ? "
+                    "WHERE namespace = ? AND key = ? AND version = ? "
+                    "AND (expires_at IS NULL OR expires_at > ?)",
+                    (*params, namespace, key, expected_version, now),
+                )
+        if cursor.rowcount == 0:
+            raise KeyValueVersionConflict(namespace, key, expected_version)
+        return version
+
+    def delete(self, namespace: str, key: str) -> None:
+        conn = self.conn
+        with self._lock:
+            conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            )
@@ -0,0 +1,71 @@
+"""
+Collects the events passing a trigger's filter in to batches so that one action is run
+for many events. The names available to the trigger's event_template when a batch is
+run are the list of the events' names as events, the size of the batch as batch_size
+and the trigger's event_count.
+"""
+
+import hashlib
+import time
+import typing as t
+
+from braid_triggers.jsoncodec import dumps
+from braid_triggers.models import EventBatching
+
+# The names of an event, as available to a trigger's filter and template
+EventNames = dict[str, t.Any]
+
+
+class EventBatcher:
+    def __init__(
+        self, config: EventBatching, timer: t.Callable[[], float] = time.monotonic
+    ):
+        self.config = config
+        self.timer = timer
+        self._events: list[EventNames] = []
+        self._size = 0
+        self._started_at: float | None = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    @property
+    def deadline(self) -> float | None:
+        """The time, per timer, by which the current batch should be run"""
+        if self._started_at is None:
+            return None
+        return self._started_at + self.config.max_wait_seconds
+
+    def due(self) -> bool:
+        deadline = self.deadline
+        return deadline is not None and self.timer() >= deadline
+
+    def add(self, names: EventNames) -> list[EventNames] | None:
+        """Add an event to the current batch, returning the batch if it is now full"""
+        if not self._events:
+            self._started_at = self.timer()
+        self._events.append(names)
+        max_bytes = self.config.max_bytes
+        if max_bytes is not None:
+            self._size += len(dumps(names))
+        if len(self._events) >= self.config.max_events or (
+            max_bytes is not None and self._size >= max_bytes
+        ):
+            return self.take()
+        return None
+
+    def take(self) -> list[EventNames]:
+        """Remove and return the current batch"""
+        events = self._events
+        self._events = []
+        self._size = 0
+        self._started_at = None
+        return events
+
+
+def batch_request_id(event_ids: t.Iterable[str]) -> str:
+    """A request_id derived from the events of a batch, so that running the same batch
+    again returns the original action
+    """
+    digest = hashlib.sha256("\n".join(event_ids).encode("utf-8")).hexdigest()
+    return f"batch-{digest[:32]}"
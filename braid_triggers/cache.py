@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import time
+import typing as t
+from dataclasses import dataclass
+
+import cachetools
+
+log = logging.getLogger(__name__)
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+
+
+@dataclass
+class _CacheEntry(t.Generic[V]):
+    __slots__ = ["value", "ttl", "error"]
+    value: V | None
+    ttl: float
+    error: BaseException | None
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    loads: int = 0
+    coalesced: int = 0
+    load_errors: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+            "load_errors": self.load_errors,
+        }
+
+
+class AsyncCache(t.Generic[K, V]):
+    """A size bounded, LRU cache where each entry expires after a time-to-live. The
+    ttl may be set per-entry so that, for example, a cached token expires no later than
+    the token itself.
+
+    get_or_load() provides read-through caching for async loaders: when the key is
+    missing, the loader is called once and any other callers requesting the same key
+    while that load is running wait for its result rather than starting their own
+    load.
+
+    If is_stale is provided, it is called as is_stale(existing_value, new_value)
+    whenever a value is set for a key which is already cached. When it returns True,
+    the new value is discarded. This allows versioned values to never be replaced by
+    older versions.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        *,
+        is_stale: t.Callable[[V, V], bool] | None = None,
+        timer: t.Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.is_stale = is_stale
+        self.stats = CacheStats()
+        self._cache: cachetools.TLRUCache = cachetools.TLRUCache(
+            maxsize=maxsize, ttu=self._ttu, timer=timer
+        )
+        self._inflight: dict[K, asyncio.Future] = {}
+
+    @staticmethod
+    def _ttu(_key: K, entry: _CacheEntry, now: float) -> float:
+        return now + entry.ttl
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._cache
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        entry: _CacheEntry | None = self._cache.get(key)
+        if entry is None or entry.error is not None:
+            return default
+        return entry.value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> bool:
+        """Cache value for key, returning False if is_stale rejected the value."""
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            self._cache.pop(key, None)
+            return False
+        if self.is_stale is not None:
+            existing = self.get(key)
+            if existing is not None and self.is_stale(existing, value):
+                return False
+        self._cache[key] = _CacheEntry(value, ttl, None)
+        return True
+
+    def set_error(self, key: K, error: BaseException, ttl: float) -> None:
+        """Remember that loading key failed, so get_or_load() re-raises error for ttl
+        seconds rather than calling the loader again (negative caching).
+        """
+        if ttl > 0:
+            self._cache[key] = _CacheEntry(None, ttl, error)
+
+    def pop(self, key: K) -> V | None:
+        entry: _CacheEntry | None = self._cache.pop(key, None)
+        if entry is None or entry.error is not None:
+            return None
+        return entry.value
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    async def get_or_load(
+        self,
+        key: K,
+        loader: t.Callable[[], t.Awaitable[V]],
+        *,
+        ttl: float | t.Callable[[V], float] | None = None,
+        error_ttl: float | None = None,
+        refresh: bool = False,
+    ) -> V:
+        """Return the cached value for key, calling loader to retrieve it if it is not
+        cached (or refresh is True). ttl may be a function computing the ttl from the
+        loaded value. A loaded value of None is returned but not cached. If error_ttl is
+        set, exceptions raised by the loader are cached for that many seconds.
+        """
+        if not refresh:
+            entry: _CacheEntry | None = self._cache.get(key)
+            if entry is not None:
+                self.stats.hits += 1
+                if entry.error is not None:
+                    raise entry.error
+                return t.cast(V, entry.value)
+        self.stats.misses += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.stats.loads += 1
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats.load_errors += 1
+            if error_ttl is not None:
+                self.set_error(key, e, error_ttl)
+            future.set_exception(e)
+            # Mark the exception retrieved so that it isn't reported when there were no
+            # other waiters
+            future.exception()
+            raise
+        else:
+            if value is not None:
+                value_ttl = ttl(value) if callable(ttl) else ttl
+                if not self.set(key, value, value_ttl):
+                    # A newer value was cached while we were loading, so prefer it
+                    value = t.cast(V, self.get(key, value))
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+
+class BatchLoader(t.Generic[K, V]):
+    """Combines the keys requested by load() calls made within window seconds of each
+    other into as few calls of loader as possible, each with at most max_batch keys.
+    loader returns a mapping from the keys to their values, omitting keys which have no
+    value. A key which is already being loaded is not requested again; the caller waits
+    for the existing load instead.
+    """
+
+    def __init__(
+        self,
+        loader: t.Callable[[list[K]], t.Awaitable[t.Mapping[K, V]]],
+        *,
+        window: float = 0.01,
+        max_batch: int = 100,
+    ):
+        self.loader = loader
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: list[K] = []
+        self._inflight: dict[K, asyncio.Future] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._batch_tasks: set[asyncio.Task] = set()
+
+    async def load(self, keys: t.Iterable[K]) -> dict[K, V | None]:
+        """Return the values of keys, with None for keys that have no value"""
+        loop = asyncio.get_running_loop()
+        futures: dict[K, asyncio.Future] = {}
+        for key in keys:
+            future = self._inflight.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[key] = future
+                self._pending.append(key)
+            futures[key] = future
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return {key: await asyncio.shield(future) for key, future in futures.items()}
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_batch):
+            task = asyncio.create_task(
+                self._load_batch(pending[start:][: self.max_batch])
+            )
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _load_batch(self, keys: list[K]) -> None:
+        try:
+            values = await self.loader(keys)
+        except asyncio.CancelledError:
+            for key in keys:
+                self._inflight.pop(key).cancel()
+            raise
+        except Exception as e:
+            for key in keys:
+                future = self._inflight.pop(key)
+                future.set_exception(e)
+                # Mark the exception retrieved in case there are no waiters
+                future.exception()
+            return
+        for key in keys:
+            self._inflight.pop(key).set_result(values.get(key))
@@ -1,6 +1,6 @@
 import json
 import os
-from typing import Mapping
+from typing import List, Mapping, Optional
 
 import typer
 from globus_sdk import GlobusAPIError
@@ -83,12 +83,58 @@ def create(
         ),
         show_default=False,
     ),
+    batch_max_events: Optional[int] = typer.Option(
+        None,
+        help=(
+            "Run one action per batch of up to this many events passing the filter, "
+            "with the events available to the template as 'events'."
+        ),
+    ),
+    batch_max_bytes: Optional[int] = typer.Option(
+        None, help="Run a batch once its events total this many bytes."
+    ),
+    batch_max_wait: Optional[float] = typer.Option(
+        None, help="Run a batch at most this many seconds after its first event."
+    ),
+    debounce_quiet: Optional[float] = typer.Option(
+        None,
+        help=(
+            "Only act on one event of each burst of events passing the filter, once no "
+            "more have arrived for this many seconds."
+        ),
+    ),
+    debounce_key: Optional[str] = typer.Option(
+        None,
+        help="An expression on the event; bursts are debounced separately per value.",
+    ),
+    debounce_keep: str = typer.Option(
+        "last", help="Which event of each burst to act on, 'first' or 'last'."
+    ),
     base_url: str = _base_url_argument,
 ):
+    event_debounce = None
+    if debounce_quiet is not None:
+        event_debounce = {
+            "quiet_seconds": debounce_quiet,
+            "key": debounce_key,
+            "keep": debounce_keep,
+        }
+    batching_options = {
+        "max_events": batch_max_events,
+        "max_bytes": batch_max_bytes,
+        "max_wait_seconds": batch_max_wait,
+    }
+    event_batching = {k: v for k, v in batching_options.items() if v is not None}
     tc = _get_trigger_client(base_url)
     try:
         resp = tc.create(
-            queue_id, action_url, event_filter, event_template, action_scope
+            queue_id,
+            action_url,
+            event_filter,
+            event_template,
+            action_scope,
+            event_batching=event_batching or None,
+            event_debounce=event_debounce,
         )
         echo_json(resp.data)
     except GlobusAPIError as gae:
@@ -110,11 +156,23 @@ def display(
 
 @trigger_app.command()
 def list(
+    limit: Optional[int] = typer.Option(
+        None, help="The maximum number of Triggers to return."
+    ),
+    marker: Optional[str] = typer.Option(
+        None, help="The marker from a previous list to retrieve the next page."
+    ),
+    state: Optional[str] = typer.Option(
+        None, help="Only list Triggers in this state (e.g. ENABLED)."
+    ),
+    field: Optional[List[str]] = typer.Option(
+        None, help="A Trigger field to include in the output. May be repeated."
+    ),
     base_url: str = _base_url_argument,
 ):
     tc = _get_trigger_client(base_url)
     try:
-        resp = tc.list()
+        resp = tc.list(limit=limit, marker=marker, state=state, fields=field or None)
         echo_json(resp.data)
     except GlobusAPIError as gae:
         echo_error(gae)
@@ -147,6 +205,78 @@ def disable(
         echo_error(gae)
 
 
+@trigger_app.command("send-event")
+def send_event(
+    trigger_id: str = typer.Argument(...),
+    body: str = typer.Option(
+        ..., callback=_string_or_file, help="The JSON body of the Event."
+    ),
+    event_id: Optional[str] = typer.Option(
+        None, help="An id for the Event, so that re-sending it runs the Action once."
+    ),
+    durable: bool = typer.Option(
+        False, help="Have the Event stored before it is accepted."
+    ),
+    base_url: str = _base_url_argument,
+):
+    tc = _get_trigger_client(base_url)
+    try:
+        resp = tc.send_event(
+            trigger_id, json.loads(body), event_id=event_id, durable=durable
+        )
+        echo_json(resp.data)
+    except GlobusAPIError as gae:
+        echo_error(gae)
+
+
+@trigger_app.command()
+def batch(
+    operation: str = typer.Argument(..., help="One of get, enable, disable or delete."),
+    trigger_id: Optional[List[str]] = typer.Argument(
+        None, help="The Triggers to operate on, instead of selecting them."
+    ),
+    state: Optional[str] = typer.Option(
+        None, help="Select your Triggers in this state (e.g. ENABLED)."
+    ),
+    queue_id: Optional[str] = typer.Option(
+        None, help="Select your Triggers reading from this queue."
+    ),
+    base_url: str = _base_url_argument,
+):
+    """Get, enable, disable or delete many Triggers at once"""
+    selector = None
+    if not trigger_id:
+        selector = {"state": state, "queue_id": queue_id}
+        selector = {k: v for k, v in selector.items() if v is not None}
+    tc = _get_trigger_client(base_url)
+    try:
+        if operation == "enable":
+            results = tc.enable_many(trigger_id or None, selector)
+        else:
+            results = tc.batch(operation, trigger_id or None, selector).data["results"]
+        echo_json({"results": results})
+    except GlobusAPIError as gae:
+        echo_error(gae)
+
+
+@trigger_app.command()
+def watch(
+    trigger_id: Optional[List[str]] = typer.Argument(
+        None, help="Triggers to watch. Defaults to all of your Triggers."
+    ),
+    base_url: str = _base_url_argument,
+):
+    """Print the activity of running Triggers as it happens, until interrupted"""
+    tc = _get_trigger_client(base_url)
+    try:
+        for activity in tc.watch(trigger_id or None):
+            typer.echo(json.dumps(activity["data"]))
+    except GlobusAPIError as gae:
+        echo_error(gae)
+    except KeyboardInterrupt:
+        pass
+
+
 @trigger_app.command()
 def delete(
     trigger_id: str = typer.Argument(...),
@@ -0,0 +1,381 @@
+"""
+Conversion between our pydantic models and DynamoDB items.
+
+The generic to_dynamo_dict() and from_dynamo_dict() functions walk arbitrary nested
+structures. ModelCodec is built once per model class from the model's fields and
+converts directly between model instances and items, only falling back to the generic
+conversion for free-form (Any typed) values.
+
+Fields registered via register_compressed_fields() are stored as compressed JSON in a
+Binary attribute when their JSON form is larger than the configured threshold. Items
+containing the uncompressed form of those fields can still be read.
+"""
+
+import datetime
+import logging
+import typing as t
+import uuid
+import zlib
+from enum import Enum
+
+from boto3.dynamodb.types import Binary, Decimal
+from pydantic import BaseModel
+from pydantic.fields import (
+    SHAPE_DICT,
+    SHAPE_LIST,
+    SHAPE_MAPPING,
+    SHAPE_SEQUENCE,
+    SHAPE_SINGLETON,
+    ModelField,
+)
+
+from braid_triggers.jsoncodec import dumps, loads
+from braid_triggers.metrics import counter, ratio, register_gauge
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd support is optional
+    zstandard = None
+
+log = logging.getLogger(__name__)
+
+M = t.TypeVar("M", bound=BaseModel)
+
+# Items written by a ModelCodec contain this attribute. It tells us we wrote the item
+# from a valid model instance so that it is safe to skip validation when reading it.
+CODEC_MARKER_ATTRIBUTE = "_codec"
+CODEC_VERSION = 1
+
+_Converter = t.Callable[[t.Any], t.Any]
+
+# The first byte of a compressed value identifies how it was compressed so that values
+# written with any algorithm can be read regardless of the current configuration.
+_ZLIB_TAG = b"z"
+_ZSTD_TAG = b"s"
+
+
+class _CompressionConfig:
+    threshold_bytes: int | None = 4096
+    algorithm: str = "zlib"
+    level: int = 6
+
+
+_compression = _CompressionConfig()
+_compressed_fields: dict[type, frozenset[str]] = {}
+
+_uncompressed_bytes = counter(
+    "persistence.compression.uncompressed_bytes",
+    "Size of the JSON form of values which were compressed",
+)
+_compressed_bytes = counter(
+    "persistence.compression.compressed_bytes", "Size of compressed values"
+)
+_compressed_values = counter(
+    "persistence.compression.compressed_values", "Number of values compressed"
+)
+register_gauge(
+    "persistence.compression.ratio", ratio(_compressed_bytes, _uncompressed_bytes)
+)
+
+
+def configure_compression(
+    threshold_bytes: int | None, algorithm: str = "zlib", level: int = 6
+) -> None:
+    """Set the size above which registered fields are compressed, and how. A threshold
+    of None disables compression of newly written values.
+    """
+    if algorithm == "zstd" and zstandard is None:
+        log.warning("zstandard is not installed, using zlib compression instead")
+        algorithm = "zlib"
+    elif algorithm not in ("zlib", "zstd"):
+        raise ValueError(f"Unknown compression algorithm {algorithm}")
+    _compression.threshold_bytes = threshold_bytes
+    _compression.algorithm = algorithm
+    _compression.level = level
+
+
+def register_compressed_fields(model: t.Type[BaseModel], fields: t.Iterable[str]):
+    """Mark fields of model as candidates for compression. This must be done before the
+    codec for the model, or any model containing it, is first used.
+    """
+    _compressed_fields[model] = frozenset(fields)
+    # Codecs which already exist may have been built without the compression
+    _codecs.clear()
+
+
+def _compress(data: bytes) -> bytes:
+    if _compression.algorithm == "zstd":
+        compressor = zstandard.ZstdCompressor(level=_compression.level)
+        return _ZSTD_TAG + compressor.compress(data)
+    return _ZLIB_TAG + zlib.compress(data, _compression.level)
+
+
+def _decompress(data: bytes) -> bytes:
+    tag, payload = data[:1], data[1:]
+    if tag == _ZLIB_TAG:
+        return zlib.decompress(payload)
+    if tag == _ZSTD_TAG:
+        if zstandard is None:
+            raise ValueError("Cannot read zstd compressed value without zstandard")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown compression tag {tag!r}")
+
+
+def _json_default(val: t.Any) -> t.Any:
+    if isinstance(val, BaseModel):
+        return val.dict()
+    if isinstance(val, Decimal):
+        return _decimal_to_number(val)
+    return str(val)
+
+
+def _compressing(encoder: _Converter) -> _Converter:
+    def encode(val: t.Any) -> t.Any:
+        threshold = _compression.threshold_bytes
+        if threshold is None:
+            return encoder(val)
+        try:
+            data = dumps(val, default=_json_default)
+        except (TypeError, ValueError):
+            # e.g. bytes values; these can still be stored uncompressed
+            return encoder(val)
+        if len(data) < threshold:
+            return encoder(val)
+        compressed = _compress(data)
+        _uncompressed_bytes.inc(len(data))
+        _compressed_bytes.inc(len(compressed))
+        _compressed_values.inc()
+        return Binary(compressed)
+
+    return encode
+
+
+def _decompressing(decoder: _Converter) -> _Converter:
+    def decode(val: t.Any) -> t.Any:
+        if isinstance(val, Binary):
+            val = loads(_decompress(val.value))
+        elif isinstance(val, (bytes, bytearray)):
+            val = loads(_decompress(val))
+        return decoder(val)
+
+    return decode
+
+
+def _iterate_dict(
+    val: t.Any | None, val_transformer: t.Callable[[t.Any], t.Any]
+) -> t.Any | None:
+    """Iterate over a nested (dict/list) structure, and call the transformer on any simple
+    (non-dict/list) values
+
+    """
+    if isinstance(val, dict):
+        val = {k: _iterate_dict(v, val_transformer) for k, v in val.items()}
+    elif isinstance(val, list):
+        val = [_iterate_dict(v, val_transformer) for v in val]
+    else:
+        val = val_transformer(val)
+    return val
+
+
+def _float_to_decimal(val: float) -> Decimal:
+    # Going via the shortest repr avoids an inexact Decimal with more digits than
+    # DynamoDB accepts (e.g. Decimal(0.1))
+    return Decimal(repr(val))
+
+
+def _decimal_to_number(val: Decimal) -> int | float:
+    if val == val.to_integral_value():
+        return int(val)
+    return float(val)
+
+
+def _identity(val: t.Any) -> t.Any:
+    return val
+
+
+def encode_any(val: t.Any) -> t.Any:
+    """Convert a free-form value into a form which can be stored in DynamoDB"""
+    encoder = _ANY_ENCODERS.get(type(val))
+    if encoder is not None:
+        return encoder(val)
+    # Less common cases such as subclasses of the types in _ANY_ENCODERS
+    if isinstance(val, Enum):
+        return encode_any(val.value)
+    if isinstance(val, BaseModel):
+        return encode_any(val.dict())
+    if isinstance(val, dict):
+        return {k: encode_any(v) for k, v in val.items()}
+    if isinstance(val, (list, tuple)):
+        return [encode_any(v) for v in val]
+    if isinstance(val, bool):
+        return val
+    if isinstance(val, int):
+        return Decimal(val)
+    if isinstance(val, float):
+        return _float_to_decimal(val)
+    if isinstance(val, (bytes, bytearray)):
+        return Binary(val)
+    return str(val)
+
+
+_ANY_ENCODERS: dict[type, _Converter] = {
+    str: _identity,
+    bool: _identity,
+    type(None): _identity,
+    int: Decimal,
+    float: _float_to_decimal,
+    # Strings are by far the most common values, so we avoid a call for each of them
+    dict: lambda d: {k: v if type(v) is str else encode_any(v) for k, v in d.items()},
+    list: lambda lst: [v if type(v) is str else encode_any(v) for v in lst],
+    tuple: lambda tup: [encode_any(v) for v in tup],
+    bytes: Binary,
+    bytearray: Binary,
+}
+
+
+def decode_any(val: t.Any) -> t.Any:
+    """Convert a free-form value read from DynamoDB back to plain python values"""
+    decoder = _ANY_DECODERS.get(type(val))
+    if decoder is not None:
+        return decoder(val)
+    return val
+
+
+_ANY_DECODERS: dict[type, _Converter] = {
+    dict: lambda d: {k: v if type(v) is str else decode_any(v) for k, v in d.items()},
+    list: lambda lst: [v if type(v) is str else decode_any(v) for v in lst],
+    Decimal: _decimal_to_number,
+    Binary: lambda b: b.value,
+}
+
+
+def to_dynamo_dict(d: dict[str, t.Any]) -> dict[str, t.Any]:
+    return encode_any(d)
+
+
+def from_dynamo_dict(d: dict[str, t.Any]) -> dict[str, t.Any]:
+    return decode_any(d)
+
+
+def _nullable(converter: _Converter) -> _Converter:
+    def convert(val: t.Any) -> t.Any:
+        if val is None:
+            return None
+        return converter(val)
+
+    return convert
+
+
+class ModelCodec(t.Generic[M]):
+    """Converts between instances of a pydantic model and DynamoDB items. The
+    conversion for each field is determined once, when the codec is created, from the
+    field's declared type.
+    """
+
+    def __init__(self, model: t.Type[M]):
+        self.model = model
+        self._use_enum_values = getattr(model.__config__, "use_enum_values", False)
+        self._compressed_fields = _compressed_fields.get(model, frozenset())
+        self._encoders: dict[str, _Converter] = {}
+        self._decoders: dict[str, _Converter] = {}
+        for name, field in model.__fields__.items():
+            encoder = self._field_converter(field, encode=True)
+            decoder = self._field_converter(field, encode=False)
+            if name in self._compressed_fields:
+                encoder = _compressing(encoder)
+                decoder = _decompressing(decoder)
+            self._encoders[name] = _nullable(encoder)
+            self._decoders[name] = _nullable(decoder)
+
+    def _field_converter(self, field: ModelField, encode: bool) -> _Converter:
+        item_converter = self._type_converter(field.type_, encode)
+        if field.shape == SHAPE_SINGLETON:
+            return item_converter
+        if item_converter is _identity:
+            return _identity
+        if field.shape in (SHAPE_LIST, SHAPE_SEQUENCE):
+            return lambda vals: [item_converter(v) for v in vals]
+        if field.shape in (SHAPE_DICT, SHAPE_MAPPING):
+            return lambda vals: {k: item_converter(v) for k, v in vals.items()}
+        return encode_any if encode else decode_any
+
+    def _type_converter(self, type_: t.Any, encode: bool) -> _Converter:
+        if isinstance(type_, type):
+            if issubclass(type_, BaseModel):
+                codec = model_codec(type_)
+                if encode:
+                    return codec._encode_fields
+                return codec._decode_fields
+            if issubclass(type_, Enum):
+                if encode:
+                    return lambda v: v.value if isinstance(v, Enum) else v
+                if self._use_enum_values:
+                    return _identity
+                return type_
+            if issubclass(type_, str):
+                # Includes url types which are str subclasses
+                return str if encode else _identity
+            if issubclass(type_, bool):
+                return _identity
+            if issubclass(type_, int):
+                return Decimal if encode else int
+            if issubclass(type_, float):
+                return _float_to_decimal if encode else float
+            if issubclass(type_, uuid.UUID):
+                return str if encode else uuid.UUID
+            if issubclass(type_, datetime.datetime):
+                return str if encode else datetime.datetime.fromisoformat
+        return encode_any if encode else decode_any
+
+    def _encode_fields(self, instance: M) -> dict[str, t.Any]:
+        return {
+            name: encoder(getattr(instance, name))
+            for name, encoder in self._encoders.items()
+        }
+
+    def to_item(self, instance: M) -> dict[str, t.Any]:
+        item = self._encode_fields(instance)
+        item[CODEC_MARKER_ATTRIBUTE] = CODEC_VERSION
+        return item
+
+    def decode_values(self, item: t.Mapping[str, t.Any]) -> dict[str, t.Any]:
+        """Convert the values in item, which may contain only some of the fields of the
+        model, to the field types without validating. Nested models are constructed.
+        """
+        return {
+            name: self._decoders[name](val)
+            for name, val in item.items()
+            if name in self._decoders
+        }
+
+    def _decode_fields(self, item: t.Mapping[str, t.Any]) -> t.Any:
+        return self.model.construct(**self.decode_values(item))
+
+    def from_item(self, item: t.Mapping[str, t.Any], trusted: bool | None = None) -> M:
+        """Create a model instance from a DynamoDB item. Items written by a ModelCodec
+        are trusted by default, and the instance is created without validation. Other
+        items are always validated.
+        """
+        from_codec = item.get(CODEC_MARKER_ATTRIBUTE) == CODEC_VERSION
+        if trusted is None:
+            trusted = from_codec
+        if from_codec:
+            # Only items written by a codec can contain compressed fields which the
+            # field decoders must handle
+            instance = self._decode_fields(item)
+            if trusted:
+                return instance
+            return self.model(**instance.dict())
+        return self.model(**from_dynamo_dict(dict(item)))
+
+
+_codecs: dict[type, ModelCodec] = {}
+
+
+def model_codec(model: t.Type[M]) -> ModelCodec[M]:
+    """Return the (shared) codec for a model class, creating it on first use"""
+    codec = _codecs.get(model)
+    if codec is None:
+        codec = ModelCodec(model)
+        _codecs[model] = codec
+    return codec
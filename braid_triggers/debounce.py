@@ -0,0 +1,87 @@
+"""
+Debouncing of bursts of similar events. Events are grouped by a key, and each group's
+burst is considered settled once no event with its key has arrived for the quiet
+period, when either its first or last event is released. Deadlines are kept in a heap,
+so the next deadline is found in constant time and each event costs O(log n) in the
+number of pending keys. Superseded heap entries are discarded lazily as they reach the
+top of the heap.
+"""
+
+import heapq
+import itertools
+import time
+import typing as t
+
+T = t.TypeVar("T")
+
+
+class Debouncer(t.Generic[T]):
+    def __init__(
+        self,
+        quiet_seconds: float,
+        keep: str = "last",
+        timer: t.Callable[[], float] = time.monotonic,
+    ):
+        """keep is "first" or "last", which event of each burst to release"""
+        self.quiet_seconds = quiet_seconds
+        self.keep = keep
+        self.timer = timer
+        # The pending item and deadline of each key
+        self._pending: dict[t.Hashable, tuple[T, float]] = {}
+        # (deadline, sequence, key); an entry is current only if its deadline matches
+        # the key's pending deadline. The sequence keeps keys from being compared.
+        self._heap: list[tuple[float, int, t.Hashable]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, key: t.Hashable, item: T) -> T | None:
+        """Add item to the burst for key, restarting its quiet period. Returns the item
+        which will no longer be released, either item or the burst's previous item, or
+        None if this starts the burst.
+        """
+        deadline = self.timer() + self.quiet_seconds
+        pending = self._pending.get(key)
+        superseded = None
+        if pending is not None:
+            if self.keep == "first":
+                item, superseded = pending[0], item
+            else:
+                superseded = pending[0]
+        self._pending[key] = (item, deadline)
+        heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+        # Don't let superseded entries accumulate when bursts are long
+        if len(self._heap) > 2 * len(self._pending) + 64:
+            self._heap = [entry for entry in self._heap if self._is_current(entry)]
+            heapq.heapify(self._heap)
+        return superseded
+
+    def get(self, key: t.Hashable) -> T | None:
+        """The item to be released when the burst for key settles"""
+        pending = self._pending.get(key)
+        return pending[0] if pending is not None else None
+
+    def _is_current(self, entry: tuple[float, int, t.Hashable]) -> bool:
+        deadline, _, key = entry
+        pending = self._pending.get(key)
+        return pending is not None and pending[1] == deadline
+
+    def _discard_superseded(self) -> None:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    @property
+    def deadline(self) -> float | None:
+        """The time, per timer, at which the next burst settles"""
+        self._discard_superseded()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self) -> list[T]:
+        """Remove and return the items of the bursts which have settled"""
+        now = self.timer()
+        due: list[T] = []
+        while (deadline := self.deadline) is not None and deadline <= now:
+            _, _, key = heapq.heappop(self._heap)
+            due.append(self._pending.pop(key)[0])
+        return due
@@ -0,0 +1,161 @@
+"""
+Recognizes events which a trigger has already processed by their event_id, such as
+queue messages redelivered because deleting them failed. The ids of the most recent
+events are remembered exactly. Older ids are remembered in a pair of Bloom filters
+which are rotated as they fill, so memory use is bounded however many events a trigger
+receives, at the cost of a small (configurable) chance of mistaking a new event for
+one already seen. The state can be converted to and from a JSON-compatible dict so it
+can be checkpointed to the key-value store and survive restarts.
+"""
+
+import base64
+import hashlib
+import math
+import typing as t
+import zlib
+
+
+class BloomFilter:
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float,
+        num_bits: int | None = None,
+        num_hashes: int | None = None,
+        bits: bytearray | None = None,
+        count: int = 0,
+    ):
+        """A filter sized to hold capacity items with the given false positive rate"""
+        self.capacity = capacity
+        self.error_rate = error_rate
+        if num_bits is None:
+            num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        if num_hashes is None:
+            num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def _positions(self, item: str) -> t.Iterator[int]:
+        # Double hashing: the k positions are derived from two independent hashes
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item)
+        )
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "count": self.count,
+            # A partly filled filter is mostly zeros, so compresses well
+            "bits": base64.b64encode(zlib.compress(bytes(self.bits))).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, val: dict[str, t.Any]) -> "BloomFilter":
+        return cls(
+            val["capacity"],
+            val["error_rate"],
+            num_bits=val["num_bits"],
+            num_hashes=val["num_hashes"],
+            bits=bytearray(zlib.decompress(base64.b64decode(val["bits"]))),
+            count=val["count"],
+        )
+
+
+class SeenEvents:
+    """The ids of the events seen by a trigger. The recent_size most recent ids are
+    remembered exactly and at least the filter_capacity ids before those in Bloom
+    filters.
+    """
+
+    def __init__(
+        self,
+        recent_size: int = 1000,
+        filter_capacity: int = 10000,
+        error_rate: float = 1e-6,
+    ):
+        self.recent_size = recent_size
+        self.filter_capacity = filter_capacity
+        self.error_rate = error_rate
+        # Insertion ordered, so the first key is the oldest
+        self._recent: dict[str, None] = {}
+        self._current = BloomFilter(filter_capacity, error_rate)
+        self._previous: BloomFilter | None = None
+        # Whether there are changes since the last checkpoint
+        self.dirty = False
+
+    def __contains__(self, event_id: str) -> bool:
+        return (
+            event_id in self._recent
+            or event_id in self._current
+            or (self._previous is not None and event_id in self._previous)
+        )
+
+    def add(self, event_id: str) -> None:
+        self._recent[event_id] = None
+        if len(self._recent) > self.recent_size:
+            oldest = next(iter(self._recent))
+            del self._recent[oldest]
+            self._remember(oldest)
+        self.dirty = True
+
+    def _remember(self, event_id: str) -> None:
+        """Move an id which is no longer recent in to the Bloom filters"""
+        if self._current.full:
+            self._previous = self._current
+            self._current = BloomFilter(self.filter_capacity, self.error_rate)
+        self._current.add(event_id)
+
+    def check_and_add(self, event_id: str) -> bool:
+        """Record event_id as seen, returning True if it had already been seen"""
+        if event_id in self:
+            return True
+        self.add(event_id)
+        return False
+
+    def to_dict(self) -> dict[str, t.Any]:
+        filters = [self._current] + ([self._previous] if self._previous else [])
+        return {
+            "recent": list(self._recent),
+            "filters": [f.to_dict() for f in filters],
+        }
+
+    @classmethod
+    def from_dict(
+        cls,
+        val: dict[str, t.Any],
+        recent_size: int = 1000,
+        filter_capacity: int = 10000,
+        error_rate: float = 1e-6,
+    ) -> "SeenEvents":
+        """Restore a checkpoint. The stored filters keep their original sizes, while
+        new filters use filter_capacity and error_rate.
+        """
+        seen = cls(recent_size, filter_capacity, error_rate)
+        filters = [BloomFilter.from_dict(f) for f in val.get("filters", [])]
+        if filters:
+            seen._current = filters[0]
+            seen._previous = filters[1] if len(filters) > 1 else None
+        for event_id in val.get("recent", []):
+            seen.add(event_id)
+        seen.dirty = False
+        return seen
@@ -0,0 +1,25 @@
+"""
+Entity tags for conditional requests. A client which sends the ETag of a response it has
+in If-None-Match is told (with status 304) when its copy is still current, rather than
+being sent the same body again.
+"""
+
+import hashlib
+
+
+def version_etag(version: int) -> str:
+    return f'"v{version}"'
+
+
+def content_etag(content: bytes) -> str:
+    return f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header matches etag, using the weak comparison which
+    RFC 9110 specifies for If-None-Match
+    """
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
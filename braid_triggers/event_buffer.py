@@ -0,0 +1,71 @@
+"""
+Buffers events sent directly to a trigger via the API until its poller processes them.
+Buffered events wake the poller immediately rather than waiting for its next poll of
+the trigger's queue.
+"""
+
+import asyncio
+import typing as t
+from collections import deque
+from dataclasses import dataclass
+
+from braid_triggers.models import Event
+
+
+@dataclass
+class BufferedEvent:
+    event: Event
+    # Whether the event has been stored so that it survives a restart until processed
+    durable: bool = False
+    # Whether the event was read back from storage when the trigger started
+    replayed: bool = False
+
+
+class EventBuffer:
+    """Holds at most maxsize events. put() refuses events when full so that senders can
+    be told to back off.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._events: deque[BufferedEvent] = deque()
+        self._arrived = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    @property
+    def full(self) -> bool:
+        return len(self._events) >= self.maxsize
+
+    def put(self, event: Event, durable: bool = False, replayed: bool = False) -> bool:
+        """Add event to the buffer, returning False if it is full"""
+        if self.full:
+            return False
+        self._events.append(BufferedEvent(event, durable, replayed))
+        self._arrived.set()
+        return True
+
+    def drain(self, max_events: int | None = None) -> list[BufferedEvent]:
+        """Remove and return up to max_events events, oldest first"""
+        count = len(self._events)
+        if max_events is not None:
+            count = min(count, max_events)
+        drained = [self._events.popleft() for _ in range(count)]
+        if not self._events:
+            self._arrived.clear()
+        return drained
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for an event to be buffered. Returns True if any
+        events are buffered.
+        """
+        if not self._events:
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return bool(self._events)
+
+    def events(self) -> t.Iterator[Event]:
+        return (buffered.event for buffered in self._events)
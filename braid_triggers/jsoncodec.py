@@ -0,0 +1,67 @@
+"""
+JSON encoding and decoding for event payloads, outbound request and response bodies and
+API responses. orjson is used when it is installed, falling back to the standard
+library otherwise. dumps() returns bytes and loads() accepts bytes, so bodies needn't
+be converted to and from str.
+"""
+
+import datetime
+import json
+import typing as t
+import uuid
+from decimal import Decimal
+from enum import Enum
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+Default = t.Callable[[t.Any], t.Any]
+
+
+def _default(val: t.Any) -> t.Any:
+    """Convert values which aren't natively JSON serializable"""
+    if isinstance(val, BaseModel):
+        return val.dict()
+    if isinstance(val, (datetime.datetime, datetime.date, datetime.time)):
+        return val.isoformat()
+    if isinstance(val, Enum):
+        return val.value
+    if isinstance(val, Decimal):
+        return int(val) if val == val.to_integral_value() else float(val)
+    if isinstance(val, (set, frozenset)):
+        return list(val)
+    if isinstance(val, uuid.UUID):
+        return str(val)
+    raise TypeError(f"Object of type {type(val).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(val: t.Any, default: Default | None = None) -> bytes:
+    return json.dumps(
+        val, default=default or _default, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+
+
+def _stdlib_loads(data: bytes | bytearray | memoryview | str) -> t.Any:
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(val: t.Any, default: Default | None = None) -> bytes:
+        return orjson.dumps(
+            val, default=default or _default, option=orjson.OPT_NON_STR_KEYS
+        )
+
+    # orjson.JSONDecodeError is a subclass of ValueError, as is json's
+    loads = orjson.loads
+else:
+    BACKEND = "json"
+    dumps = _stdlib_dumps
+    loads = _stdlib_loads
@@ -0,0 +1,64 @@
+"""
+A minimal in-process registry of named metrics. Counters are incremented by the code
+being measured while gauges are functions called when the metrics are read. The
+current values of all metrics are served by the /metrics route.
+"""
+
+import threading
+import typing as t
+
+MetricValue = t.Union[int, float, t.Mapping[str, t.Any], None]
+
+
+class Counter:
+    __slots__ = ["name", "description", "value", "_lock"]
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.value: int | float = 0
+        # Counters may be updated from worker threads (e.g. persistence calls)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int | float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+_counters: dict[str, Counter] = {}
+_gauges: dict[str, t.Callable[[], MetricValue]] = {}
+
+
+def counter(name: str, description: str = "") -> Counter:
+    """Return the counter with the given name, creating it if needed"""
+    c = _counters.get(name)
+    if c is None:
+        c = Counter(name, description)
+        _counters[name] = c
+    return c
+
+
+def register_gauge(name: str, value_fn: t.Callable[[], MetricValue]) -> None:
+    """Register a function which returns the current value of the gauge name"""
+    _gauges[name] = value_fn
+
+
+def ratio(numerator: Counter, denominator: Counter) -> t.Callable[[], float | None]:
+    """A gauge function computing the ratio of two counters"""
+
+    def value() -> float | None:
+        if not denominator.value:
+            return None
+        return numerator.value / denominator.value
+
+    return value
+
+
+def snapshot() -> dict[str, MetricValue]:
+    values: dict[str, MetricValue] = {name: c.value for name, c in _counters.items()}
+    for name, value_fn in _gauges.items():
+        try:
+            values[name] = value_fn()
+        except Exception as e:
+            values[name] = {"error": str(e)}
+    return dict(sorted(values.items()))
@@ -1,15 +1,15 @@
 from __future__ import annotations
 
 import datetime
-import json
 import time
 import typing as t
 import uuid
 from enum import Enum, unique
-from json import JSONDecodeError
 
 from pydantic import BaseModel, Field, HttpUrl
 
+from braid_triggers.jsoncodec import loads
+
 
 class BaseEnum(str, Enum):
     """
@@ -55,12 +55,15 @@ class Event(BaseModel):
     sent_by_identity_set: list[str] | None = None
 
     @staticmethod
-    def from_queue_msg(queue_msg: dict[str, t.Any]) -> "Event":
-        message_body = queue_msg.get("message_body", "")
+    def parse_body(message_body: str) -> t.Any:
         try:
-            event_body = json.loads(message_body)
-        except JSONDecodeError as jsde:
-            event_body = {"message": message_body, "json_parse_status": str(jsde)}
+            return loads(message_body)
+        except ValueError as jsde:
+            return {"message": message_body, "json_parse_status": str(jsde)}
+
+    @staticmethod
+    def from_queue_msg(queue_msg: dict[str, t.Any]) -> "Event":
+        event_body = Event.parse_body(queue_msg.get("message_body", ""))
         event_id = queue_msg.get("message_id", "")
         e = Event(
             body=event_body,
@@ -81,15 +84,19 @@ class Token(BaseModel):
     resource_server: str | None = None
     token_type: str | None = None
 
-    def requires_refresh(self) -> bool:
+    def requires_refresh(self, margin: float = 300) -> bool:
+        """Whether the token expires within margin seconds"""
         now = time.time()
-        requires_refresh = now + 300 > self.expiration_time
+        requires_refresh = now + margin > self.expiration_time
         return requires_refresh
 
 
 class TokenSet(BaseModel):
     user_token: Token
     dependent_tokens: t.Mapping[str, Token]
+    # When set, the dependent tokens are kept in the token pool shared by the triggers
+    # of this identity, and dependent_tokens only holds tokens missing from the pool
+    pool_identity: str | None = None
 
 
 @unique
@@ -101,6 +108,30 @@ class TriggerState(BaseEnum):
     DELETED = "DELETED"
 
 
+class EventBatching(BaseModel):
+    """The events passing the trigger's filter are collected in to batches, and one
+    action is run per batch with event_template evaluated on the batch's events. A
+    batch is run once it holds max_events events or max_bytes bytes of events (as
+    JSON), or max_wait_seconds after its first event.
+    """
+
+    max_events: int = Field(100, ge=1)
+    max_bytes: int | None = Field(None, ge=1)
+    max_wait_seconds: float = Field(10.0, gt=0)
+
+
+class EventDebounce(BaseModel):
+    """The events passing the trigger's filter are debounced: a burst of events is
+    settled once no more have arrived for quiet_seconds, and only its first or last
+    event (per keep) is acted on. When key is given, it is an expression evaluated on
+    each event, and bursts of events with different keys are debounced separately.
+    """
+
+    quiet_seconds: float = Field(..., gt=0)
+    key: str | None = None
+    keep: t.Literal["first", "last"] = "last"
+
+
 class Trigger(BaseModel):
     class Config:
         use_enum_values = True
@@ -110,6 +141,10 @@ class Trigger(BaseModel):
     action_scope: HttpUrl | None
     event_filter: str
     event_template: dict[str, t.Any]
+    # When set, one action is run per batch of events rather than per event
+    event_batching: EventBatching | None = None
+    # When set, bursts of events are debounced before being acted on (or batched)
+    event_debounce: EventDebounce | None = None
 
 
 class ResponseTrigger(Trigger):
@@ -127,3 +162,40 @@ class ResponseTrigger(Trigger):
 class InternalTrigger(ResponseTrigger):
     token_set: TokenSet
     all_action_status: list[ActionStatus]
+    # Incremented each time the trigger is written so that newer copies can be told
+    # apart from older ones
+    version: int = 0
+
+
+class TriggerList(BaseModel):
+    triggers: list[dict[str, t.Any]]
+    limit: int
+    has_next_page: bool
+    marker: str | None = None
+
+
+class TriggerSelector(BaseModel):
+    """Selects triggers by their properties. created_by defaults to the caller."""
+
+    created_by: str | None = None
+    state: TriggerState | None = None
+    queue_id: uuid.UUID | None = None
+
+
+class TriggerBatchRequest(BaseModel):
+    operation: t.Literal["get", "enable", "disable", "delete"]
+    # Exactly one of trigger_ids or selector should be provided
+    trigger_ids: list[str] | None = None
+    selector: TriggerSelector | None = None
+
+
+class TriggerBatchResult(BaseModel):
+    trigger_id: str
+    # The status the operation would have had on this trigger alone
+    status: int
+    detail: str | None = None
+    trigger: ResponseTrigger | None = None
+
+
+class TriggerBatchResponse(BaseModel):
+    results: list[TriggerBatchResult]
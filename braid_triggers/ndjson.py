@@ -0,0 +1,50 @@
+"""
+Incremental parsing of newline delimited JSON (NDJSON) request bodies, so that large
+bodies are processed as they arrive rather than read into memory first.
+"""
+
+import typing as t
+
+from braid_triggers.jsoncodec import loads
+
+
+class NDJSONLineTooLong(ValueError):
+    pass
+
+
+async def iter_lines(
+    chunks: t.AsyncIterable[bytes], max_line_bytes: int = 1024 * 1024
+) -> t.AsyncIterator[bytes]:
+    """Yield each non-blank line of the stream of chunks, without its line ending. Raises
+    NDJSONLineTooLong if a line exceeds max_line_bytes.
+    """
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        if len(pending) > max_line_bytes:
+            raise NDJSONLineTooLong(f"Line longer than {max_line_bytes} bytes")
+        for line in lines:
+            line = line.strip()
+            if len(line) > max_line_bytes:
+                raise NDJSONLineTooLong(f"Line longer than {max_line_bytes} bytes")
+            if line:
+                yield line
+    pending = pending.strip()
+    if pending:
+        yield pending
+
+
+async def iter_ndjson(
+    chunks: t.AsyncIterable[bytes], max_line_bytes: int = 1024 * 1024
+) -> t.AsyncIterator[t.Any]:
+    """Yield the value of each line of the stream. A line which isn't valid JSON yields
+    the ValueError raised when parsing it, so that the remaining lines can still be
+    processed.
+    """
+    async for line in iter_lines(chunks, max_line_bytes):
+        try:
+            yield loads(line)
+        except ValueError as ve:
+            yield ve
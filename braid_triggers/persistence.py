@@ -1,286 +1,300 @@
+import asyncio
+import copy
 import logging
-import numbers
+import random
+import time
 import typing as t
 import uuid
 
-from boto3.dynamodb.conditions import Attr, Key
-from boto3.dynamodb.types import Binary, Decimal
-from botocore.exceptions import ClientError, EndpointConnectionError
-from mypy_boto3_dynamodb import DynamoDBServiceResource
-from mypy_boto3_dynamodb.service_resource import Table as DynamoTable
 from pydantic import BaseModel
 
-from braid_triggers.aws_ops import boto3_resource
-from braid_triggers.models import InternalTrigger
-from braid_triggers.settings import get_settings
+from braid_triggers.backends import (
+    KeyValueStore,
+    QueryElement,
+    TriggerBackend,
+    TriggerVersionConflict,
+)
+from braid_triggers.backends.dynamo import DynamoKeyValueStore, DynamoTriggerBackend
+from braid_triggers.backends.memory import MemoryKeyValueStore, MemoryTriggerBackend
+from braid_triggers.backends.sqlite import SQLiteKeyValueStore, SQLiteTriggerBackend
+from braid_triggers.cache import AsyncCache
+from braid_triggers.codecs import configure_compression, register_compressed_fields
+from braid_triggers.models import ActionStatus, InternalTrigger
+from braid_triggers.settings import Settings, get_settings
+
+__all__ = (
+    "TriggerVersionConflict",
+    "enum_triggers",
+    "init_persistence",
+    "key_value_store",
+    "list_triggers_page",
+    "lookup_trigger",
+    "lookup_trigger_cached",
+    "lookup_triggers",
+    "remove_trigger",
+    "remove_triggers",
+    "scan_triggers",
+    "store_trigger",
+    "update_trigger",
+    "update_trigger_with_retry",
+)
 
-_triggers: dict[str, InternalTrigger] = {}
 log = logging.getLogger(__name__)
 
-_TRIGGER_KEY_SCHEMA = ({"AttributeName": "trigger_id", "KeyType": "HASH"},)
-_TRIGGER_ATTRIBUTE_DEFINITIONS = (
-    {"AttributeName": "trigger_id", "AttributeType": "S"},
-)
+# The delay before the first retry of a conflicting write, doubled for each further
+# retry. The actual delay is a random fraction of it so that writers don't collide
+# again.
+_RETRY_BASE_DELAY_SECONDS = 0.01
 
 settings = get_settings()
 
+# These often make up most of the size of a trigger item
+register_compressed_fields(InternalTrigger, ("event_template", "last_event"))
+register_compressed_fields(ActionStatus, ("details",))
+configure_compression(
+    settings.compression_threshold_bytes,
+    settings.compression_algorithm,
+    settings.compression_level,
+)
 
-def create_table(
-    table_name: str,
-    key_schema: t.Iterable[t.Mapping[str, str]],
-    attribute_definitions: t.Iterable[t.Mapping[str, str]],
-    billing_mode="PAY_PER_REQUEST",
-    **kwargs,
-) -> DynamoTable:
-    try:
-        client = boto3_resource("dynamodb", DynamoDBServiceResource)
-        client.create_table(
-            TableName=table_name,
-            AttributeDefinitions=attribute_definitions,
-            KeySchema=key_schema,
-            BillingMode=billing_mode,
-            **kwargs,
-        )
-    except ClientError as ce:
-        error_code = ce.response.get("Error", {}).get("Code")
-        if error_code == "ResourceInUseException":
-            log.info(f"Table {table_name} already exists")
-        else:
-            log.info(
-                f"Error creating dynamo table {table_name}, may be because "
-                f"it exists already: {str(ce)}"
-            )
-
-    except EndpointConnectionError as err:
-        log.info(f"Error creating dynamo table {table_name}: {err}")
-
-    table: DynamoTable = client.Table(table_name)
-    return table
-
-
-def get_table(
-    table_name: str,
-) -> DynamoTable:
-    client = boto3_resource("dynamodb", DynamoDBServiceResource)
-
-    table: DynamoTable = client.Table(table_name)
-    return table
+# Copies of recently read or written triggers. An entry is never replaced by a copy with
+# a lower version, so a slow read cannot overwrite the result of a more recent write.
+_trigger_cache: AsyncCache[str, InternalTrigger] = AsyncCache(
+    maxsize=settings.trigger_cache_size,
+    ttl=settings.trigger_cache_ttl_seconds,
+    is_stale=lambda cached, new: new.version < cached.version,
+)
 
 
-T = t.TypeVar("T")
+def _make_backend(settings: Settings) -> TriggerBackend:
+    if settings.persistence_backend == "memory":
+        return MemoryTriggerBackend()
+    if settings.persistence_backend == "sqlite":
+        return SQLiteTriggerBackend(settings.sqlite_path)
+    return DynamoTriggerBackend(settings.dynamo_table_name)
 
 
-def _iterate_dict(
-    val: t.Any | None, val_transformer: t.Callable[[t.Any], t.Any]
-) -> t.Any | None:
-    """Iterate over a nested (dict/list) structure, and call the transformer on any simple
-    (non-dict/list) values
+def _make_key_value_store(settings: Settings) -> KeyValueStore:
+    if settings.persistence_backend == "memory":
+        return MemoryKeyValueStore()
+    if settings.persistence_backend == "sqlite":
+        return SQLiteKeyValueStore(settings.sqlite_path)
+    table_name = settings.dynamo_kv_table_name or f"{settings.dynamo_table_name}_kv"
+    return DynamoKeyValueStore(table_name)
 
-    """
-    if isinstance(val, dict):
-        val = {k: _iterate_dict(v, val_transformer) for k, v in val.items()}
-    elif isinstance(val, list):
-        val = [_iterate_dict(v, val_transformer) for v in val]
-    else:
-        val = val_transformer(val)
-    return val
 
+_backend = _make_backend(settings)
+_key_value_store = _make_key_value_store(settings)
 
-def _from_dynamo_dict(d: dict[str, t.Any]) -> dict[str, t.Any]:
-    def dynamo_deserialize(val: t.Any) -> t.Any:
-        if isinstance(val, Decimal):
-            val = float(val)
-            if int(val) == val:
-                val = int(val)
-        elif isinstance(val, Binary):
-            val = val.value
-        return val
 
-    return _iterate_dict(d, dynamo_deserialize)
+def key_value_store() -> KeyValueStore:
+    """The store for state, other than triggers, shared by all service instances"""
+    return _key_value_store
 
 
-def _dict_to_dynamo_dict(d: dict[str, t.Any]) -> dict[str, t.Any]:
-    def dynamo_serialize(val: t.Any) -> t.Any:
-        if isinstance(val, numbers.Number):
-            val = Decimal(val)
-        elif isinstance(val, (bytes, bytearray)):
-            val = Binary(val)
-        elif val is not None:
-            val = str(val)
-        return val
+def _read_trigger(trigger_id: str) -> InternalTrigger | None:
+    return _backend.get(trigger_id)
 
-    return _iterate_dict(d, dynamo_serialize)
 
+def lookup_trigger(trigger_id: str) -> InternalTrigger | None:
+    trigger = _read_trigger(trigger_id)
+    if trigger is not None:
+        _cache_trigger(trigger)
+    return trigger
 
-def _pydantic_model_to_dynamo_dict(model: BaseModel) -> dict[str, t.Any]:
-    return _dict_to_dynamo_dict(model.dict())
 
+def lookup_triggers(trigger_ids: t.Iterable[str]) -> dict[str, InternalTrigger]:
+    """Read many triggers at once, returning those which exist by trigger_id"""
+    triggers = _backend.get_many(trigger_ids)
+    for trigger in triggers.values():
+        _cache_trigger(trigger)
+    return triggers
 
-def lookup_by_key(inst_class: t.Type[T], table: DynamoTable, **kwargs) -> T | None:
-    k, v = next(iter(kwargs.items()))
-    response = table.query(KeyConditionExpression=Key(k).eq(v))
-    items = response.get("Items")
 
-    instance: T | None = None
-    if len(items) > 0:
-        try:
-            item = _from_dynamo_dict(items[0])
-            instance = inst_class(**item)
-            return instance
-        except Exception as e:
-            log.error(f"Cannot create Trigger from {items[0]} got {str(e)}")
-    return instance
+def _cache_trigger(trigger: InternalTrigger) -> None:
+    # The caller may continue to modify its copy, so we keep our own
+    _trigger_cache.set(trigger.trigger_id, trigger.copy(deep=True))
 
 
-QueryElement = t.Union[BaseModel, dict]
+async def lookup_trigger_cached(trigger_id: str) -> InternalTrigger | None:
+    """Return a trigger from the in-process cache, reading it from storage only if it
+    is not cached. Concurrent lookups of the same uncached trigger share a single read.
+    The returned trigger is a copy which the caller is free to modify.
+    """
+    trigger = await _trigger_cache.get_or_load(
+        trigger_id, lambda: asyncio.to_thread(_read_trigger, trigger_id)
+    )
+    if trigger is None:
+        return None
+    return trigger.copy(deep=True)
+
+
+def _query_elements(
+    query_vals: QueryElement | BaseModel | t.Iterable[QueryElement | BaseModel] | None,
+    kwargs: t.Mapping[str, t.Any],
+) -> list[QueryElement]:
+    if query_vals is None:
+        query_vals = []
+    elif isinstance(query_vals, (dict, BaseModel)):
+        query_vals = [query_vals]
+    query_elements = [q.dict() if isinstance(q, BaseModel) else q for q in query_vals]
+    if kwargs:
+        query_elements.append(kwargs)
+    return query_elements
 
 
-def query_for_class(
-    inst_class: t.Type[T],
-    table: DynamoTable,
-    *,
-    query_vals: QueryElement | t.Iterable[QueryElement] | None = None,
+def scan_triggers(
+    query_vals: QueryElement
+    | BaseModel
+    | t.Iterable[QueryElement | BaseModel]
+    | None = None,
     **kwargs,
-) -> list[T]:
-    """Perform a scan of a dynamo table returning instances of the provided class. That
-    class must take as constructor params the properties of the items returned from the
-    scan.
-
-    The values to be queried can be provided in a variety of ways: in query_vals, there
-    can be a single instance of a dict or a pydantic BaseModel instance. If a list of
-    these is provided, the scan will return values matching any of these.
-
-    kwargs may also be provided for the query. If they are, they are treated as another
-    element of the query_vals list and so will form another condition that may be
-    matched.
-
-    The only forms of matching provided are exact match against the values or a
-    list/set/tuple of values. If a set of values is given, then the match for the
-    property is the value being in the set.
+) -> list[InternalTrigger]:
+    """Return the triggers matching any of the query_vals (dicts or models) or the
+    kwargs. Properties match a value, or any of the values in a list/set/tuple.
     """
-    filter_expression = None
-    if query_vals is not None and not isinstance(query_vals, list):
-        query_vals = [query_vals]
-    if len(kwargs) > 0:
-        if not query_vals:
-            query_vals = [kwargs]
-        else:
-            query_vals.append(kwargs)
-    for query_val in query_vals:
-        this_filter_expression = None
-        if not isinstance(query_val, dict):
-            try:
-                query_val = query_val.dict()
-            except Exception as e:
-                log.error(
-                    f"Failed converting {query_val} via dict() due to {str(e)}, skipping..."
-                )
-                continue
-        for k, v in query_val.items():
-            if isinstance(v, (tuple, list, set)):
-                this_attr = Attr(k).is_in(v)
-            else:
-                this_attr = Attr(k).eq(v)
-            if this_filter_expression is None:
-                this_filter_expression = this_attr
-            else:
-                this_filter_expression = this_filter_expression & this_attr
-
-        if filter_expression is None:
-            filter_expression = this_filter_expression
-        else:
-            filter_expression = filter_expression | this_filter_expression
-
-    response = table.scan(FilterExpression=filter_expression)
-    items = response.get("Items", [])
-    instances: list[T] = []
-    for item in items:
-        instances.append(inst_class(**item))
-    return instances
+    return _backend.query(_query_elements(query_vals, kwargs))
 
 
-def lookup_trigger(trigger_id: str) -> InternalTrigger | None:
-    table = get_table(
-        settings.dynamo_table_name,
+def list_triggers_page(
+    created_by: str,
+    *,
+    state: str | None = None,
+    limit: int = 100,
+    marker: str | None = None,
+    fields: t.Iterable[str] | None = None,
+) -> tuple[list[dict[str, t.Any]], str | None]:
+    """Return one page of the triggers created by created_by.
+
+    At most limit triggers are returned along with a marker to pass in to retrieve the
+    next page, or None when there are no more pages. When state is provided, only
+    triggers in that state are returned. When fields is provided, only those properties
+    (plus trigger_id) are read. Results are returned as dicts as they may not contain
+    all the fields for a model. Raises ValueError for a marker we didn't create.
+    """
+    return _backend.list_page(
+        created_by, state=state, limit=limit, marker=marker, fields=fields
     )
-    trigger = lookup_by_key(InternalTrigger, table, trigger_id=trigger_id)
-    return trigger
 
 
-def scan_triggers(
-    query_vals: QueryElement | t.Iterable[QueryElement] | None = None, **kwargs
-) -> list[InternalTrigger]:
-    table = get_table(
-        settings.dynamo_table_name,
-    )
-    return query_for_class(InternalTrigger, table, query_vals=query_vals, **kwargs)
+def _conditional_put_trigger(trigger: InternalTrigger) -> None:
+    """Write trigger, only succeeding if the stored trigger is still at the trigger's
+    current version. On success, the trigger's version is incremented. A version of 0
+    means a new trigger unless a stored trigger pre-dates versioning.
+    """
+    expected_version = trigger.version
+    trigger.version = expected_version + 1
+    try:
+        _backend.put(trigger, expected_version)
+    except Exception:
+        trigger.version = expected_version
+        raise
 
 
 def store_trigger(trigger: InternalTrigger) -> InternalTrigger:
-    table = get_table(
-        settings.dynamo_table_name,
-    )
     if trigger.trigger_id is None:
         trigger.trigger_id = str(uuid.uuid4())
-    trigger_dict = _pydantic_model_to_dynamo_dict(trigger)
-    table.put_item(Item=trigger_dict)
+    trigger.version = 1
+    _backend.create(trigger)
+    _cache_trigger(trigger)
     return trigger
 
 
-def update_trigger(trigger: InternalTrigger) -> InternalTrigger:
-    table = get_table(
-        settings.dynamo_table_name,
-    )
-    if trigger.trigger_id is None:
-        trigger.trigger_id = str(uuid.uuid4())
-    trigger_dict = _pydantic_model_to_dynamo_dict(trigger)
-    table.put_item(Item=trigger_dict)
+def update_trigger_with_retry(
+    trigger_id: str,
+    mutate: t.Callable[[InternalTrigger], t.Any],
+    max_attempts: int = 5,
+) -> InternalTrigger | None:
+    """Read the latest version of a trigger, apply mutate to it, and conditionally write
+    it back. If another write happens between the read and the write, the read, mutate
+    and write are repeated after a short random delay, up to max_attempts times after
+    which TriggerVersionConflict is raised. mutate may therefore be called more than
+    once, each time on a freshly read trigger. Returns the written trigger, or None if
+    the trigger doesn't exist.
+    """
+    if max_attempts < 1:
+        raise ValueError(f"max_attempts must be at least 1, not {max_attempts}")
+    for attempt in range(max_attempts):
+        latest = _read_trigger(trigger_id)
+        if latest is None:
+            return None
+        mutate(latest)
+        try:
+            _conditional_put_trigger(latest)
+        except TriggerVersionConflict as conflict:
+            log.info(
+                f"trigger_id={trigger_id} Conflicting write on attempt {attempt + 1} "
+                f"of {max_attempts}"
+            )
+            last_conflict = conflict
+            if attempt + 1 < max_attempts:
+                time.sleep(random.uniform(0, _RETRY_BASE_DELAY_SECONDS * 2**attempt))
+            continue
+        _cache_trigger(latest)
+        return latest
+    raise last_conflict
+
+
+def update_trigger(
+    trigger: InternalTrigger,
+    merge_fields: t.Iterable[str] | None = None,
+    max_attempts: int = 5,
+) -> InternalTrigger:
+    """Write trigger, provided that no one else has written it since it was read.
+
+    If another write has happened, and merge_fields is None, TriggerVersionConflict is
+    raised. When merge_fields is provided, those fields are copied from trigger onto the
+    latest stored version of the trigger, and that is written instead (see
+    update_trigger_with_retry). The passed trigger is then updated in place to match
+    what was written, so fields updated by the other writer are reflected in it.
+    """
+    try:
+        _conditional_put_trigger(trigger)
+    except TriggerVersionConflict:
+        if merge_fields is None:
+            raise
+        merge_fields = tuple(merge_fields)
+
+        def _merge(latest: InternalTrigger) -> None:
+            for field in merge_fields:
+                setattr(latest, field, copy.deepcopy(getattr(trigger, field)))
+
+        merged = update_trigger_with_retry(
+            trigger.trigger_id, _merge, max_attempts=max_attempts
+        )
+        if merged is None:
+            log.warning(f"trigger_id={trigger.trigger_id} Not updated, it was removed")
+            return trigger
+        for field in merged.__fields__:
+            setattr(trigger, field, getattr(merged, field))
+    _cache_trigger(trigger)
     return trigger
 
 
-def remove_trigger(trigger_id: str) -> InternalTrigger:
-    table = get_table(
-        settings.dynamo_table_name,
-    )
-    del_resp = table.delete_item(
-        Key={
-            "trigger_id": trigger_id,
-        },
-        ReturnValues="ALL_OLD",
-    )
-    item = del_resp.get("Attributes")
-    item = _from_dynamo_dict(item)
-    return InternalTrigger(**item)
+def remove_trigger(trigger_id: str) -> InternalTrigger | None:
+    _trigger_cache.pop(trigger_id)
+    return _backend.delete(trigger_id)
+
+
+def remove_triggers(trigger_ids: t.Iterable[str]) -> None:
+    trigger_ids = list(trigger_ids)
+    for trigger_id in trigger_ids:
+        _trigger_cache.pop(trigger_id)
+    _backend.delete_many(trigger_ids)
 
 
 def enum_triggers(**kwargs) -> list[InternalTrigger]:
+    """Return all triggers where each of the kwargs properties match. When one of the
+    properties is indexed (e.g. state), an index query is used rather than a scan.
     """
-    This is probably really inefficient
-    """
-    table = get_table(
-        settings.dynamo_table_name,
-    )
-    filter_expression = None
-    for attr_name, val in kwargs.items():
-        this_filter_expression = Attr(attr_name).eq(val)
-        if filter_expression is None:
-            filter_expression = this_filter_expression
-        else:
-            filter_expression = filter_expression & this_filter_expression
     try:
-        response = table.scan(FilterExpression=filter_expression)
-        items = response.get("Items", [])
-        ret_items = [InternalTrigger(**_from_dynamo_dict(i)) for i in items]
+        ret_items = _backend.query([kwargs])
     except Exception as e:
-        log.warning(f"Scan on filter {filter_expression} returned error {e}, {type(e)}")
+        log.warning(f"Query on {kwargs} returned error {e}, {type(e)}")
         ret_items = []
     return ret_items
 
 
 def init_persistence() -> None:
-    if settings.create_dynamo_table:
-        create_table(
-            table_name=settings.dynamo_table_name,
-            key_schema=_TRIGGER_KEY_SCHEMA,
-            attribute_definitions=_TRIGGER_ATTRIBUTE_DEFINITIONS,
-        )
+    _backend.init(create=settings.create_dynamo_table)
+    _key_value_store.init(create=settings.create_dynamo_table)
@@ -0,0 +1,252 @@
+"""
+Retries and circuit breakers for outbound HTTP requests. request() retries failed
+requests which are safe to repeat, with jittered exponential backoff or the delay
+requested by a Retry-After header. Each host has a circuit breaker which opens after
+repeated failures, so calls to a host which is down fail immediately (with
+CircuitOpenError) until it has had time to recover.
+"""
+
+import asyncio
+import logging
+import random
+import time
+import typing as t
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientResponse
+
+from braid_triggers.aiohttp_session import get_session
+from braid_triggers.jsoncodec import dumps
+from braid_triggers.metrics import counter, register_gauge
+from braid_triggers.settings import get_settings
+
+log = logging.getLogger(__name__)
+
+_IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+_retries = counter("http.retries", "Outbound HTTP requests retried")
+_short_circuited = counter(
+    "http.short_circuited", "Outbound HTTP requests rejected by an open circuit"
+)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_after: float):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(
+            f"Requests to {host} are suspended for {retry_after:.1f}s after repeated "
+            "failures"
+        )
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 10.0
+    # A Retry-After longer than this is not waited for; the response is returned
+    max_retry_after: float = 60.0
+    retry_statuses: frozenset[int] = frozenset([429, 500, 502, 503, 504])
+
+    def backoff(self, attempt: int) -> float:
+        """The delay before retry number attempt (starting at 1), with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures. While open, allow() returns
+    False until reset_timeout has passed, after which one trial request is allowed
+    (half-open): its success closes the circuit and its failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        timer: t.Callable[[], float] = time.monotonic,
+    ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.timer() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the circuit allows a request, 0 if it does now"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.timer())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_progress:
+            self._trial_in_progress = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+
+    def cancel_trial(self) -> None:
+        """Allow another trial request when one was abandoned without a result"""
+        self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_progress or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                log.warning(
+                    f"Opening circuit for {self.host} after {self.failures} failures"
+                )
+            self.opened_at = self.timer()
+        self._trial_in_progress = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_default_policy: RetryPolicy | None = None
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    host = _host(url)
+    breaker = _breakers.get(host)
+    if breaker is None:
+        settings = get_settings()
+        breaker = CircuitBreaker(
+            host,
+            failure_threshold=settings.circuit_failure_threshold,
+            reset_timeout=settings.circuit_reset_seconds,
+        )
+        _breakers[host] = breaker
+    return breaker
+
+
+def default_policy() -> RetryPolicy:
+    global _default_policy
+    if _default_policy is None:
+        settings = get_settings()
+        _default_policy = RetryPolicy(
+            max_attempts=settings.http_retry_attempts,
+            base_delay=settings.http_retry_base_delay_seconds,
+            max_delay=settings.http_retry_max_delay_seconds,
+        )
+    return _default_policy
+
+
+def _open_circuits() -> dict[str, t.Any]:
+    return {
+        host: {"state": breaker.state, "retry_after": round(breaker.retry_after, 1)}
+        for host, breaker in _breakers.items()
+        if breaker.state != "closed"
+    }
+
+
+register_gauge("http.open_circuits", _open_circuits)
+
+
+def retry_after_seconds(resp: ClientResponse) -> float | None:
+    """The delay requested by the response's Retry-After header, if any"""
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+async def request(
+    method: str,
+    url: str,
+    *,
+    idempotent: bool | None = None,
+    policy: RetryPolicy | None = None,
+    **kwargs,
+) -> ClientResponse:
+    """Make a request via the shared session. A json body is encoded with the fast JSON
+    codec. Requests are retried on connection errors, timeouts and the policy's
+    retry_statuses only when idempotent, which defaults to True for methods which are
+    idempotent by definition. When retries are exhausted, the last response is returned
+    or the last exception raised. Server errors, connection errors and timeouts count as
+    failures of the host's circuit breaker. Raises CircuitOpenError if the circuit for
+    the host is open.
+    """
+    method = method.upper()
+    if "json" in kwargs:
+        kwargs["data"] = dumps(kwargs.pop("json"))
+        kwargs["headers"] = {
+            "Content-Type": "application/json",
+            **(kwargs.get("headers") or {}),
+        }
+    if idempotent is None:
+        idempotent = method in _IDEMPOTENT_METHODS
+    if policy is None:
+        policy = default_policy()
+    max_attempts = policy.max_attempts if idempotent else 1
+    breaker = breaker_for(url)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        if not breaker.allow():
+            _short_circuited.inc()
+            raise CircuitOpenError(breaker.host, breaker.retry_after)
+        try:
+            resp = await get_session().request(method, url, **kwargs)
+        except asyncio.CancelledError:
+            breaker.cancel_trial()
+            raise
+        except (ClientError, asyncio.TimeoutError) as e:
+            breaker.record_failure()
+            if attempt >= max_attempts:
+                raise
+            delay = policy.backoff(attempt)
+            log.info(
+                f"{method} {url} failed due to {repr(e)}, retrying in {delay:.2f}s"
+            )
+        else:
+            if resp.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if resp.status not in policy.retry_statuses or attempt >= max_attempts:
+                return resp
+            delay = retry_after_seconds(resp)
+            if delay is None:
+                delay = policy.backoff(attempt)
+            elif delay > policy.max_retry_after:
+                return resp
+            resp.release()
+            log.info(f"{method} {url} returned {resp.status}, retrying in {delay:.2f}s")
+        _retries.inc()
+        await asyncio.sleep(delay)
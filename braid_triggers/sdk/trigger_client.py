@@ -1,6 +1,8 @@
+import json
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from cachetools import LRUCache
 from globus_automate_client import ActionClient
 from globus_sdk import (
     AccessTokenAuthorizer,
@@ -8,7 +10,7 @@ from globus_sdk import (
     GlobusHTTPResponse,
     RefreshTokenAuthorizer,
 )
-from globus_sdk.base import BaseClient
+from globus_sdk.base import BaseClient, slash_join
 
 from .auth import get_authorizer_for_scope
 
@@ -19,18 +21,61 @@ MANAGE_TRIGGERS_SCOPE = (
     "/manage_triggers"
 )
 
+# The path and params of a GET
+_CacheKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+
+class TriggerResponse(GlobusHTTPResponse):
+    """A response which also provides its HTTP headers, as this version of the SDK
+    doesn't
+    """
+
+    def __init__(self, http_response, client=None) -> None:
+        super().__init__(http_response, client=client)
+        self.headers = http_response.headers
+
 
 class TriggerClient(BaseClient):
+    default_response_class = TriggerResponse
     allowed_authorizer_types = (
         AccessTokenAuthorizer,
         RefreshTokenAuthorizer,
         ClientCredentialsAuthorizer,
     )
 
-    def __init__(self, client_id: str, *args, **kwargs) -> None:
+    def __init__(
+        self, client_id: str, *args, response_cache_size: int = 1000, **kwargs
+    ) -> None:
         self.client_id = client_id
+        # Responses with an ETag, by path and params, which are revalidated rather than
+        # fetched again. A size of 0 disables caching.
+        self._response_cache: Optional[LRUCache[_CacheKey, TriggerResponse]] = None
+        if response_cache_size > 0:
+            self._response_cache = LRUCache(maxsize=response_cache_size)
         super().__init__(*args, **kwargs)
 
+    def _cached_get(
+        self, path: str, params: Optional[Dict[str, Any]] = None
+    ) -> TriggerResponse:
+        """GET path, sending the ETag of a previous response so that the service can
+        reply that it is unchanged rather than sending it again
+        """
+        if self._response_cache is None:
+            return self.get(path, params=params)
+        key = (path, tuple(sorted((params or {}).items())))
+        cached = self._response_cache.get(key)
+        headers = None
+        if cached is not None:
+            headers = {"If-None-Match": cached.headers["ETag"]}
+        resp = self.get(path, params=params, headers=headers)
+        if resp.http_status == 304 and cached is not None:
+            return cached
+        if resp.headers.get("ETag"):
+            self._response_cache[key] = resp
+        else:
+            self._response_cache.pop(key, None)
+        return resp
+
     def create(
         self,
         queue_id: str,
@@ -38,24 +83,52 @@ class TriggerClient(BaseClient):
         event_template: Dict[str, Any],
         event_filter: str = "True",
         action_scope: Optional[str] = None,
+        event_batching: Optional[Dict[str, Any]] = None,
+        event_debounce: Optional[Dict[str, Any]] = None,
     ) -> GlobusHTTPResponse:
+        """When event_batching is given, with any of ``max_events``, ``max_bytes`` and
+        ``max_wait_seconds``, one action is run per batch of events rather than per
+        event. When event_debounce is given, with ``quiet_seconds`` and optionally
+        ``key`` and ``keep``, only the first or last event of each burst is acted on.
+        """
         body = {
             "queue_id": queue_id,
             "action_url": action_url,
             "event_filter": event_filter,
             "event_template": event_template,
             "action_scope": action_scope,
+            "event_batching": event_batching,
+            "event_debounce": event_debounce,
         }
         path = self.qjoin_path("triggers")
         return self.post(path, body)
 
     def lookup(self, trigger_id: str) -> GlobusHTTPResponse:
         path = self.qjoin_path("triggers", trigger_id)
-        return self.get(path)
+        return self._cached_get(path)
 
-    def list(self) -> GlobusHTTPResponse:
+    def list(
+        self,
+        limit: Optional[int] = None,
+        marker: Optional[str] = None,
+        state: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> GlobusHTTPResponse:
+        """List one page of the caller's Triggers. The response contains a ``marker``
+        which can be passed back in to retrieve the next page when ``has_next_page``
+        is true.
+        """
+        params: Dict[str, Any] = {}
+        if limit is not None:
+            params["limit"] = limit
+        if marker is not None:
+            params["marker"] = marker
+        if state is not None:
+            params["state"] = state
+        if fields is not None:
+            params["fields"] = ",".join(fields)
         path = self.qjoin_path("triggers")
-        return self.get(path)
+        return self._cached_get(path, params=params)
 
     def enable(self, trigger_id: str, scope: Optional[str]) -> GlobusHTTPResponse:
         if scope is None:
@@ -69,15 +142,137 @@ class TriggerClient(BaseClient):
         self.authorizer = old_auth
         return r
 
+    def batch(
+        self,
+        operation: str,
+        trigger_ids: Optional[Iterable[str]] = None,
+        selector: Optional[Dict[str, Any]] = None,
+    ) -> GlobusHTTPResponse:
+        """Perform operation (get, enable, disable or delete) on many Triggers, given by
+        id or by a selector with any of ``created_by``, ``state`` and ``queue_id``. The
+        response contains a result for each Trigger.
+        """
+        body: Dict[str, Any] = {"operation": operation}
+        if trigger_ids is not None:
+            body["trigger_ids"] = list(trigger_ids)
+        if selector is not None:
+            body["selector"] = selector
+        return self.post("triggers/batch", body)
+
+    def enable_many(
+        self,
+        trigger_ids: Optional[Iterable[str]] = None,
+        selector: Optional[Dict[str, Any]] = None,
+        scope: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Enable many Triggers, returning the result for each. Enabling needs a token
+        for the scope of each Trigger, so without a scope the Triggers are first read
+        and one request is made for each distinct scope among them.
+        """
+        results: List[Dict[str, Any]] = []
+        if scope is not None:
+            batches = [(scope, trigger_ids, selector)]
+        else:
+            ids_by_scope: Dict[str, List[str]] = {}
+            for result in self.batch("get", trigger_ids, selector).data["results"]:
+                if result["status"] == 200:
+                    trigger_scope = result["trigger"]["globus_auth_scope"]
+                    ids_by_scope.setdefault(trigger_scope, []).append(
+                        result["trigger_id"]
+                    )
+                else:
+                    results.append(result)
+            batches = [(s, ids, None) for s, ids in ids_by_scope.items()]
+        old_auth = self.authorizer
+        try:
+            for batch_scope, batch_ids, batch_selector in batches:
+                self.authorizer = get_authorizer_for_scope(
+                    batch_scope, client_id=self.client_id
+                )
+                resp = self.batch("enable", batch_ids, batch_selector)
+                results.extend(resp.data["results"])
+        finally:
+            self.authorizer = old_auth
+        return results
+
     def disable(self, trigger_id: str) -> GlobusHTTPResponse:
         path = self.qjoin_path("triggers", trigger_id, "disable")
         return self.post(path)
 
+    def send_event(
+        self,
+        trigger_id: str,
+        body: Dict[str, Any],
+        event_id: Optional[str] = None,
+        durable: bool = False,
+    ) -> GlobusHTTPResponse:
+        """Send an event directly to an enabled Trigger rather than via its queue"""
+        params: Dict[str, Any] = {"durable": durable}
+        if event_id is not None:
+            params["event_id"] = event_id
+        path = self.qjoin_path("triggers", trigger_id, "event")
+        return self.post(path, body, params=params)
+
+    def send_events(
+        self,
+        events: Iterable[Dict[str, Any]],
+        trigger_id: Optional[str] = None,
+        durable: bool = False,
+    ) -> GlobusHTTPResponse:
+        """Send many events in one request. Each event is a dict with a ``body`` and
+        optionally a ``trigger_id`` (defaulting to trigger_id) and ``event_id``. The
+        response contains the result of each event in order.
+        """
+        params: Dict[str, Any] = {"durable": durable}
+        if trigger_id is not None:
+            params["trigger_id"] = trigger_id
+        return self.post("events", list(events), params=params)
+
+    def watch(
+        self, trigger_ids: Optional[Iterable[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield the activity of the given Triggers, or of all the caller's Triggers, as
+        it happens. Each item has the ``kind`` of activity and its ``data``. This does
+        not return until the connection is closed.
+        """
+        headers = dict(self._headers)
+        headers["Accept"] = "text/event-stream"
+        if self.authorizer is not None:
+            self.authorizer.set_authorization_header(headers)
+        params = {"trigger_id": list(trigger_ids)} if trigger_ids else None
+        with self._session.get(
+            slash_join(self.base_url, "activity"),
+            params=params,
+            headers=headers,
+            verify=self._verify,
+            # The stream is idle until there is activity
+            timeout=(self._http_timeout, None),
+            stream=True,
+        ) as resp:
+            if resp.status_code >= 400:
+                raise self.error_class(resp)
+            yield from _parse_server_sent_events(resp.iter_lines(decode_unicode=True))
+
     def remove(self, trigger_id: str) -> GlobusHTTPResponse:
         path = self.qjoin_path("triggers", trigger_id)
         return self.delete(path)
 
 
+def _parse_server_sent_events(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    kind = "message"
+    data_lines = []
+    for line in lines:
+        if not line:
+            if data_lines:
+                yield {"kind": kind, "data": json.loads("\n".join(data_lines))}
+            kind, data_lines = "message", []
+        elif line.startswith("event:"):
+            kind = line.removeprefix("event:").strip()
+        elif line.startswith("data:"):
+            data_lines.append(line.removeprefix("data:").strip())
+        # Other lines, such as comments, are ignored
+
+
 def create_trigger_client(client_id: str, base_url: str = BASE_URL) -> TriggerClient:
     authorizer = get_authorizer_for_scope(MANAGE_TRIGGERS_SCOPE, client_id=client_id)
 
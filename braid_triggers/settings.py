@@ -23,8 +23,98 @@ class Settings(AWSSettings):
     )
     log_level: str = "info"
     log_format: t.Literal["json", "console"] = "json"
+    # Where triggers are stored. memory is only suitable for tests and development and
+    # sqlite for a single service instance.
+    persistence_backend: t.Literal["dynamo", "memory", "sqlite"] = "dynamo"
     dynamo_table_name: str = Field("NOT_SET", env="TRIGGERS_NAME")
     create_dynamo_table: bool = False
+    # Table for other shared state such as cached lookups. Defaults to the trigger
+    # table name with a _kv suffix.
+    dynamo_kv_table_name: str | None = None
+    sqlite_path: str = "triggers.db"
+    # In-process cache of trigger records shared by the API and pollers
+    trigger_cache_size: int = 1000
+    trigger_cache_ttl_seconds: float = 5.0
+    # Large trigger attributes (templates, events, status details) are stored
+    # compressed when their JSON form is at least this size. None disables compression.
+    # zstd requires the zstandard package to be installed.
+    compression_threshold_bytes: int | None = 4096
+    compression_algorithm: t.Literal["zlib", "zstd"] = "zlib"
+    compression_level: int = 6
+    # The connection pool shared by all outbound HTTP requests. With http_warm_up,
+    # connections to the Auth, Queues and enabled triggers' action hosts are opened at
+    # startup.
+    http_pool_size: int = 200
+    http_pool_size_per_host: int = 50
+    http_keepalive_seconds: float = 60.0
+    http_dns_cache_ttl_seconds: int = 300
+    http_timeout_seconds: float = 60.0
+    http_warm_up: bool = True
+    # Retries of failed outbound requests which are safe to repeat, and the circuit
+    # breakers which suspend requests to a host after consecutive failures
+    http_retry_attempts: int = 3
+    http_retry_base_delay_seconds: float = 0.5
+    http_retry_max_delay_seconds: float = 10.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30.0
+    # Cache of bearer token introspection results. Entries never outlive the token, and
+    # inactive tokens are remembered for the shorter negative ttl.
+    introspection_cache_size: int = 10000
+    introspection_cache_ttl_seconds: float = 300.0
+    introspection_negative_ttl_seconds: float = 10.0
+    # Cache of dependent token exchange results, keyed by a hash of the bearer token.
+    # Entries are also limited by the lifetime of the dependent tokens.
+    dependent_token_cache_size: int = 1000
+    dependent_token_cache_ttl_seconds: float = 3600.0
+    # Dependent tokens of running triggers are refreshed in the background this long
+    # before they expire, less a random jitter of up to token_refresh_jitter_seconds, with
+    # at most token_refresh_rate_per_second refreshes started per second
+    token_refresh_lead_seconds: float = 900.0
+    token_refresh_jitter_seconds: float = 120.0
+    token_refresh_rate_per_second: float = 5.0
+    # Tokens obtained by refreshing, kept in memory for the other triggers and tasks
+    # needing them. Entries are also limited by the lifetime of the tokens.
+    refreshed_token_cache_size: int = 10000
+    refreshed_token_cache_ttl_seconds: float = 3600.0
+    # Share the dependent tokens of all the triggers of an identity, so that they are
+    # refreshed and stored once. When False, each trigger keeps its own tokens.
+    token_pool_enabled: bool = True
+    # Cache of action provider introspection documents, keyed by the provider's URL.
+    # Failed introspections are remembered for the (shorter) error ttl.
+    action_provider_cache_size: int = 1000
+    action_provider_cache_ttl_seconds: float = 3600.0
+    action_provider_error_ttl_seconds: float = 30.0
+    action_provider_timeout_seconds: float = 10.0
+    # Resolved scopes are shared between instances via the key-value store. Scope
+    # strings unknown to Auth are remembered for the (shorter) negative ttl. Up to
+    # scope_id_cache_size scope ids are also kept in memory.
+    scope_cache_ttl_seconds: float = 12 * 60 * 60
+    scope_cache_negative_ttl_seconds: float = 300.0
+    scope_id_cache_size: int = 1000
+
+    # Events sent directly to triggers
+    event_buffer_size: int = 1000
+    event_retention_seconds: float = 86400
+    bulk_events_max_count: int = 10000
+
+    # Each trigger skips events with the same event_id as one it has already processed.
+    # The ids of its event_dedup_recent_size most recent events are remembered exactly,
+    # and older ones in Bloom filters holding event_dedup_filter_capacity ids each with
+    # a false positive rate of event_dedup_error_rate. The ids are checkpointed to the
+    # key-value store at most every event_dedup_checkpoint_seconds.
+    event_dedup_enabled: bool = True
+    event_dedup_recent_size: int = 1000
+    event_dedup_filter_capacity: int = 10000
+    event_dedup_error_rate: float = 1e-6
+    event_dedup_checkpoint_seconds: float = 5.0
+    event_dedup_retention_seconds: float = 7 * 24 * 60 * 60
+
+    # Batch trigger management
+    batch_max_triggers: int = 1000
+
+    # Activity streams
+    activity_buffer_size: int = 1000
+    activity_keepalive_seconds: float = 15
 
     class Config:
         environment = SERVICE_ENVIRONMENT
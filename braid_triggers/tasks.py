@@ -7,23 +7,55 @@ from collections import defaultdict
 from dataclasses import dataclass
 from typing import Any, Dict, Iterable, List, Optional, Set, Union
 
+from aiohttp import ClientError
 from fastapi import HTTPException
 
-from braid_triggers.aiohttp_session import aio_session
-from braid_triggers.auth_utils import get_refreshed_access_token_for_scope
+from braid_triggers.activity import (
+    ACTION_STARTED_ACTIVITY,
+    ACTION_STATUS_ACTIVITY,
+    EVENT_RECEIVED_ACTIVITY,
+    FILTER_EVALUATED_ACTIVITY,
+    TRIGGER_STATE_ACTIVITY,
+    broker,
+)
+from braid_triggers.aiohttp_session import read_json
+from braid_triggers.auth_utils import (
+    get_refreshed_access_token_for_scope,
+    read_token_pool,
+    refresh_pooled_token,
+    refresh_token_for_scope,
+    token_owner,
+)
+from braid_triggers.batching import EventBatcher, EventNames, batch_request_id
+from braid_triggers.debounce import Debouncer
+from braid_triggers.dedup import SeenEvents
+from braid_triggers.event_buffer import EventBuffer
 from braid_triggers.expressions import eval_expressions
+from braid_triggers.jsoncodec import dumps
+from braid_triggers.metrics import counter
 from braid_triggers.models import (
     ActionStatus,
     ActionStatusValue,
     Event,
     InternalTrigger,
     ResponseTrigger,
+    Token,
     TriggerState,
 )
-from braid_triggers.persistence import remove_trigger, update_trigger
+from braid_triggers.persistence import (
+    key_value_store,
+    lookup_trigger_cached,
+    remove_trigger,
+    update_trigger,
+)
+from braid_triggers.resilience import CircuitOpenError, request
+from braid_triggers.settings import get_settings
+from braid_triggers.token_refresh import TokenRefreshScheduler
 
 log = logging.getLogger(__name__)
 
+QUEUES_API_URL = "https://queues.api.globus.org"
+
 QUEUES_RECEIVE_SCOPE = (
     "https://auth.globus.org/scopes/3170bf0b-6789-4285-9aba-8b7875be7cbc/receive"
 )
@@ -33,6 +65,17 @@ _LOCAL_FAILURE_ACTION_ID = "trigger_action_failure"
 _MAX_POLL_TIME = 30.0
 _MIN_POLL_TIME = 1.0
 
+# The fields of a trigger which are maintained by its poller. If a write by the poller
+# conflicts with another write (e.g. an enable via the API), these fields are merged on
+# to the latest version of the trigger rather than overwriting the other changes.
+_POLLER_FIELDS = (
+    "event_count",
+    "last_event",
+    "last_action_status",
+    "last_action_statuses",
+    "last_error_action_status",
+)
+
 
 # The state of the reaper task which can be considered a proxy for the state of all
 # asynch tasks. The first item in the list is the state of async polling and the second
@@ -40,6 +83,9 @@ _MIN_POLL_TIME = 1.0
 # including the reaper, should exit.
 reaper_state: List[Union[bool, asyncio.Task]] = [False, None]
 
+# Refreshes the tokens of running triggers in the background, created by init_polling()
+token_refresher: Optional[TokenRefreshScheduler] = None
+
 
 @dataclass
 class TriggerStateRecord:
@@ -51,6 +97,21 @@ _internal_trigger_states: Dict[str, TriggerStateRecord] = defaultdict(
     lambda: TriggerStateRecord(TriggerState.PENDING)
 )
 
+# Events sent directly to triggers with a running poller, by trigger_id
+_event_buffers: Dict[str, EventBuffer] = {}
+
+# Durable events are stored in the key-value store until processed, in a namespace per
+# trigger
+_EVENTS_NAMESPACE_PREFIX = "trigger_events:"
+
+# Checkpoints of the ids of the events seen by each trigger, keyed by trigger_id
+_SEEN_EVENTS_NAMESPACE = "trigger_seen_events"
+
+_duplicates_suppressed = counter(
+    "events.duplicates_suppressed",
+    "Events not processed because their trigger already processed their event_id",
+)
+
 
 def _get_trigger_state_record(
     trigger_id: str, initial_value: TriggerState = TriggerState.PENDING
@@ -75,6 +136,10 @@ def set_trigger_state(trigger_id: str, state: TriggerState) -> TriggerState:
     return r
 
 
+# Errors from outbound requests which leave the trigger running
+_REQUEST_ERRORS = (CircuitOpenError, ClientError, asyncio.TimeoutError)
+
+
 def _error_action_status(
     msg: str, action_id: str = _LOCAL_FAILURE_ACTION_ID
 ) -> ActionStatus:
@@ -86,6 +151,10 @@ def _error_action_status(
     )
 
 
+def _publish(trigger: InternalTrigger, kind: str, **details) -> None:
+    broker.publish(trigger.trigger_id, trigger.created_by, kind, **details)
+
+
 async def auth_header_for_scope(scope: str, trigger: InternalTrigger) -> Dict[str, Any]:
     access_token = await get_refreshed_access_token_for_scope(trigger, scope)
     if access_token is None:
@@ -105,7 +174,7 @@ async def check_action_result(
 ) -> ActionStatus:
     log.info(f"Action Result for trigger_id={trigger.trigger_id}: {action_resp}")
     if 200 <= action_resp.status < 300:
-        action_status_dict = await action_resp.json()
+        action_status_dict = await read_json(action_resp)
         # Workaround for missing creator_id field in flows
         if "creator_id" not in action_status_dict:
             action_status_dict["creator_id"] = trigger.created_by
@@ -114,11 +183,22 @@ async def check_action_result(
             auth_header = await auth_header_for_scope(
                 str(trigger.action_scope), trigger
             )
-            release_resp = await aio_session.post(
-                f"{trigger.action_url}/{action_id}/release", headers=auth_header
-            )
-            if 200 <= release_resp.status < 300:
-                action_status_dict = await release_resp.json()
+            try:
+                # Releasing an action more than once is harmless
+                release_resp = await request(
+                    "POST",
+                    f"{trigger.action_url}/{action_id}/release",
+                    idempotent=True,
+                    headers=auth_header,
+                )
+            except _REQUEST_ERRORS as e:
+                log.warning(
+                    f"trigger_id={trigger.trigger_id} Unable to release action "
+                    f"{action_id}: {repr(e)}"
+                )
+            else:
+                if 200 <= release_resp.status < 300:
+                    action_status_dict = await read_json(release_resp)
         action_status = ActionStatus(**action_status_dict)
     else:
         action_status = _error_action_status(
@@ -128,10 +208,153 @@ async def check_action_result(
     return action_status
 
 
+async def _run_action(
+    trigger: InternalTrigger, names: EventNames, request_id: str, **activity
+) -> ActionStatus:
+    """Run the trigger's action with its event_template evaluated on names. activity
+    identifies the event(s) the action is for in the activity published.
+    """
+    try:
+        action_body = eval_expressions(trigger.event_template, names)
+    except ValueError as ve:
+        msg = (
+            f"On trigger_id={trigger.trigger_id}: Unable to evaluate expression "
+            f"{trigger.event_template} on values {names} due to {str(ve)}"
+        )
+        log.info(msg)
+        return _error_action_status(msg)
+
+    log.debug(
+        f"Body eval trigger_id={trigger.trigger_id} (action_body):= {(action_body)}"
+    )
+    req_body = {"request_id": request_id, "body": action_body}
+
+    auth_header = await auth_header_for_scope(trigger.action_scope, trigger)
+    try:
+        # The request_id makes a repeated run request return the original action
+        run_resp = await request(
+            "POST",
+            f"{trigger.action_url}/run",
+            idempotent=True,
+            json=req_body,
+            headers=auth_header,
+        )
+    except _REQUEST_ERRORS as e:
+        msg = (
+            f"On trigger_id={trigger.trigger_id}: Unable to run action at "
+            f"{trigger.action_url} due to {repr(e)}"
+        )
+        log.warning(msg)
+        ret_status = _error_action_status(msg)
+    else:
+        ret_status = await check_action_result(run_resp, trigger)
+    _publish(
+        trigger,
+        ACTION_STARTED_ACTIVITY,
+        action_id=ret_status.action_id,
+        status=ret_status.status,
+        **activity,
+    )
+    return ret_status
+
+
+async def _run_batch(
+    trigger: InternalTrigger,
+    events: List[EventNames],
+    tracker: Optional[_EventTracker] = None,
+) -> ActionStatus:
+    """Run the trigger's action for a batch of events. The events are only settled
+    once the action has started.
+    """
+    event_ids = [names["event_id"] for names in events]
+    log.info(
+        f"Running action for batch of {len(events)} events "
+        f"trigger_id={trigger.trigger_id}"
+    )
+    names = {
+        "events": events,
+        "batch_size": len(events),
+        "event_count": trigger.event_count,
+    }
+    action_status = await _run_action(
+        trigger, names, batch_request_id(event_ids), event_ids=event_ids
+    )
+    if tracker is not None:
+        await tracker.finish(event_ids, action_status)
+    return action_status
+
+
+async def _act_on_event(
+    trigger: InternalTrigger,
+    names: EventNames,
+    batcher: Optional[EventBatcher] = None,
+    tracker: Optional[_EventTracker] = None,
+) -> Optional[ActionStatus]:
+    """Run the trigger's action for an event. With a batcher, the event is added to the
+    current batch instead, and the action is only run if that fills the batch.
+    """
+    if batcher is None:
+        event_id = names["event_id"]
+        action_status = await _run_action(trigger, names, event_id, event_id=event_id)
+        if tracker is not None:
+            await tracker.finish([event_id], action_status)
+        return action_status
+    batch = batcher.add(names)
+    if batch is None:
+        return None
+    return await _run_batch(trigger, batch, tracker)
+
+
+def _debounce_event(
+    trigger: InternalTrigger,
+    debouncer: Debouncer[EventNames],
+    names: EventNames,
+    tracker: Optional[_EventTracker] = None,
+) -> Optional[ActionStatus]:
+    """Add an event to the burst for its key. Returns an error status if the key can't
+    be evaluated. The events of a burst are settled once the action for the event it
+    releases has started.
+    """
+    key_expression = trigger.event_debounce.key
+    key = None
+    if key_expression is not None:
+        try:
+            key = eval_expressions({"key.=": key_expression}, names).get("key")
+        except ValueError as ve:
+            msg = (
+                f"On trigger_id={trigger.trigger_id}: Unable to evaluate expression "
+                f"{key_expression} on values {names} due to {str(ve)}"
+            )
+            log.info(msg)
+            if tracker is not None:
+                tracker.release([names["event_id"]])
+            return _error_action_status(msg)
+    # Keys may be any JSON value, including unhashable ones
+    burst_key = dumps(key)
+    superseded = debouncer.add(burst_key, names)
+    if tracker is not None and superseded is not None:
+        tracker.supersede(debouncer.get(burst_key)["event_id"], superseded["event_id"])
+    return None
+
+
 async def process_event(
-    trigger: InternalTrigger, event: Event
+    trigger: InternalTrigger,
+    event: Event,
+    batcher: Optional[EventBatcher] = None,
+    debouncer: Optional[Debouncer[EventNames]] = None,
+    tracker: Optional[_EventTracker] = None,
 ) -> Optional[ActionStatus]:
+    """Act on the event if it passes the trigger's filter. With a debouncer, the event
+    is added to its burst and only acted on by the poller once the burst settles. With a
+    tracker, the event is settled or released according to the outcome.
+    """
     trigger.event_count += 1
+    _publish(
+        trigger,
+        EVENT_RECEIVED_ACTIVITY,
+        event_id=event.event_id,
+        event_count=trigger.event_count,
+    )
 
     log.info(f"Processing message trigger_id={trigger.trigger_id}, event={event}")
     try:
@@ -145,6 +368,11 @@ async def process_event(
             f"{trigger.event_filter} on values {names} due to {str(ve)}"
         )
         log.info(msg)
+        _publish(
+            trigger, FILTER_EVALUATED_ACTIVITY, event_id=event.event_id, error=str(ve)
+        )
+        if tracker is not None:
+            tracker.release([event.event_id])
         return _error_action_status(msg)
 
     log.debug(
@@ -152,74 +380,331 @@ async def process_event(
         f"(trigger.event_filter, filter_val, names):= "
         f"{(trigger.event_filter, filter_val, names)}"
     )
-    ret_status = None
-    if filter_val is True:
-        try:
-            action_body = eval_expressions(trigger.event_template, names)
-        except ValueError as ve:
-            msg = (
-                f"On trigger_id={trigger.trigger_id}: Unable to evaluate expression "
-                f"{trigger.event_template} on values {names} due to {str(ve)}"
+    _publish(
+        trigger,
+        FILTER_EVALUATED_ACTIVITY,
+        event_id=event.event_id,
+        matched=filter_val is True,
+    )
+    if filter_val is not True:
+        if tracker is not None:
+            await tracker.settle([event.event_id])
+        return None
+    if debouncer is not None:
+        return _debounce_event(trigger, debouncer, names, tracker)
+    return await _act_on_event(trigger, names, batcher, tracker)
+
+
+def _events_namespace(trigger_id: str) -> str:
+    return _EVENTS_NAMESPACE_PREFIX + trigger_id
+
+
+def _get_or_create_event_buffer(trigger_id: str) -> EventBuffer:
+    buffer = _event_buffers.get(trigger_id)
+    if buffer is None:
+        buffer = EventBuffer(get_settings().event_buffer_size)
+        _event_buffers[trigger_id] = buffer
+    return buffer
+
+
+def get_event_buffer(trigger_id: str) -> Optional[EventBuffer]:
+    """The buffer of events for the trigger, or None if it isn't running here"""
+    return _event_buffers.get(trigger_id)
+
+
+async def enqueue_event(trigger_id: str, event: Event, durable: bool = False) -> bool:
+    """Buffer event for processing by the trigger's poller, first storing it if durable.
+    Returns False if the trigger's buffer is full. Raises KeyError if the trigger isn't
+    running here.
+    """
+    buffer = _event_buffers[trigger_id]
+    if buffer.full:
+        return False
+    if durable:
+        await asyncio.to_thread(
+            key_value_store().put,
+            _events_namespace(trigger_id),
+            event.event_id,
+            event.dict(),
+            ttl=get_settings().event_retention_seconds,
+        )
+    if not buffer.put(event, durable=durable):
+        # The buffer filled while the event was being stored
+        if durable:
+            await asyncio.to_thread(
+                key_value_store().delete, _events_namespace(trigger_id), event.event_id
             )
-            log.info(msg)
-            return _error_action_status(msg)
+        return False
+    return True
 
-        log.debug(
-            f"Body eval trigger_id={trigger.trigger_id} (action_body):= {(action_body)}"
-        )
-        req_body = {"request_id": event.event_id, "body": action_body}
 
-        auth_header = await auth_header_for_scope(trigger.action_scope, trigger)
-        run_resp = await aio_session.post(
-            f"{trigger.action_url}/run", json=req_body, headers=auth_header
-        )
-        ret_status = await check_action_result(run_resp, trigger)
-    return ret_status
+async def _replay_durable_events(trigger_id: str, buffer: EventBuffer) -> None:
+    """Buffer the stored events of the trigger which were not processed before it was
+    last stopped
+    """
+    stored = await asyncio.to_thread(
+        key_value_store().items, _events_namespace(trigger_id)
+    )
+    buffered_ids = {event.event_id for event in buffer.events()}
+    replayed = 0
+    for event_id, event_dict in stored.items():
+        if event_id not in buffered_ids and buffer.put(
+            Event(**event_dict), durable=True, replayed=True
+        ):
+            replayed += 1
+    if replayed:
+        log.info(f"trigger_id={trigger_id} Replaying {replayed} stored events")
 
 
-async def poll_action_id(trigger: InternalTrigger, action_id: str) -> ActionStatus:
-    auth_header = await auth_header_for_scope(trigger.action_scope, trigger)
-    status_resp = await aio_session.get(
-        f"{trigger.action_url}/{action_id}/status", headers=auth_header
+async def _forget_durable_event(trigger_id: str, event_id: str) -> None:
+    await asyncio.to_thread(
+        key_value_store().delete, _events_namespace(trigger_id), event_id
+    )
+
+
+async def _load_seen_events(trigger_id: str) -> Optional[SeenEvents]:
+    """The ids of the events seen by the trigger as of its last checkpoint, or None if
+    de-duplication is disabled
+    """
+    settings = get_settings()
+    if not settings.event_dedup_enabled:
+        return None
+    sizes = (
+        settings.event_dedup_recent_size,
+        settings.event_dedup_filter_capacity,
+        settings.event_dedup_error_rate,
+    )
+    stored = await asyncio.to_thread(
+        key_value_store().get, _SEEN_EVENTS_NAMESPACE, trigger_id
     )
+    if stored is None:
+        return SeenEvents(*sizes)
+    return SeenEvents.from_dict(stored, *sizes)
+
+
+async def _checkpoint_seen_events(
+    trigger_id: str, seen_events: Optional[SeenEvents]
+) -> None:
+    if seen_events is None or not seen_events.dirty:
+        return
+    checkpoint = seen_events.to_dict()
+    seen_events.dirty = False
+    try:
+        await asyncio.to_thread(
+            key_value_store().put,
+            _SEEN_EVENTS_NAMESPACE,
+            trigger_id,
+            checkpoint,
+            ttl=get_settings().event_dedup_retention_seconds,
+        )
+    except Exception as e:
+        # The ids are kept and checkpointed again next time
+        log.warning(
+            f"trigger_id={trigger_id} Unable to checkpoint seen event ids: {repr(e)}"
+        )
+        seen_events.dirty = True
+
+
+def _action_started(action_status: Optional[ActionStatus]) -> bool:
+    """Whether an action was started, rather than failing before or while starting"""
+    if action_status is None:
+        return False
+    return not (action_status.details or {}).get("trigger_processing_error")
+
+
+class _EventTracker:
+    """The events a poller has accepted and not yet finished with. An event's id is only
+    recorded as seen, and its stored copy forgotten if it is durable, once it is settled:
+    the filter rejected it or its action started. An event whose processing fails is
+    released instead, so that it is processed again if it is sent again, and a stored
+    copy is kept to be replayed when the trigger next starts.
+    """
+
+    def __init__(self, trigger_id: str, seen_events: Optional[SeenEvents]):
+        self.trigger_id = trigger_id
+        # None when de-duplication is disabled
+        self.seen_events = seen_events
+        # The ids of the events accepted and neither settled nor released
+        self._in_flight: Set[str] = set()
+        # The ids of the events in flight which are stored
+        self._durable: Set[str] = set()
+        # The ids of the events superseded in a debounced burst, by the id of the event
+        # the burst releases. They settle or are released along with that event.
+        self._superseded: Dict[str, List[str]] = {}
+
+    def _is_duplicate(self, event_id: str) -> bool:
+        if self.seen_events is None:
+            return False
+        return event_id in self._in_flight or event_id in self.seen_events
+
+    async def accept(
+        self, event: Event, durable: bool = False, replayed: bool = False
+    ) -> bool:
+        """Start tracking event, returning False if it is a duplicate to be skipped.
+        Events replayed from storage are never skipped, as they are only stored until
+        they settle.
+        """
+        event_id = event.event_id
+        if not event_id:
+            return True
+        if not replayed and self._is_duplicate(event_id):
+            _duplicates_suppressed.inc()
+            log.info(
+                f"trigger_id={self.trigger_id} Skipping duplicate event "
+                f"event_id={event_id}"
+            )
+            if durable:
+                if event_id in self._in_flight:
+                    # Forgotten when the event in flight settles
+                    self._durable.add(event_id)
+                else:
+                    await _forget_durable_event(self.trigger_id, event_id)
+            return False
+        self._in_flight.add(event_id)
+        if durable:
+            self._durable.add(event_id)
+        return True
+
+    def supersede(self, kept_id: str, superseded_id: str) -> None:
+        if kept_id == superseded_id:
+            return
+        superseded = self._superseded.pop(superseded_id, [])
+        superseded.append(superseded_id)
+        self._superseded.setdefault(kept_id, []).extend(superseded)
+
+    def _with_superseded(self, event_ids: Iterable[str]) -> List[str]:
+        all_ids = []
+        for event_id in event_ids:
+            all_ids.append(event_id)
+            all_ids.extend(self._superseded.pop(event_id, ()))
+        return all_ids
+
+    async def settle(self, event_ids: Iterable[str]) -> None:
+        for event_id in self._with_superseded(event_ids):
+            self._in_flight.discard(event_id)
+            if self.seen_events is not None and event_id:
+                self.seen_events.add(event_id)
+            if event_id in self._durable:
+                self._durable.discard(event_id)
+                await _forget_durable_event(self.trigger_id, event_id)
+
+    def release(self, event_ids: Iterable[str]) -> None:
+        for event_id in self._with_superseded(event_ids):
+            self._in_flight.discard(event_id)
+            self._durable.discard(event_id)
+
+    async def finish(
+        self, event_ids: Iterable[str], action_status: Optional[ActionStatus]
+    ) -> None:
+        """Settle the events if the action run for them started, else release them"""
+        if _action_started(action_status):
+            await self.settle(event_ids)
+        else:
+            self.release(event_ids)
+
+
+async def poll_action_id(
+    trigger: InternalTrigger, action_id: str
+) -> Optional[ActionStatus]:
+    """Returns None if the status could not be retrieved, so it should be polled again"""
+    auth_header = await auth_header_for_scope(trigger.action_scope, trigger)
+    try:
+        status_resp = await request(
+            "GET", f"{trigger.action_url}/{action_id}/status", headers=auth_header
+        )
+    except _REQUEST_ERRORS as e:
+        log.info(
+            f"trigger_id={trigger.trigger_id} Unable to poll action {action_id}: "
+            f"{repr(e)}"
+        )
+        return None
     return await check_action_result(status_resp, trigger, action_id=action_id)
 
 
 async def poller(trigger: InternalTrigger) -> ResponseTrigger:
+    seen_events: Optional[SeenEvents] = None
     try:
         poll_time = 5.0
         # action_tasks: Set[asyncio.Task] = set()
         # queue_poll_tasks: Set[asyncio.Task] = set()
         outstanding_action_ids: Set[str] = set()
+        # The last known status of each outstanding action, to publish its changes
+        action_states: Dict[str, ActionStatusValue] = {}
         trigger_id = trigger.trigger_id
         trigger_state_rec = _get_trigger_state_record(trigger_id)
+        buffer = _get_or_create_event_buffer(trigger_id)
+        seen_events = await _load_seen_events(trigger_id)
+        tracker = _EventTracker(trigger_id, seen_events)
+        loop = asyncio.get_running_loop()
+        batcher = (
+            EventBatcher(trigger.event_batching, timer=loop.time)
+            if trigger.event_batching is not None
+            else None
+        )
+        debounce = trigger.event_debounce
+        debouncer: Optional[Debouncer[EventNames]] = (
+            Debouncer(debounce.quiet_seconds, debounce.keep, timer=loop.time)
+            if debounce is not None
+            else None
+        )
+        await _replay_durable_events(trigger_id, buffer)
+        _publish(trigger, TRIGGER_STATE_ACTIVITY, state=trigger_state_rec.state)
+        last_poll = last_checkpoint = loop.time()
         # We keep going as long as the trigger is enabled, or if we have actions to
-        # monitor and the trigger hasn't been entirely deleted
+        # monitor or events waiting to be acted on and the trigger hasn't been
+        # entirely deleted
         while (
             reaper_state[0] is True
             and trigger_state_rec.state is TriggerState.ENABLED
             or (
                 trigger_state_rec.state is not TriggerState.DELETING
-                and len(outstanding_action_ids) > 0
+                and (
+                    len(outstanding_action_ids) > 0
+                    or (batcher is not None and len(batcher) > 0)
+                    or (debouncer is not None and len(debouncer) > 0)
+                )
             )
         ):
             queue_id = trigger.queue_id
-            queue_msgs_url = (
-                f"https://queues.api.globus.org/v1/queues/{queue_id}/messages"
-            )
+            queue_msgs_url = f"{QUEUES_API_URL}/v1/queues/{queue_id}/messages"
             if poll_time > _MAX_POLL_TIME:
                 poll_time = _MAX_POLL_TIME
             if poll_time < _MIN_POLL_TIME:
                 poll_time = _MIN_POLL_TIME
             log.debug(f"Polling Wait trigger_id={trigger_id}, poll_time={poll_time}")
-            await asyncio.sleep(poll_time)
-            log.debug(f"Starting Poll trigger_id={trigger_id}")
+            # Events sent directly to the trigger end the wait early, but the queue and
+            # actions are still only polled every poll_time
+            wake_at = last_poll + poll_time
+            for stage in (debouncer, batcher):
+                if stage is not None and stage.deadline is not None:
+                    wake_at = min(wake_at, stage.deadline)
+            await buffer.wait(max(0.0, wake_at - loop.time()))
+            poll_due = loop.time() >= last_poll + poll_time
+            if poll_due:
+                last_poll = loop.time()
+                log.debug(f"Starting Poll trigger_id={trigger_id}")
 
             event_processing_tasks: Set[asyncio.Task] = set()
-            action_status_tasks: Set[asyncio.Task] = set()
+            # The action_id polled by each task
+            action_status_tasks: Dict[asyncio.Task, str] = {}
+
+            for buffered in buffer.drain():
+                if not await tracker.accept(
+                    buffered.event, buffered.durable, buffered.replayed
+                ):
+                    continue
+                trigger.last_event = buffered.event
+                event_processing_tasks.add(
+                    asyncio.create_task(
+                        process_event(
+                            trigger, buffered.event, batcher, debouncer, tracker
+                        )
+                    )
+                )
 
             if (
-                trigger_state_rec.state is TriggerState.ENABLED
+                poll_due
+                and trigger_state_rec.state is TriggerState.ENABLED
                 and trigger.queue_id is not None
             ):
                 # Do this each time to allow for refresh
@@ -231,62 +716,113 @@ async def poller(trigger: InternalTrigger) -> ResponseTrigger:
                         "Unable to get access token for queues access"
                     )
                     trigger.state = TriggerState.PENDING
-                msgs_response = await aio_session.get(
-                    queue_msgs_url + "?max_messages=10",
-                    headers=queues_auth_header,
-                )
-                if 200 <= msgs_response.status < 300:
-                    msgs_json = await msgs_response.json()
-                    msg_list = msgs_json.get("data", [])
-                    log.debug(
-                        f"Poller trigger_id={trigger_id}, queue_id={queue_id}"
-                        f"received {len(msg_list)} messages"
+                try:
+                    msgs_response = await request(
+                        "GET",
+                        queue_msgs_url + "?max_messages=10",
+                        headers=queues_auth_header,
                     )
-                    for msg in msg_list:
-                        event = Event.from_queue_msg(msg)
-                        trigger.last_event = event
-                        process_event_task = asyncio.create_task(
-                            process_event(trigger, event)
-                        )
-                        event_processing_tasks.add(process_event_task)
-                        msg_delete = await aio_session.delete(
-                            queue_msgs_url,
-                            json={
-                                "data": [{"receipt_handle": msg.get("receipt_handle")}]
-                            },
-                            headers=queues_auth_header,
-                        )
-                        if 200 <= msg_delete.status < 300:
-                            pass
-                else:
-                    text = await msgs_response.text()
-                    log.debug(
-                        f"trigger_id={trigger_id} Got unexpected response from "
-                        f"queue {queue_id}: "
-                        f"{msgs_response} containing {text}"
+                except CircuitOpenError as e:
+                    # Don't poll again before the circuit to Queues may close
+                    log.info(f"trigger_id={trigger_id} Skipping queue poll: {str(e)}")
+                    poll_time = max(poll_time, e.retry_after)
+                except (ClientError, asyncio.TimeoutError) as e:
+                    log.warning(
+                        f"trigger_id={trigger_id} Unable to read from queue "
+                        f"{queue_id}: {repr(e)}"
                     )
                     trigger.last_action_status = _error_action_status(
-                        f"Error reading from queue: {text}"
+                        f"Error reading from queue: {repr(e)}"
                     )
-                    update_trigger(trigger)
+                    update_trigger(trigger, merge_fields=_POLLER_FIELDS)
+                else:
+                    if 200 <= msgs_response.status < 300:
+                        msgs_json = await read_json(msgs_response)
+                        msg_list = msgs_json.get("data", [])
+                        log.debug(
+                            f"Poller trigger_id={trigger_id}, queue_id={queue_id}"
+                            f"received {len(msg_list)} messages"
+                        )
+                        for msg in msg_list:
+                            event = Event.from_queue_msg(msg)
+                            # Redelivered messages are still deleted below
+                            if await tracker.accept(event):
+                                trigger.last_event = event
+                                event_processing_tasks.add(
+                                    asyncio.create_task(
+                                        process_event(
+                                            trigger, event, batcher, debouncer, tracker
+                                        )
+                                    )
+                                )
+                            receipt = {"receipt_handle": msg.get("receipt_handle")}
+                            try:
+                                await request(
+                                    "DELETE",
+                                    queue_msgs_url,
+                                    json={"data": [receipt]},
+                                    headers=queues_auth_header,
+                                )
+                            except _REQUEST_ERRORS as e:
+                                log.warning(
+                                    f"trigger_id={trigger_id} Unable to delete message "
+                                    f"from queue {queue_id}: {repr(e)}"
+                                )
+                    else:
+                        text = await msgs_response.text()
+                        log.debug(
+                            f"trigger_id={trigger_id} Got unexpected response from "
+                            f"queue {queue_id}: "
+                            f"{msgs_response} containing {text}"
+                        )
+                        trigger.last_action_status = _error_action_status(
+                            f"Error reading from queue: {text}"
+                        )
+                        update_trigger(trigger, merge_fields=_POLLER_FIELDS)
+
+            for names in debouncer.pop_due() if debouncer is not None else ():
+                event_processing_tasks.add(
+                    asyncio.create_task(_act_on_event(trigger, names, batcher, tracker))
+                )
+            if batcher is not None and batcher.due():
+                event_processing_tasks.add(
+                    asyncio.create_task(_run_batch(trigger, batcher.take(), tracker))
+                )
 
-            for action_id in outstanding_action_ids:
+            for action_id in outstanding_action_ids if poll_due else ():
                 action_status_task = asyncio.create_task(
                     poll_action_id(trigger, action_id)
                 )
-                action_status_tasks.add(action_status_task)
+                action_status_tasks[action_status_task] = action_id
 
             if action_status_tasks or event_processing_tasks:
-                all_tasks = list(action_status_tasks.union(event_processing_tasks))
+                all_tasks = list(action_status_tasks) + list(event_processing_tasks)
                 action_statuses: Iterable[
                     Optional[ActionStatus]
                 ] = await asyncio.gather(*all_tasks)
                 # Reset to just include the active responses
-                outstanding_action_ids = set()
-                for action_status in action_statuses:
-                    if action_status is not None:
-                        if not action_status.is_complete():
-                            outstanding_action_ids.add(action_status.action_id)
+                outstanding_action_ids -= set(action_status_tasks.values())
+                for task, action_status in zip(all_tasks, action_statuses):
+                    if action_status is None and task in action_status_tasks:
+                        # The status couldn't be retrieved, so poll it again
+                        outstanding_action_ids.add(action_status_tasks[task])
+                    elif action_status is not None:
+                        action_id = action_status.action_id
+                        if (
+                            task in action_status_tasks
+                            and action_states.get(action_id) is not action_status.status
+                        ):
+                            _publish(
+                                trigger,
+                                ACTION_STATUS_ACTIVITY,
+                                action_id=action_id,
+                                status=action_status.status,
+                            )
+                        if action_status.is_complete():
+                            action_states.pop(action_id, None)
+                        else:
+                            outstanding_action_ids.add(action_id)
+                            action_states[action_id] = action_status.status
                         trigger.last_action_status = action_status
                         if trigger.last_action_statuses is None:
                             trigger.last_action_statuses = []
@@ -298,19 +834,39 @@ async def poller(trigger: InternalTrigger) -> ResponseTrigger:
                         if action_status.status is ActionStatusValue.FAILED:
                             trigger.last_error_action_status = action_status
 
-                update_trigger(trigger)
-                poll_time = poll_time / 2.0
-            else:
-                poll_time = poll_time * 2.0
+                update_trigger(trigger, merge_fields=_POLLER_FIELDS)
+            checkpoint_interval = get_settings().event_dedup_checkpoint_seconds
+            if loop.time() >= last_checkpoint + checkpoint_interval:
+                last_checkpoint = loop.time()
+                await _checkpoint_seen_events(trigger_id, seen_events)
+            # Only polls adjust the poll time, not events sent directly to the trigger
+            if poll_due:
+                if action_status_tasks or event_processing_tasks:
+                    poll_time = poll_time / 2.0
+                else:
+                    poll_time = poll_time * 2.0
 
     except Exception as e:
         log.error(f"Error on poller for {trigger.trigger_id}: {str(e)}", exc_info=True)
         trigger_state_rec.state = TriggerState.PENDING
     finally:
         log.info(f"Poller for {trigger.trigger_id} exiting")
+        if trigger_state_rec.state is not TriggerState.DELETING:
+            await _checkpoint_seen_events(trigger.trigger_id, seen_events)
+        buffer = _event_buffers.pop(trigger.trigger_id, None)
+        # Durable events are replayed when the trigger is next started
+        dropped = sum(not b.durable for b in buffer.drain()) if buffer else 0
+        if dropped:
+            log.warning(
+                f"trigger_id={trigger.trigger_id} Dropping {dropped} unprocessed "
+                "events sent directly to the trigger"
+            )
+        if token_refresher is not None:
+            token_refresher.untrack(token_owner(trigger))
     # Set final state to match the internal tracking state
     trigger.state = trigger_state_rec.state
-    update_trigger(trigger)
+    update_trigger(trigger, merge_fields=_POLLER_FIELDS + ("state",))
+    _publish(trigger, TRIGGER_STATE_ACTIVITY, state=trigger_state_rec.state)
     return trigger
 
 
@@ -348,18 +904,50 @@ async def reaper(task_queue: asyncio.Queue):
 
 async def start_poller(trigger: InternalTrigger) -> asyncio.Task:
     log.info(f"Starting polling for trigger {trigger.trigger_id}")
+    # Created here so that events may be sent as soon as the trigger is enabled
+    _get_or_create_event_buffer(trigger.trigger_id)
     poll_task = asyncio.create_task(
         poller(trigger), name=f"Poller for {trigger.trigger_id}"
     )
     await _task_queue.put(poll_task)
+    if token_refresher is not None:
+        tokens = dict(trigger.token_set.dependent_tokens)
+        if trigger.token_set.pool_identity is not None:
+            tokens.update(await read_token_pool(trigger.token_set.pool_identity))
+        token_refresher.track(token_owner(trigger), tokens)
     return poll_task
 
 
+async def _refresh_trigger_token(owner: str, scope: str) -> Optional[Token]:
+    # The owner is as returned by token_owner()
+    if owner.startswith("pool:"):
+        return await refresh_pooled_token(owner.removeprefix("pool:"), scope)
+    trigger = await lookup_trigger_cached(owner)
+    if trigger is None or scope not in trigger.token_set.dependent_tokens:
+        return None
+    return await refresh_token_for_scope(trigger, scope)
+
+
 async def init_polling():
+    global token_refresher
+    settings = get_settings()
+    token_refresher = TokenRefreshScheduler(
+        _refresh_trigger_token,
+        lead=settings.token_refresh_lead_seconds,
+        jitter=settings.token_refresh_jitter_seconds,
+        rate=settings.token_refresh_rate_per_second,
+    )
+    token_refresher.start()
     reaper_state[0] = True
     reaper_state[1] = asyncio.create_task(reaper(_task_queue), name="Reaper")
 
 
-async def shutdown_polling():
+async def shutdown_polling(timeout: float = 30.0):
+    if token_refresher is not None:
+        await token_refresher.stop()
     reaper_state[0] = False
-    _ = await asyncio.wait_for(reaper_state[1])
+    if reaper_state[1] is not None:
+        try:
+            _ = await asyncio.wait_for(reaper_state[1], timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"Polling did not stop within {timeout} seconds")
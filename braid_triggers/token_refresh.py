@@ -0,0 +1,158 @@
+"""
+Refreshes the dependent tokens of running triggers ahead of their expiration, so that
+event processing finds a valid token rather than waiting on a refresh grant.
+"""
+
+import asyncio
+import heapq
+import logging
+import random
+import time
+import typing as t
+
+from braid_triggers.models import Token
+
+log = logging.getLogger(__name__)
+
+_TokenKey = tuple[str, str]
+
+# Called with (owner, scope) to refresh and store a token. Returns the new token, or None
+# if the owner or the token no longer exists.
+RefreshFn = t.Callable[[str, str], t.Awaitable[Token | None]]
+
+
+class TokenRefreshScheduler:
+    """Tracks the expiration times of the dependent tokens of each tracked owner (a
+    trigger or a pool of tokens shared by triggers) and calls refresh for each lead
+    seconds before it expires, less a random jitter of up to jitter seconds so that
+    tokens issued together are not all refreshed together. At most rate refreshes are
+    started per second. A failed refresh is retried after retry_delay.
+    """
+
+    def __init__(
+        self,
+        refresh: RefreshFn,
+        *,
+        lead: float = 900.0,
+        jitter: float = 120.0,
+        rate: float = 5.0,
+        retry_delay: float = 60.0,
+        timer: t.Callable[[], float] = time.time,
+    ):
+        self.refresh = refresh
+        self.lead = lead
+        self.jitter = jitter
+        self.rate = rate
+        self.retry_delay = retry_delay
+        self.timer = timer
+        # Heap of (due time, sequence, key). Entries which don't match the due time in
+        # _due are left over from an earlier schedule and are skipped.
+        self._heap: list[tuple[float, int, _TokenKey]] = []
+        self._due: dict[_TokenKey, float] = {}
+        # The number of times each owner is tracked, as triggers may share tokens
+        self._track_counts: dict[str, int] = {}
+        self._seq = 0
+        self._next_start = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._refresh_tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def due_time(self, owner: str, scope: str) -> float | None:
+        return self._due.get((owner, scope))
+
+    def _schedule_at(self, key: _TokenKey, due: float) -> None:
+        self._due[key] = due
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, key))
+        if self._heap[0][2] == key:
+            # The run loop may be sleeping until a later due time
+            self._wakeup.set()
+
+    def schedule(self, owner: str, scope: str, token: Token) -> None:
+        due = token.expiration_time - self.lead - random.uniform(0, self.jitter)
+        self._schedule_at((owner, scope), due)
+
+    def track(self, owner: str, tokens: t.Mapping[str, Token]) -> None:
+        """Schedule refreshes of tokens, a mapping of scope to token, replacing any
+        existing schedule for the same owner and scopes
+        """
+        self._track_counts[owner] = self._track_counts.get(owner, 0) + 1
+        for scope, token in tokens.items():
+            self.schedule(owner, scope, token)
+
+    def untrack(self, owner: str) -> None:
+        """Stop refreshing the owner's tokens once untrack has been called as many times
+        as track
+        """
+        count = self._track_counts.get(owner, 0) - 1
+        if count > 0:
+            self._track_counts[owner] = count
+            return
+        self._track_counts.pop(owner, None)
+        for key in [key for key in self._due if key[0] == owner]:
+            del self._due[key]
+
+    async def _refresh(self, key: _TokenKey) -> None:
+        owner, scope = key
+        try:
+            token = await self.refresh(owner, scope)
+        except Exception as e:
+            log.warning(
+                f"owner={owner} Background refresh of token for scope {scope} "
+                f"failed, retrying in {self.retry_delay}s: {str(e)}"
+            )
+            if key in self._due:
+                self._schedule_at(key, self.timer() + self.retry_delay)
+            return
+        if token is None:
+            self._due.pop(key, None)
+        elif key in self._due:
+            self.schedule(owner, scope, token)
+
+    def _start_refresh(self, key: _TokenKey) -> None:
+        task = asyncio.create_task(self._refresh(key))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _wait(self, timeout: float | None) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def run(self) -> None:
+        while True:
+            if not self._heap:
+                await self._wait(None)
+                continue
+            due, _, key = self._heap[0]
+            if self._due.get(key) != due:
+                heapq.heappop(self._heap)
+                continue
+            now = self.timer()
+            if due > now:
+                await self._wait(due - now)
+                continue
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+                continue
+            heapq.heappop(self._heap)
+            self._next_start = max(now, self._next_start) + 1.0 / self.rate
+            self._start_refresh(key)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(), name="Token refresh")
+
+    async def stop(self) -> None:
+        tasks = list(self._refresh_tasks)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,8 +1,16 @@
 import uvicorn
 
+from braid_triggers.aiohttp_session import close_session, init_session, warm_up
+from braid_triggers.auth_utils import AUTH_DOMAIN
 from braid_triggers.models import TriggerState
 from braid_triggers.persistence import enum_triggers, init_persistence
-from braid_triggers.tasks import init_polling, set_trigger_state, start_poller
+from braid_triggers.tasks import (
+    QUEUES_API_URL,
+    init_polling,
+    set_trigger_state,
+    shutdown_polling,
+    start_poller,
+)
 from braid_triggers.trigger_views import app as trigger_app
 
 from .logs import init_logging
@@ -19,9 +27,15 @@ async def startup():
     init_logging(log_level=settings.log_level, log_format=settings.log_format)
 
     init_persistence()
+    await init_session()
 
     await init_polling()
     enabled_triggers = enum_triggers(state="ENABLED")
+    if settings.http_warm_up:
+        await warm_up(
+            [AUTH_DOMAIN, QUEUES_API_URL]
+            + [str(trigger.action_url) for trigger in enabled_triggers]
+        )
 
     uvicorn_log_config = uvicorn.config.LOGGING_CONFIG
 
@@ -41,7 +55,8 @@ async def shutdown():
     print("!!!!!!!!!!!!!!!!!!!!!")
     print("! PSEUDO TRIGGER SHUTTING DOWN....")
     print("!!!!!!!!!!!!!!!!!!!!!")
-    await init_polling()
+    await shutdown_polling()
+    await close_session()
 
 
 app = trigger_app
@@ -1,37 +1,66 @@
+import asyncio
 import os
 import time
 import typing as t
 import uuid
+from datetime import datetime, timezone
 
 import structlog
 from fastapi import (
     APIRouter,
+    Body,
     Depends,
     FastAPI,
     Header,
     HTTPException,
+    Query,
     Request,
     Response,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from structlog.contextvars import bind_contextvars, get_contextvars
 
-from braid_triggers.aiohttp_session import aio_session
-from braid_triggers.auth_utils import AuthInfo
+from braid_triggers import metrics
+from braid_triggers.action_providers import (
+    ActionProviderIntrospectionError,
+    get_action_provider_info,
+)
+from braid_triggers.activity import Subscription, broker
+from braid_triggers.auth_utils import AuthInfo, pooled_token_set
+from braid_triggers.etags import content_etag, etag_matches, version_etag
+from braid_triggers.jsoncodec import dumps, loads
 from braid_triggers.models import (
+    Event,
     InternalTrigger,
     ResponseTrigger,
+    TokenSet,
     Trigger,
+    TriggerBatchRequest,
+    TriggerBatchResponse,
+    TriggerBatchResult,
+    TriggerList,
     TriggerState,
 )
+from braid_triggers.ndjson import NDJSONLineTooLong, iter_ndjson
 from braid_triggers.persistence import (
-    lookup_trigger,
+    TriggerVersionConflict,
+    list_triggers_page,
+    lookup_trigger_cached,
+    lookup_triggers,
     remove_trigger,
+    remove_triggers,
     scan_triggers,
     store_trigger,
     update_trigger,
 )
-from braid_triggers.tasks import QUEUES_RECEIVE_SCOPE, set_trigger_state, start_poller
+from braid_triggers.settings import get_settings
+from braid_triggers.tasks import (
+    QUEUES_RECEIVE_SCOPE,
+    enqueue_event,
+    get_event_buffer,
+    set_trigger_state,
+    start_poller,
+)
 
 log = structlog.get_logger(__name__)
 
@@ -45,7 +74,14 @@ ENABLE_TRIGGER_WITH_QUEUE_READ_SCOPE = (
 )
 
 
-app = FastAPI()
+class FastJSONResponse(JSONResponse):
+    """Renders responses with the fast JSON codec"""
+
+    def render(self, content: t.Any) -> bytes:
+        return dumps(content)
+
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 service_name = os.getenv("COPILOT_SERVICE_NAME", "concurrent-actions-provider")
 
@@ -119,6 +155,11 @@ async def healthcheck():
     return {"status": "ok"}
 
 
+@native_router.get("/metrics")
+async def get_metrics() -> dict[str, t.Any]:
+    return metrics.snapshot()
+
+
 @native_router.post("/triggers", response_model=ResponseTrigger)
 async def create_trigger(
     trigger: Trigger, auth_info: AuthInfo = Depends(globus_auth_required_dependency)
@@ -126,14 +167,10 @@ async def create_trigger(
     await auth_info.authorize(MANAGE_TRIGGERS_SCOPE, {"all_authenticated_users"})
     if trigger.action_scope is None:
         try:
-            action_introspect = await aio_session.get(str(trigger.action_url))
-            if 200 <= action_introspect.status < 300:
-                scope = (await action_introspect.json()).get("globus_auth_scope")
-                trigger.action_scope = scope
-        except Exception as e:
-            print(
-                f"Failed to retrieve scope from url {trigger.action_url} due to {str(e)}"
-            )
+            action_provider = await get_action_provider_info(str(trigger.action_url))
+            trigger.action_scope = action_provider.globus_auth_scope
+        except ActionProviderIntrospectionError:
+            pass
 
     if trigger.action_scope is None:
         raise HTTPException(
@@ -162,7 +199,7 @@ async def create_trigger(
         created_by=auth_info.sub,
         globus_auth_scope=scope_for_trigger,
         state=TriggerState.PENDING,
-        token_set=await auth_info.token_set,
+        token_set=await pooled_token_set(auth_info.sub, await auth_info.token_set),
         all_action_status=[],
         **vals,
     )
@@ -173,7 +210,7 @@ async def create_trigger(
 async def _lookup_trigger(
     trigger_id: str, auth_info: AuthInfo | None = None
 ) -> InternalTrigger:
-    trigger = lookup_trigger(trigger_id)
+    trigger = await lookup_trigger_cached(trigger_id)
     # log.info(f"lookup({trigger_id}): {trigger}")
     if trigger is None:
         raise HTTPException(
@@ -184,19 +221,77 @@ async def _lookup_trigger(
     return trigger
 
 
+# Clients may keep responses with an ETag, but must revalidate them before each use
+_REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
 @native_router.get("/triggers/{trigger_id}", response_model=ResponseTrigger)
 async def get_trigger(
-    trigger_id: str, auth_info: AuthInfo = Depends(globus_auth_required_dependency)
-) -> InternalTrigger:
-    return await _lookup_trigger(trigger_id)
+    trigger_id: str,
+    response: Response,
+    if_none_match: str | None = Header(None),
+    auth_info: AuthInfo = Depends(globus_auth_required_dependency),
+) -> InternalTrigger | Response:
+    trigger = await _lookup_trigger(trigger_id)
+    # Every write to a trigger changes its version. A write through another instance
+    # is only seen once the cached copy expires, so an ETag may be stale for up to the
+    # trigger cache TTL.
+    etag = version_etag(trigger.version)
+    headers = {"ETag": etag, "Cache-Control": _REVALIDATE_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return trigger
+
+
+def _list_fields(fields: str | None) -> list[str] | None:
+    if fields is None:
+        return None
+    field_list = [f.strip() for f in fields.split(",") if f.strip()]
+    # Only fields on the ResponseTrigger may be requested so that internal values like
+    # tokens can never be returned.
+    unknown_fields = set(field_list) - set(ResponseTrigger.__fields__)
+    if unknown_fields:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown trigger fields requested: {sorted(unknown_fields)}",
+        )
+    return field_list
 
 
-@native_router.get("/triggers", response_model=list[ResponseTrigger])
+@native_router.get("/triggers", response_model=TriggerList)
 async def list_triggers(
+    limit: int = Query(100, ge=1, le=1000),
+    marker: str | None = None,
+    state: TriggerState | None = None,
+    fields: str | None = Query(None, description="Comma separated trigger fields"),
+    if_none_match: str | None = Header(None),
     auth_info: AuthInfo = Depends(globus_auth_required_dependency),
-) -> list[InternalTrigger]:
-    triggers = scan_triggers(created_by=auth_info.sub)
-    return triggers
+) -> Response:
+    field_list = _list_fields(fields)
+    # Even without a projection requested, we only read the fields we will return
+    read_fields = field_list or list(ResponseTrigger.__fields__)
+    try:
+        items, next_marker = list_triggers_page(
+            auth_info.sub, state=state, limit=limit, marker=marker, fields=read_fields
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    if not field_list:
+        items = [ResponseTrigger(**item).dict() for item in items]
+    trigger_list = TriggerList(
+        triggers=items,
+        limit=limit,
+        has_next_page=next_marker is not None,
+        marker=next_marker,
+    )
+    # A page has no version, so its ETag is a hash of its content
+    body = dumps(trigger_list.dict())
+    etag = content_etag(body)
+    headers = {"ETag": etag, "Cache-Control": _REVALIDATE_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @native_router.post("/triggers/{trigger_id}/enable", response_model=ResponseTrigger)
@@ -206,8 +301,8 @@ async def enable_trigger(
     trigger = await _lookup_trigger(trigger_id, auth_info)
 
     trigger.state = TriggerState.ENABLED
-    trigger.token_set = await auth_info.token_set
-    update_trigger(trigger)
+    trigger.token_set = await pooled_token_set(auth_info.sub, await auth_info.token_set)
+    update_trigger(trigger, merge_fields=("state", "token_set"))
 
     set_trigger_state(trigger_id, TriggerState.ENABLED)
     await start_poller(trigger)
@@ -224,15 +319,224 @@ async def disable_trigger(
     return trigger
 
 
-@native_router.post("/triggers/{trigger_id}/event")
-async def send_event(trigger_id: str, body: str | t.Mapping[str, t.Any]) -> dict:
-    trigger = await _lookup_trigger(trigger_id)
-    if trigger.state is not TriggerState.ENABLED:
+def _check_accepts_events(trigger: InternalTrigger) -> None:
+    # A stored trigger's state is a str rather than a TriggerState
+    if trigger.state != TriggerState.ENABLED:
         raise HTTPException(
             status_code=409,
-            detail=f"Cannot send even to trigger in state {str(trigger.state)}",
+            detail=f"Cannot send event to trigger in state {str(trigger.state)}",
+        )
+    if get_event_buffer(trigger.trigger_id) is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Trigger {trigger.trigger_id} is not running on this instance",
+            headers={"Retry-After": "5"},
+        )
+
+
+def _make_event(body: t.Any, event_id: str | None, auth_info: AuthInfo) -> Event:
+    if isinstance(body, str):
+        body = Event.parse_body(body)
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Event body must be an object")
+    return Event(
+        body=body,
+        event_id=event_id or str(uuid.uuid4()),
+        sent_by_effective_identity=auth_info.sub,
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        sent_by_app=getattr(auth_info, "client_id", None),
+        sent_by_identity_set=getattr(auth_info, "identities_set", None),
+    )
+
+
+async def _enqueue_event(trigger_id: str, event: Event, durable: bool) -> None:
+    try:
+        accepted = await enqueue_event(trigger_id, event, durable=durable)
+    except KeyError:
+        # The trigger's poller has exited since it was checked
+        raise HTTPException(
+            status_code=503,
+            detail=f"Trigger {trigger_id} is not running on this instance",
+            headers={"Retry-After": "5"},
+        ) from None
+    if not accepted:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many events are waiting to be processed by trigger {trigger_id}",
+            headers={"Retry-After": "1"},
         )
-    return {}
+
+
+@native_router.post("/triggers/{trigger_id}/event", status_code=202)
+async def send_event(
+    trigger_id: str,
+    body: str | dict[str, t.Any] = Body(...),
+    event_id: str
+    | None = Query(
+        None, description="Identifies the event, so that a re-sent event is run once"
+    ),
+    durable: bool = Query(
+        False, description="Store the event before accepting it so it isn't lost"
+    ),
+    auth_info: AuthInfo = Depends(globus_auth_required_dependency),
+) -> dict:
+    trigger = await _lookup_trigger(trigger_id, auth_info)
+    _check_accepts_events(trigger)
+    event = _make_event(body, event_id, auth_info)
+    await _enqueue_event(trigger_id, event, durable)
+    return {"trigger_id": trigger_id, "event_id": event.event_id, "durable": durable}
+
+
+async def _bulk_event_items(request: Request) -> t.AsyncIterator[t.Any]:
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        items = loads(await request.body())
+        if not isinstance(items, list):
+            raise HTTPException(
+                status_code=400, detail="A JSON body must be an array of events"
+            )
+        for item in items:
+            yield item
+    else:
+        # Anything else is treated as NDJSON, one event per line
+        async for item in iter_ndjson(request.stream()):
+            yield item
+
+
+async def _send_bulk_event(
+    item: t.Any,
+    default_trigger_id: str | None,
+    durable: bool,
+    auth_info: AuthInfo,
+    trigger_checks: dict[str, HTTPException | None],
+) -> dict[str, t.Any]:
+    result: dict[str, t.Any] = {}
+    try:
+        if isinstance(item, ValueError):
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {item}")
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=400, detail="Event must be an object")
+        trigger_id = item.get("trigger_id", default_trigger_id)
+        if trigger_id is None:
+            raise HTTPException(status_code=400, detail="No trigger_id for event")
+        result["trigger_id"] = trigger_id
+        if trigger_id not in trigger_checks:
+            try:
+                trigger = await _lookup_trigger(trigger_id, auth_info)
+                _check_accepts_events(trigger)
+                trigger_checks[trigger_id] = None
+            except HTTPException as e:
+                trigger_checks[trigger_id] = e
+        check_error = trigger_checks[trigger_id]
+        if check_error is not None:
+            raise check_error
+        event = _make_event(item.get("body"), item.get("event_id"), auth_info)
+        result["event_id"] = event.event_id
+        await _enqueue_event(trigger_id, event, durable)
+    except HTTPException as e:
+        result.update(status=e.status_code, detail=e.detail)
+    else:
+        result["status"] = 202
+    return result
+
+
+@native_router.post("/events")
+async def send_events(
+    request: Request,
+    trigger_id: str
+    | None = Query(
+        None, description="The trigger for events which don't include a trigger_id"
+    ),
+    durable: bool = Query(
+        False, description="Store the events before accepting them so they aren't lost"
+    ),
+    auth_info: AuthInfo = Depends(globus_auth_required_dependency),
+) -> dict:
+    """Send many events, to one or more triggers, in an array or as NDJSON. Each event is
+    an object with a body and optionally a trigger_id and event_id. The result of each
+    event is returned, in order, with the status it would have had if sent alone. If
+    the body is too large, the events up to that point are still processed and a final
+    result with status 413 reports where processing stopped.
+    """
+    max_count = get_settings().bulk_events_max_count
+    # The outcome of checking each trigger, so each is looked up and authorized once
+    trigger_checks: dict[str, HTTPException | None] = {}
+    results: list[dict[str, t.Any]] = []
+    accepted = 0
+    try:
+        async for item in _bulk_event_items(request):
+            if len(results) >= max_count:
+                results.append(
+                    {
+                        "index": len(results),
+                        "status": 413,
+                        "detail": f"At most {max_count} events may be sent at once",
+                    }
+                )
+                break
+            result: dict[str, t.Any] = {"index": len(results)}
+            result.update(
+                await _send_bulk_event(
+                    item, trigger_id, durable, auth_info, trigger_checks
+                )
+            )
+            results.append(result)
+            if result["status"] == 202:
+                accepted += 1
+    except NDJSONLineTooLong as e:
+        results.append({"index": len(results), "status": 413, "detail": str(e)})
+    return {
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "results": results,
+    }
+
+
+async def _activity_stream(subscription: Subscription) -> t.AsyncIterator[str]:
+    keepalive = get_settings().activity_keepalive_seconds
+    try:
+        while True:
+            activities = await subscription.get(timeout=keepalive)
+            dropped = subscription.take_dropped()
+            if dropped:
+                data = dumps({"dropped": dropped}).decode()
+                yield f"event: dropped\ndata: {data}\n\n"
+            if not activities:
+                # A comment, so that idle connections aren't closed by proxies
+                yield ": keepalive\n\n"
+            for activity in activities:
+                data = dumps(activity.dict()).decode()
+                yield f"event: {activity.kind}\ndata: {data}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@native_router.get("/activity")
+async def stream_activity(
+    trigger_id: list[str]
+    | None = Query(
+        None, description="Triggers to watch. Defaults to all of the caller's triggers"
+    ),
+    auth_info: AuthInfo = Depends(globus_auth_required_dependency),
+) -> StreamingResponse:
+    """Stream the activity of the triggers running on this instance as server-sent
+    events, as it happens
+    """
+    if trigger_id:
+        for watched_id in set(trigger_id):
+            await _lookup_trigger(watched_id, auth_info)
+        subscription = broker.subscribe(
+            trigger_ids=trigger_id, maxsize=get_settings().activity_buffer_size
+        )
+    else:
+        subscription = broker.subscribe(
+            created_by=auth_info.sub, maxsize=get_settings().activity_buffer_size
+        )
+    return StreamingResponse(
+        _activity_stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 @native_router.delete("/triggers/{trigger_id}", response_model=ResponseTrigger)
@@ -247,4 +551,144 @@ async def delete_trigger(
     return trigger
 
 
+async def _select_triggers(
+    batch: TriggerBatchRequest, auth_info: AuthInfo
+) -> tuple[list[str], dict[str, InternalTrigger]]:
+    """Return the ids of the triggers in the batch, and those which exist by id"""
+    if (batch.trigger_ids is None) == (batch.selector is None):
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of trigger_ids and selector"
+        )
+    max_triggers = get_settings().batch_max_triggers
+    if batch.trigger_ids is not None:
+        trigger_ids = list(dict.fromkeys(batch.trigger_ids))
+        if len(trigger_ids) > max_triggers:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {max_triggers} triggers may be in a batch",
+            )
+        return trigger_ids, await asyncio.to_thread(lookup_triggers, trigger_ids)
+    assert batch.selector is not None
+    query = batch.selector.dict(exclude_none=True)
+    query.setdefault("created_by", auth_info.sub)
+    triggers = await asyncio.to_thread(scan_triggers, **query)
+    if len(triggers) > max_triggers:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Selector matched {len(triggers)} triggers, more than the "
+                f"{max_triggers} allowed in a batch"
+            ),
+        )
+    by_id = {trigger.trigger_id: trigger for trigger in triggers}
+    return list(by_id), by_id
+
+
+def _batch_error(trigger_id: str, e: Exception) -> TriggerBatchResult:
+    if isinstance(e, HTTPException):
+        return TriggerBatchResult(
+            trigger_id=trigger_id, status=e.status_code, detail=e.detail
+        )
+    if isinstance(e, TriggerVersionConflict):
+        return TriggerBatchResult(trigger_id=trigger_id, status=409, detail=str(e))
+    log.error(f"Batch operation on trigger {trigger_id} failed", exc_info=e)
+    return TriggerBatchResult(trigger_id=trigger_id, status=500, detail=str(e))
+
+
+def _batch_success(trigger: InternalTrigger) -> TriggerBatchResult:
+    return TriggerBatchResult(
+        trigger_id=trigger.trigger_id,
+        status=200,
+        trigger=ResponseTrigger(**trigger.dict()),
+    )
+
+
+async def _enable_in_batch(
+    trigger: InternalTrigger, token_set: TokenSet
+) -> InternalTrigger:
+    trigger.state = TriggerState.ENABLED
+    trigger.token_set = token_set.copy(deep=True)
+    await asyncio.to_thread(
+        update_trigger, trigger, merge_fields=("state", "token_set")
+    )
+    set_trigger_state(trigger.trigger_id, TriggerState.ENABLED)
+    # Unlike enabling a single trigger, a trigger which is already running isn't given
+    # a second poller, as a batch may select many running triggers
+    if get_event_buffer(trigger.trigger_id) is None:
+        await start_poller(trigger)
+    return trigger
+
+
+@native_router.post("/triggers/batch", response_model=TriggerBatchResponse)
+async def batch_triggers(
+    batch: TriggerBatchRequest,
+    auth_info: AuthInfo = Depends(globus_auth_required_dependency),
+) -> TriggerBatchResponse:
+    """Get, enable, disable or delete many triggers, given by id or by a selector, in
+    one request. Triggers are read and deleted with batch storage operations and
+    enabled concurrently. A result is returned for each trigger in the batch.
+    """
+    trigger_ids, found = await _select_triggers(batch, auth_info)
+    results: dict[str, TriggerBatchResult] = {}
+    authorized: list[InternalTrigger] = []
+    for trigger_id in trigger_ids:
+        trigger = found.get(trigger_id)
+        if trigger is None:
+            results[trigger_id] = TriggerBatchResult(
+                trigger_id=trigger_id,
+                status=404,
+                detail=f"No Trigger with id {trigger_id} found",
+            )
+            continue
+        try:
+            await auth_info.authorize(trigger.globus_auth_scope, {trigger.created_by})
+        except HTTPException as e:
+            results[trigger_id] = _batch_error(trigger_id, e)
+            continue
+        authorized.append(trigger)
+
+    if batch.operation == "enable" and authorized:
+        # The caller's tokens are exchanged once for the whole batch
+        token_set = await pooled_token_set(auth_info.sub, await auth_info.token_set)
+        outcomes = await asyncio.gather(
+            *(_enable_in_batch(trigger, token_set) for trigger in authorized),
+            return_exceptions=True,
+        )
+        for trigger, outcome in zip(authorized, outcomes):
+            results[trigger.trigger_id] = (
+                _batch_error(trigger.trigger_id, outcome)
+                if isinstance(outcome, Exception)
+                else _batch_success(trigger)
+            )
+    elif batch.operation in ("disable", "delete"):
+        new_state = (
+            TriggerState.PENDING
+            if batch.operation == "disable"
+            else TriggerState.DELETING
+        )
+        to_remove: list[str] = []
+        for trigger in authorized:
+            try:
+                prev_state = set_trigger_state(trigger.trigger_id, new_state)
+            except HTTPException as e:
+                results[trigger.trigger_id] = _batch_error(trigger.trigger_id, e)
+                continue
+            # The poller of an enabled trigger removes it when it exits
+            if (
+                new_state is TriggerState.DELETING
+                and prev_state is not TriggerState.ENABLED
+            ):
+                to_remove.append(trigger.trigger_id)
+            results[trigger.trigger_id] = _batch_success(trigger)
+        if to_remove:
+            await asyncio.to_thread(remove_triggers, to_remove)
+    else:
+        for trigger in authorized:
+            results[trigger.trigger_id] = _batch_success(trigger)
+
+    return TriggerBatchResponse(
+        results=[results[trigger_id] for trigger_id in trigger_ids]
+    )
+
+
 app.include_router(native_router)
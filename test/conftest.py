@@ -0,0 +1,62 @@
+import typing as t
+import uuid
+
+import pytest
+
+from braid_triggers.models import InternalTrigger, Token, TokenSet, TriggerState
+
+
+class FakeClock:
+    """A timer for the classes which accept one. Time only passes when now is set."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+def _dummy_scope_string(scope_suffix: str = "dummy_scope") -> str:
+    return f"https://auth.globus.org/client_id/{scope_suffix}"
+
+
+def _dummy_token(scope_suffix: str = "dummy_scope") -> Token:
+    return Token(
+        access_token="_dummy_access",
+        scope=_dummy_scope_string(scope_suffix),
+        refresh_token="_dummy_refresh",
+        expiration_time=123456789,
+    )
+
+
+def new_trigger(**fields: t.Any) -> InternalTrigger:
+    """A trigger with a new trigger_id, creator and queue, with any of its fields
+    replaced by those given
+    """
+    values: dict[str, t.Any] = {
+        "queue_id": uuid.uuid4(),
+        "action_url": "https://example.com",
+        "event_filter": "True",
+        "action_scope": None,
+        "event_template": {"foo": "bar"},
+        "trigger_id": str(uuid.uuid4()),
+        "created_by": str(uuid.uuid4()),
+        "globus_auth_scope": _dummy_scope_string("trigger_scope"),
+        "state": TriggerState.ENABLED,
+        "token_set": TokenSet(
+            user_token=_dummy_token("user_scope"), dependent_tokens={}
+        ),
+        "all_action_status": [],
+    }
+    values.update(fields)
+    return InternalTrigger(**values)
+
+
+@pytest.fixture
+def make_trigger() -> t.Callable[..., InternalTrigger]:
+    return new_trigger
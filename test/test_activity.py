@@ -0,0 +1,35 @@
+import pytest
+
+from braid_triggers.activity import ActivityBroker
+
+
+@pytest.mark.asyncio
+async def test_subscriptions():
+    broker = ActivityBroker()
+    by_id = broker.subscribe(trigger_ids=["t1"])
+    by_creator = broker.subscribe(created_by="user")
+    assert len(broker) == 2
+
+    broker.publish("t1", "user", "event_received", event_id="e1")
+    broker.publish("t2", "user", "event_received", event_id="e2")
+    broker.publish("t3", "other", "event_received", event_id="e3")
+
+    assert [a.details["event_id"] for a in await by_id.get(0)] == ["e1"]
+    assert [a.details["event_id"] for a in await by_creator.get(0)] == ["e1", "e2"]
+    assert await by_id.get(0.01) == []
+
+    broker.unsubscribe(by_id)
+    broker.unsubscribe(by_creator)
+    assert len(broker) == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_drops_oldest():
+    broker = ActivityBroker()
+    subscription = broker.subscribe(trigger_ids=["t1"], maxsize=2)
+    for count in range(5):
+        broker.publish("t1", "user", "event_received", event_count=count)
+    activity = await subscription.get(0)
+    assert [a.details["event_count"] for a in activity] == [3, 4]
+    assert subscription.take_dropped() == 3
+    assert subscription.take_dropped() == 0
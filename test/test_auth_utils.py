@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from braid_triggers import auth_utils
+from braid_triggers.backends.memory import MemoryKeyValueStore
+
+os.environ["TRIGGER_ENVIRONMENT"] = "pytest"
+
+
+class _RacingKeyValueStore(MemoryKeyValueStore):
+    """Stores other_scopes, as another instance would, just before the next
+    conditional write
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.other_scopes: dict[frozenset, str] = {}
+
+    def put_versioned(self, namespace, key, value, expected_version, ttl=None):
+        if self.other_scopes:
+            other_scopes, self.other_scopes = self.other_scopes, {}
+            auth_utils._merge_client_scopes(other_scopes)
+        return super().put_versioned(namespace, key, value, expected_version, ttl)
+
+
+@pytest.mark.asyncio
+async def test_client_scopes_stored_concurrently_are_kept(monkeypatch):
+    store = _RacingKeyValueStore()
+    monkeypatch.setattr(auth_utils, "key_value_store", lambda: store)
+    auth_utils._merge_client_scopes({frozenset(): "scope"})
+    store.other_scopes = {frozenset(["b"]): "scope_b"}
+
+    client_scopes = {frozenset(): "scope", frozenset(["a", "c"]): "scope_ac"}
+    await auth_utils._store_client_scopes(client_scopes)
+    expected = {
+        frozenset(): "scope",
+        frozenset(["a", "c"]): "scope_ac",
+        frozenset(["b"]): "scope_b",
+    }
+    assert client_scopes == expected
+    stored = store.get(
+        auth_utils._CLIENT_SCOPES_NAMESPACE, auth_utils._client_scopes_key()
+    )
+    assert auth_utils._decode_client_scopes(stored) == expected
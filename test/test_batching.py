@@ -0,0 +1,41 @@
+from braid_triggers.batching import EventBatcher, batch_request_id
+from braid_triggers.models import EventBatching
+
+
+def _names(event_id: str) -> dict:
+    return {"event_id": event_id, "body": {"value": event_id}}
+
+
+def test_batch_by_count_and_wait(clock):
+    batcher = EventBatcher(
+        EventBatching(max_events=3, max_wait_seconds=5.0), timer=clock
+    )
+    assert batcher.deadline is None
+    assert batcher.add(_names("1")) is None
+    clock.now = 1.0
+    assert batcher.add(_names("2")) is None
+    assert batcher.deadline == 5.0
+    batch = batcher.add(_names("3"))
+    assert [names["event_id"] for names in batch] == ["1", "2", "3"]
+    assert len(batcher) == 0 and batcher.deadline is None
+
+    clock.now = 10.0
+    batcher.add(_names("4"))
+    assert not batcher.due()
+    clock.now = 15.0
+    assert batcher.due()
+    assert [names["event_id"] for names in batcher.take()] == ["4"]
+    assert not batcher.due()
+
+
+def test_batch_by_bytes():
+    batcher = EventBatcher(EventBatching(max_events=100, max_bytes=100))
+    assert batcher.add(_names("1")) is None
+    batch = batcher.add({"event_id": "2", "body": {"value": "x" * 100}})
+    assert len(batch) == 2
+
+
+def test_batch_request_id():
+    assert batch_request_id(["1", "2"]) == batch_request_id(["1", "2"])
+    assert batch_request_id(["1", "2"]) != batch_request_id(["2", "1"])
+    assert batch_request_id(["1", "2"]) != batch_request_id(["1"])
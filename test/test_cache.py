@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from braid_triggers.cache import AsyncCache, BatchLoader
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_coalesced():
+    cache: AsyncCache[str, int] = AsyncCache(maxsize=10, ttl=60)
+    load_count = 0
+
+    async def loader() -> int:
+        nonlocal load_count
+        load_count += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    results = await asyncio.gather(*[cache.get_or_load("k", loader) for _ in range(5)])
+    assert results == [42] * 5
+    assert load_count == 1
+    assert cache.stats.coalesced == 4
+
+    assert await cache.get_or_load("k", loader) == 42
+    assert load_count == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_expire(clock):
+    cache: AsyncCache[str, str] = AsyncCache(maxsize=10, ttl=10, timer=clock)
+    cache.set("short", "value", ttl=1)
+    cache.set("long", "value")
+    clock.now = 5
+    assert cache.get("short") is None
+    assert cache.get("long") == "value"
+
+
+@pytest.mark.asyncio
+async def test_errors_are_negatively_cached(clock):
+    cache: AsyncCache[str, str] = AsyncCache(maxsize=10, ttl=10, timer=clock)
+    load_count = 0
+
+    async def loader() -> str:
+        nonlocal load_count
+        load_count += 1
+        raise ValueError("bad")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await cache.get_or_load("k", loader, error_ttl=5)
+    assert load_count == 1
+    clock.now = 6
+    with pytest.raises(ValueError):
+        await cache.get_or_load("k", loader, error_ttl=5)
+    assert load_count == 2
+
+
+def test_stale_values_are_not_cached():
+    cache: AsyncCache[str, int] = AsyncCache(
+        maxsize=10, ttl=10, is_stale=lambda cached, new: new < cached
+    )
+    assert cache.set("k", 2)
+    assert not cache.set("k", 1)
+    assert cache.get("k") == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_batched():
+    batches: list[list[str]] = []
+
+    async def loader(keys: list[str]) -> dict[str, str]:
+        batches.append(keys)
+        await asyncio.sleep(0.01)
+        return {k: k.upper() for k in keys if k != "missing"}
+
+    batcher: BatchLoader[str, str] = BatchLoader(loader, window=0.01, max_batch=3)
+    results = await asyncio.gather(
+        batcher.load(["a", "b"]), batcher.load(["b", "c", "missing"])
+    )
+    assert results == [{"a": "A", "b": "B"}, {"b": "B", "c": "C", "missing": None}]
+    assert sorted(k for batch in batches for k in batch) == ["a", "b", "c", "missing"]
+    assert all(len(batch) <= 3 for batch in batches)
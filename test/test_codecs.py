@@ -0,0 +1,100 @@
+import datetime
+import uuid
+
+import pytest
+from boto3.dynamodb.types import Binary, Decimal
+
+from braid_triggers import codecs
+from braid_triggers.codecs import (
+    CODEC_MARKER_ATTRIBUTE,
+    configure_compression,
+    from_dynamo_dict,
+    model_codec,
+    register_compressed_fields,
+    to_dynamo_dict,
+)
+from braid_triggers.models import (
+    ActionStatus,
+    ActionStatusValue,
+    Event,
+    InternalTrigger,
+)
+
+
+@pytest.fixture
+def trigger(make_trigger) -> InternalTrigger:
+    status = ActionStatus(
+        status=ActionStatusValue.ACTIVE,
+        creator_id="creator",
+        action_id="action",
+        details={"ratio": 0.1, "nested": [1, {"ok": True}]},
+    )
+    trigger = make_trigger(
+        action_url="https://example.com/action",
+        action_scope="https://auth.globus.org/scopes/action",
+        event_template={"foo": "bar", "count.=": "event_count", "list": [1, 2.5]},
+        last_action_status=status,
+        last_action_statuses=[status],
+        last_event=Event(
+            body={"file": "a.h5", "size": 12},
+            event_id="event",
+            sent_by_effective_identity="sender",
+            timestamp="2023-01-01T00:00:00",
+        ),
+        event_count=3,
+    )
+    user_token = trigger.token_set.user_token
+    trigger.token_set.dependent_tokens = {
+        "action_scope": user_token.copy(update={"scope": "action_scope"})
+    }
+    return trigger
+
+
+def test_trigger_round_trip(trigger: InternalTrigger):
+    codec = model_codec(InternalTrigger)
+    item = codec.to_item(trigger)
+    assert item[CODEC_MARKER_ATTRIBUTE]
+    assert item["event_count"] == Decimal(3)
+    assert item["last_action_status"]["details"]["ratio"] == Decimal("0.1")
+
+    for trusted in (True, False):
+        back = codec.from_item(item, trusted=trusted)
+        assert back == trigger
+        assert back.last_action_status.status is ActionStatusValue.ACTIVE
+        assert isinstance(back.last_action_status.start_time, datetime.datetime)
+        assert isinstance(back.queue_id, uuid.UUID)
+
+
+def test_untrusted_items_are_validated(trigger: InternalTrigger):
+    item = to_dynamo_dict(trigger.dict())
+    back = model_codec(InternalTrigger).from_item(item)
+    assert back == trigger
+
+
+def test_generic_conversion():
+    val = {"a": [1, 2.5, "s", None, True], "b": {"c": b"bytes"}}
+    assert from_dynamo_dict(to_dynamo_dict(val)) == val
+
+
+@pytest.fixture
+def compression(monkeypatch):
+    """Restores the module's compression configuration once the test is done"""
+    for name in ("threshold_bytes", "algorithm", "level"):
+        monkeypatch.setattr(
+            codecs._compression, name, getattr(codecs._compression, name)
+        )
+
+
+def test_large_fields_are_compressed(trigger: InternalTrigger, compression):
+    register_compressed_fields(InternalTrigger, ("event_template", "last_event"))
+    register_compressed_fields(ActionStatus, ("details",))
+    configure_compression(threshold_bytes=256)
+    trigger.event_template = {f"param_{i}": "value" * 10 for i in range(100)}
+    codec = model_codec(InternalTrigger)
+    item = codec.to_item(trigger)
+    assert isinstance(item["event_template"], Binary)
+    # Below the threshold, values are stored as usual
+    assert isinstance(item["last_event"], dict)
+
+    assert codec.from_item(item) == trigger
+    assert codec.from_item(item, trusted=False) == trigger
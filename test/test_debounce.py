@@ -0,0 +1,51 @@
+from braid_triggers.debounce import Debouncer
+
+
+def test_debounce_keeps_last(clock):
+    debouncer: Debouncer[str] = Debouncer(5.0, timer=clock)
+    assert debouncer.deadline is None
+    for i in range(3):
+        clock.now = float(i)
+        debouncer.add("key", f"event-{i}")
+    # Each event restarts the quiet period
+    assert debouncer.deadline == 7.0
+    clock.now = 6.0
+    assert debouncer.pop_due() == []
+    clock.now = 7.0
+    assert debouncer.pop_due() == ["event-2"]
+    assert len(debouncer) == 0 and debouncer.deadline is None
+
+
+def test_debounce_keeps_first_per_key(clock):
+    debouncer: Debouncer[str] = Debouncer(5.0, keep="first", timer=clock)
+    debouncer.add("a", "a-1")
+    clock.now = 2.0
+    debouncer.add("b", "b-1")
+    debouncer.add("a", "a-2")
+    assert len(debouncer) == 2
+    clock.now = 10.0
+    assert sorted(debouncer.pop_due()) == ["a-1", "b-1"]
+
+
+def test_debounce_many_repeats(clock):
+    debouncer: Debouncer[int] = Debouncer(1.0, timer=clock)
+    for i in range(1000):
+        clock.now = i / 1000
+        debouncer.add(i % 3, i)
+    # Superseded deadlines are discarded rather than accumulating
+    assert len(debouncer._heap) < 100
+    clock.now = 2.0
+    assert sorted(debouncer.pop_due()) == [997, 998, 999]
+
+
+def test_debounce_reports_superseded(clock):
+    last: Debouncer[str] = Debouncer(5.0, timer=clock)
+    assert last.add("key", "event-1") is None
+    assert last.add("key", "event-2") == "event-1"
+    assert last.get("key") == "event-2"
+
+    first: Debouncer[str] = Debouncer(5.0, keep="first", timer=clock)
+    assert first.add("key", "event-1") is None
+    assert first.add("key", "event-2") == "event-2"
+    assert first.get("key") == "event-1"
+    assert first.get("other") is None
@@ -0,0 +1,44 @@
+from braid_triggers.dedup import BloomFilter, SeenEvents
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.001)
+    for i in range(1000):
+        bloom.add(f"event-{i}")
+    assert bloom.full
+    assert all(f"event-{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 50
+
+    restored = BloomFilter.from_dict(bloom.to_dict())
+    assert restored.count == 1000
+    assert all(f"event-{i}" in restored for i in range(1000))
+
+
+def test_seen_events_window():
+    seen = SeenEvents(recent_size=10, filter_capacity=100, error_rate=1e-6)
+    assert not seen.check_and_add("first")
+    assert seen.check_and_add("first")
+    for i in range(150):
+        assert not seen.check_and_add(f"event-{i}")
+    # Older ids have moved from the recent set in to the filters
+    assert "first" in seen
+    assert all(f"event-{i}" in seen for i in range(150))
+    # Once both filters have filled, the oldest ids are forgotten
+    for i in range(150, 300):
+        seen.add(f"event-{i}")
+    assert "first" not in seen
+    assert "event-299" in seen
+
+
+def test_seen_events_checkpoint():
+    seen = SeenEvents(recent_size=5, filter_capacity=20)
+    for i in range(30):
+        seen.add(f"event-{i}")
+    assert seen.dirty
+
+    restored = SeenEvents.from_dict(seen.to_dict(), recent_size=5, filter_capacity=20)
+    assert not restored.dirty
+    assert all(f"event-{i}" in restored for i in range(30))
+    assert not restored.check_and_add("new")
+    assert restored.dirty
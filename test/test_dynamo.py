@@ -1,12 +1,20 @@
 import os
+import typing as t
 import uuid
 
-from braid_triggers.models import InternalTrigger, Token, TokenSet, TriggerState
+import pytest
+
+from braid_triggers.backends import dynamo
+from braid_triggers.models import TriggerState
 from braid_triggers.persistence import (
+    TriggerVersionConflict,
+    enum_triggers,
     init_persistence,
     lookup_trigger,
     scan_triggers,
     store_trigger,
+    update_trigger,
+    update_trigger_with_retry,
 )
 
 os.environ["TRIGGER_ENVIRONMENT"] = "pytest"
@@ -14,58 +22,15 @@ os.environ["TRIGGER_ENVIRONMENT"] = "pytest"
 init_persistence()
 
 
-def _create_dummy_scope_string(scope_suffix: str = "dummy_scope") -> str:
-    return f"https://auth.globus.org/client_id/{scope_suffix}"
-
-
-def _create_dummy_token(scope_suffix: str = "dummy_scope") -> Token:
-    t = Token(
-        access_token="_dummy_access",
-        scope=_create_dummy_scope_string(scope_suffix),
-        refresh_token="_dummy_refresh",
-        expiration_time=123456789,
-    )
-    return t
-
-
-def test_store_trigger():
-    trigger_id = str(uuid.uuid4())
+def test_store_trigger(make_trigger):
     created_by = str(uuid.uuid4())
-    trigger = InternalTrigger(
-        queue_id=uuid.uuid4(),
-        action_url="https://example.com",
-        event_filter="True",
-        action_scope=None,
-        event_template={"foo": "bar"},
-        trigger_id=trigger_id,
-        created_by=created_by,
-        globus_auth_scope=_create_dummy_scope_string("trigger_scope"),
-        state=TriggerState.ENABLED,
-        token_set=TokenSet(
-            user_token=_create_dummy_token("user_scope"), dependent_tokens={}
-        ),
-        all_action_status=[],
-    )
-    trigger2 = InternalTrigger(
-        queue_id=uuid.uuid4(),
-        action_url="https://example.com",
-        event_filter="True",
-        action_scope=None,
-        event_template={"foo": "bar"},
-        trigger_id=str(uuid.uuid4()),
-        created_by=created_by,
-        globus_auth_scope=_create_dummy_scope_string("trigger_scope"),
-        state=TriggerState.ENABLED,
-        token_set=TokenSet(
-            user_token=_create_dummy_token("user_scope"), dependent_tokens={}
-        ),
-        all_action_status=[],
-    )
+    trigger = make_trigger(created_by=created_by)
+    trigger2 = make_trigger(created_by=created_by)
 
     store_trigger(trigger)
     store_trigger(trigger2)
 
-    back_trigger = lookup_trigger(trigger_id)
+    back_trigger = lookup_trigger(trigger.trigger_id)
     assert back_trigger.trigger_id == trigger.trigger_id
 
     scanned_triggers = scan_triggers(
@@ -73,3 +38,86 @@ def test_store_trigger():
     )
     assert len(scanned_triggers) == 2
     assert scanned_triggers[0].trigger_id == trigger.trigger_id
+
+
+def test_enum_triggers_by_state(make_trigger):
+    created_by = str(uuid.uuid4())
+    trigger = make_trigger(created_by=created_by, state=TriggerState.NO_QUEUE)
+    store_trigger(trigger)
+
+    no_queue_triggers = enum_triggers(state="NO_QUEUE", created_by=created_by)
+    assert [t.trigger_id for t in no_queue_triggers] == [trigger.trigger_id]
+    assert enum_triggers(state="DELETED", created_by=created_by) == []
+
+
+def test_conflicting_updates_are_merged(make_trigger):
+    trigger = make_trigger(state=TriggerState.PENDING)
+    store_trigger(trigger)
+    api_copy = lookup_trigger(trigger.trigger_id)
+    poller_copy = lookup_trigger(trigger.trigger_id)
+
+    api_copy.state = TriggerState.ENABLED
+    update_trigger(api_copy)
+
+    poller_copy.event_count = 5
+    with pytest.raises(TriggerVersionConflict):
+        update_trigger(poller_copy)
+    update_trigger(poller_copy, merge_fields=["event_count"])
+    assert poller_copy.state == TriggerState.ENABLED
+
+    stored = lookup_trigger(trigger.trigger_id)
+    assert stored.state == TriggerState.ENABLED
+    assert stored.event_count == 5
+    assert stored.version == api_copy.version + 1
+
+
+def test_update_with_retry_requires_an_attempt(make_trigger):
+    trigger = store_trigger(make_trigger())
+    with pytest.raises(ValueError):
+        update_trigger_with_retry(trigger.trigger_id, lambda latest: None, 0)
+
+
+class _ThrottledClient:
+    """Leaves all but the first of the keys requested unprocessed, a few times over"""
+
+    def __init__(self, throttled_responses: int):
+        self.throttled_responses = throttled_responses
+        self.requests: list[list] = []
+
+    def batch_get_item(self, RequestItems):
+        ((table_name, request),) = RequestItems.items()
+        keys = request["Keys"]
+        self.requests.append(keys)
+        if self.throttled_responses == 0:
+            return {"Responses": {table_name: keys}}
+        self.throttled_responses -= 1
+        return {
+            "Responses": {table_name: keys[:1]},
+            "UnprocessedKeys": {table_name: {"Keys": keys[1:]}},
+        }
+
+
+@pytest.fixture
+def throttled(monkeypatch) -> t.Callable[[int], _ThrottledClient]:
+    monkeypatch.setattr(dynamo.time, "sleep", lambda seconds: None)
+
+    def _throttle(responses: int) -> _ThrottledClient:
+        client = _ThrottledClient(responses)
+        monkeypatch.setattr(dynamo, "boto3_resource", lambda *args: client)
+        return client
+
+    return _throttle
+
+
+def test_batch_get_retries_unprocessed_keys(throttled):
+    client = throttled(2)
+    keys = [{"key": str(i)} for i in range(4)]
+    assert list(dynamo.batch_get_items("table", keys)) == keys
+    assert [len(request) for request in client.requests] == [4, 3, 2]
+
+
+def test_batch_get_gives_up(throttled):
+    throttled(dynamo._BATCH_GET_MAX_ATTEMPTS)
+    keys = [{"key": str(i)} for i in range(dynamo._BATCH_GET_MAX_ATTEMPTS + 1)]
+    with pytest.raises(RuntimeError):
+        list(dynamo.batch_get_items("table", keys))
@@ -0,0 +1,11 @@
+from braid_triggers.etags import content_etag, etag_matches, version_etag
+
+
+def test_etag_matches():
+    etag = version_etag(3)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"v1", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(version_etag(4), etag)
+    assert content_etag(b"a") == content_etag(b"a") != content_etag(b"b")
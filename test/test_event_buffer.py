@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from braid_triggers.event_buffer import EventBuffer
+from braid_triggers.models import Event
+
+
+def _event(event_id: str) -> Event:
+    return Event(
+        body={"value": event_id},
+        event_id=event_id,
+        sent_by_effective_identity="user",
+        timestamp="2022-01-01T00:00:00+00:00",
+    )
+
+
+def test_bounded_buffer():
+    buffer = EventBuffer(maxsize=2)
+    assert buffer.put(_event("1"))
+    assert buffer.put(_event("2"), durable=True)
+    assert buffer.full
+    assert not buffer.put(_event("3"))
+
+    drained = buffer.drain(max_events=1)
+    assert [b.event.event_id for b in drained] == ["1"]
+    assert buffer.put(_event("3"))
+    drained = buffer.drain()
+    assert [(b.event.event_id, b.durable) for b in drained] == [
+        ("2", True),
+        ("3", False),
+    ]
+    assert len(buffer) == 0
+
+
+@pytest.mark.asyncio
+async def test_put_ends_wait():
+    buffer = EventBuffer()
+    assert not await buffer.wait(0.01)
+
+    async def put_later():
+        await asyncio.sleep(0.01)
+        buffer.put(_event("1"))
+
+    put_task = asyncio.create_task(put_later())
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await buffer.wait(10)
+    assert loop.time() - start < 5
+    await put_task
+
+    buffer.drain()
+    assert not await buffer.wait(0.01)
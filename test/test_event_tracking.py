@@ -0,0 +1,84 @@
+import pytest
+
+from braid_triggers import tasks
+from braid_triggers.dedup import SeenEvents
+from braid_triggers.models import ActionStatus, ActionStatusValue, Event
+
+
+def _event(event_id: str) -> Event:
+    return Event(
+        body={"value": event_id},
+        event_id=event_id,
+        sent_by_effective_identity="user",
+        timestamp="2022-01-01T00:00:00+00:00",
+    )
+
+
+_STARTED = ActionStatus(
+    action_id="action", creator_id="user", status=ActionStatusValue.ACTIVE
+)
+_NOT_STARTED = tasks._error_action_status("Unable to run action")
+
+
+@pytest.fixture
+def forgotten(monkeypatch) -> list[str]:
+    """The ids of the durable events deleted from storage"""
+    forgotten: list[str] = []
+
+    async def _forget(trigger_id: str, event_id: str) -> None:
+        forgotten.append(event_id)
+
+    monkeypatch.setattr(tasks, "_forget_durable_event", _forget)
+    return forgotten
+
+
+@pytest.mark.asyncio
+async def test_event_seen_only_once_action_started(forgotten):
+    seen = SeenEvents()
+    tracker = tasks._EventTracker("trigger", seen)
+    assert await tracker.accept(_event("1"), durable=True)
+    # Sent again while the first is in flight
+    assert not await tracker.accept(_event("1"), durable=True)
+    await tracker.finish(["1"], _NOT_STARTED)
+    assert "1" not in seen and forgotten == []
+
+    # Processed again after the action failed to start
+    assert await tracker.accept(_event("1"), durable=True)
+    await tracker.finish(["1"], _STARTED)
+    assert "1" in seen and forgotten == ["1"]
+    assert not await tracker.accept(_event("1"))
+
+
+@pytest.mark.asyncio
+async def test_replayed_events_not_suppressed(forgotten):
+    seen = SeenEvents()
+    seen.add("1")
+    seen.add("2")
+    tracker = tasks._EventTracker("trigger", seen)
+    assert await tracker.accept(_event("1"), durable=True, replayed=True)
+    # The stored copy of a duplicate is kept until the event in flight settles
+    assert not await tracker.accept(_event("1"), durable=True)
+    assert not await tracker.accept(_event("2"), durable=True)
+    assert forgotten == ["2"]
+    await tracker.settle(["1"])
+    assert forgotten == ["2", "1"]
+
+
+@pytest.mark.asyncio
+async def test_superseded_events_settle_with_burst(forgotten):
+    seen = SeenEvents()
+    tracker = tasks._EventTracker("trigger", seen)
+    for event_id in ("1", "2", "3"):
+        assert await tracker.accept(_event(event_id), durable=True)
+    tracker.supersede("2", "1")
+    tracker.supersede("3", "2")
+    await tracker.finish(["3"], _NOT_STARTED)
+    assert forgotten == [] and "1" not in seen
+
+    for event_id in ("1", "2", "3"):
+        assert await tracker.accept(_event(event_id), durable=True)
+    tracker.supersede("1", "2")
+    tracker.supersede("1", "3")
+    await tracker.finish(["1"], _STARTED)
+    assert sorted(forgotten) == ["1", "2", "3"]
+    assert all(event_id in seen for event_id in ("1", "2", "3"))
@@ -0,0 +1,45 @@
+import datetime
+import uuid
+from decimal import Decimal
+
+from braid_triggers.jsoncodec import _stdlib_dumps, _stdlib_loads, dumps, loads
+from braid_triggers.models import BaseEnum, Event
+
+
+class _Color(BaseEnum):
+    RED = "red"
+
+
+def test_round_trip():
+    event_id = uuid.uuid4()
+    when = datetime.datetime(2022, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    val = {
+        "event": Event(
+            body={"a": 1},
+            event_id="e1",
+            sent_by_effective_identity="someone",
+            timestamp=when.isoformat(),
+        ),
+        "when": when,
+        "id": event_id,
+        "color": _Color.RED,
+        "count": Decimal("3"),
+        "ratio": Decimal("0.5"),
+    }
+    for encode, decode in ((dumps, loads), (_stdlib_dumps, _stdlib_loads)):
+        encoded = encode(val)
+        assert isinstance(encoded, bytes)
+        decoded = decode(encoded)
+        assert decoded["event"]["body"] == {"a": 1}
+        assert decoded["when"] == when.isoformat()
+        assert decoded["id"] == str(event_id)
+        assert decoded["color"] == "red"
+        assert decoded["count"] == 3
+        assert decoded["ratio"] == 0.5
+
+
+def test_loads_accepts_bytes_and_str():
+    for loader in (loads, _stdlib_loads):
+        assert loader(b'{"a": [1, 2]}') == {"a": [1, 2]}
+        assert loader('{"a": "é"}') == {"a": "é"}
+    assert _stdlib_loads(memoryview(b"[1]")) == [1]
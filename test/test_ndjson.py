@@ -0,0 +1,30 @@
+import pytest
+
+from braid_triggers.ndjson import NDJSONLineTooLong, iter_ndjson
+
+
+async def _chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _collect(chunks, **kwargs):
+    return [item async for item in iter_ndjson(chunks, **kwargs)]
+
+
+@pytest.mark.asyncio
+async def test_lines_split_across_chunks():
+    items = await _collect(
+        _chunks(b'{"a": 1}\n{"b"', b": 2}\r\n\n", b"not json\n", b'{"c": 3}')
+    )
+    assert items[0] == {"a": 1}
+    assert items[1] == {"b": 2}
+    assert isinstance(items[2], ValueError)
+    assert items[3] == {"c": 3}
+    assert len(items) == 4
+
+
+@pytest.mark.asyncio
+async def test_line_too_long():
+    with pytest.raises(NDJSONLineTooLong):
+        await _collect(_chunks(b"[1, 2, 3", b", 4, 5, 6]\n"), max_line_bytes=10)
@@ -0,0 +1,196 @@
+import typing as t
+import uuid
+
+import pytest
+from botocore.exceptions import BotoCoreError, ClientError
+
+from braid_triggers.backends import (
+    KeyValueStore,
+    KeyValueVersionConflict,
+    TriggerBackend,
+    TriggerVersionConflict,
+)
+from braid_triggers.backends.dynamo import DynamoKeyValueStore, DynamoTriggerBackend
+from braid_triggers.backends.memory import MemoryKeyValueStore, MemoryTriggerBackend
+from braid_triggers.backends.sqlite import SQLiteKeyValueStore, SQLiteTriggerBackend
+from braid_triggers.models import TriggerState
+
+
+@pytest.fixture
+def new_trigger(make_trigger):
+    """Makes triggers as though already stored once, as they are by store_trigger()"""
+
+    def _new_trigger(created_by: str, state: TriggerState = TriggerState.ENABLED):
+        return make_trigger(created_by=created_by, state=state, version=1)
+
+    return _new_trigger
+
+
+def _dynamo_table(backend: DynamoTriggerBackend | DynamoKeyValueStore):
+    """The backend's table, created for this test, skipping the test when DynamoDB (as
+    configured for test_dynamo) isn't available
+    """
+    table = backend.table
+    try:
+        backend.init(create=True)
+        table.load()
+    except (BotoCoreError, ClientError) as e:
+        pytest.skip(f"DynamoDB is not available: {str(e)}")
+    return table
+
+
+def _dynamo_table_name() -> str:
+    # Each test gets an empty table
+    return f"braid_triggers_test_{uuid.uuid4().hex}"
+
+
+@pytest.fixture(params=["memory", "sqlite", "dynamo"])
+def backend(request, tmp_path) -> t.Iterator[TriggerBackend]:
+    if request.param == "dynamo":
+        dynamo_backend = DynamoTriggerBackend(_dynamo_table_name())
+        table = _dynamo_table(dynamo_backend)
+        yield dynamo_backend
+        table.delete()
+        return
+    if request.param == "memory":
+        backend: TriggerBackend = MemoryTriggerBackend()
+    else:
+        backend = SQLiteTriggerBackend(str(tmp_path / "triggers.db"))
+    backend.init(create=True)
+    yield backend
+
+
+def test_versioned_writes(backend: TriggerBackend, new_trigger):
+    trigger = new_trigger("user")
+    backend.create(trigger)
+    with pytest.raises(TriggerVersionConflict):
+        backend.create(trigger)
+    assert backend.get(trigger.trigger_id) == trigger
+
+    trigger.event_count = 1
+    trigger.version = 2
+    backend.put(trigger, expected_version=1)
+    with pytest.raises(TriggerVersionConflict):
+        backend.put(trigger, expected_version=1)
+    assert backend.get(trigger.trigger_id).event_count == 1
+
+    assert backend.delete(trigger.trigger_id) == trigger
+    assert backend.get(trigger.trigger_id) is None
+    assert backend.delete(trigger.trigger_id) is None
+    with pytest.raises(TriggerVersionConflict):
+        backend.put(trigger, expected_version=2)
+
+
+def test_batch_operations(backend: TriggerBackend, new_trigger):
+    triggers = [new_trigger("user") for _ in range(3)]
+    for trigger in triggers:
+        backend.create(trigger)
+    ids = [trigger.trigger_id for trigger in triggers]
+
+    assert backend.get_many(ids + ["missing", ids[0]]) == {
+        trigger.trigger_id: trigger for trigger in triggers
+    }
+    backend.delete_many(ids[:2] + ["missing"])
+    assert list(backend.get_many(ids)) == ids[2:]
+
+
+def test_query(backend: TriggerBackend, new_trigger):
+    enabled = new_trigger("user")
+    pending = new_trigger("user", TriggerState.PENDING)
+    other = new_trigger("other")
+    for trigger in (enabled, pending, other):
+        backend.create(trigger)
+
+    def ids(triggers):
+        return {trigger.trigger_id for trigger in triggers}
+
+    assert ids(backend.query([])) == ids([enabled, pending, other])
+    assert ids(backend.query([{"state": TriggerState.PENDING}])) == ids([pending])
+    assert ids(
+        backend.query([{"created_by": "user", "state": ["ENABLED", "DELETED"]}])
+    ) == ids([enabled])
+    # Matching more than one element only returns the trigger once
+    assert len(backend.query([{"created_by": "user"}, {"state": "ENABLED"}])) == 3
+    # Properties without an index or column are matched too
+    assert ids(backend.query([{"queue_id": other.queue_id}])) == ids([other])
+
+
+def test_list_pages(backend: TriggerBackend, new_trigger):
+    triggers = [new_trigger("user") for _ in range(5)]
+    triggers.append(new_trigger("user", TriggerState.PENDING))
+    triggers.append(new_trigger("other"))
+    for trigger in triggers:
+        backend.create(trigger)
+
+    listed: list[dict] = []
+    marker = None
+    while True:
+        items, marker = backend.list_page(
+            "user", state="ENABLED", limit=2, marker=marker, fields=["state"]
+        )
+        assert len(items) <= 2
+        listed.extend(items)
+        if marker is None:
+            break
+    assert {item["trigger_id"] for item in listed} == {
+        trigger.trigger_id for trigger in triggers[:5]
+    }
+    assert all(set(item) == {"trigger_id", "state"} for item in listed)
+
+    _, marker = backend.list_page("user", limit=1)
+    with pytest.raises(ValueError):
+        backend.list_page("other", marker=marker)
+    with pytest.raises(ValueError):
+        backend.list_page("user", marker="not a marker")
+
+
+@pytest.fixture(params=["memory", "sqlite", "dynamo"])
+def kv_store(request, tmp_path) -> t.Iterator[KeyValueStore]:
+    if request.param == "dynamo":
+        dynamo_store = DynamoKeyValueStore(_dynamo_table_name())
+        table = _dynamo_table(dynamo_store)
+        yield dynamo_store
+        table.delete()
+        return
+    if request.param == "memory":
+        store: KeyValueStore = MemoryKeyValueStore()
+    else:
+        store = SQLiteKeyValueStore(str(tmp_path / "triggers.db"))
+    store.init(create=True)
+    yield store
+
+
+def test_key_value_store(kv_store: KeyValueStore):
+    kv_store.put("ns", "a", {"value": [1, 2]})
+    kv_store.put("ns", "unknown", None)
+    kv_store.put("ns", "expired", "value", ttl=-1)
+    kv_store.put("other", "b", "value")
+
+    assert kv_store.get_many("ns", ["a", "unknown", "expired", "b"]) == {
+        "a": {"value": [1, 2]},
+        "unknown": None,
+    }
+    assert kv_store.get("other", "b") == "value"
+    assert kv_store.items("ns") == {"a": {"value": [1, 2]}, "unknown": None}
+
+    kv_store.put("ns", "a", "replaced", ttl=60)
+    kv_store.delete("other", "b")
+    assert kv_store.get("ns", "a") == "replaced"
+    assert kv_store.get("other", "b", "default") == "default"
+
+
+def test_versioned_key_value_writes(kv_store: KeyValueStore):
+    assert kv_store.get_versioned("ns", "a") == (None, 0)
+    assert kv_store.put_versioned("ns", "a", {"x": 1}, expected_version=0) == 1
+    with pytest.raises(KeyValueVersionConflict):
+        kv_store.put_versioned("ns", "a", {"x": 2}, expected_version=0)
+    assert kv_store.put_versioned("ns", "a", {"x": 2}, expected_version=1) == 2
+    with pytest.raises(KeyValueVersionConflict):
+        kv_store.put_versioned("ns", "a", {"x": 3}, expected_version=1)
+    assert kv_store.get_versioned("ns", "a") == ({"x": 2}, 2)
+    assert kv_store.get("ns", "a") == {"x": 2}
+
+    # Expired entries start again from version 0
+    kv_store.put_versioned("ns", "expired", "value", expected_version=0, ttl=-1)
+    assert kv_store.get_versioned("ns", "expired") == (None, 0)
+    assert kv_store.put_versioned("ns", "expired", "new", expected_version=0) == 1
@@ -0,0 +1,36 @@
+from braid_triggers.resilience import CircuitBreaker, RetryPolicy
+
+
+def test_circuit_breaker(clock):
+    breaker = CircuitBreaker(
+        "example.com", failure_threshold=2, reset_timeout=10, timer=clock
+    )
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after == 10
+
+    # After the reset timeout a single trial request is allowed, and its failure
+    # re-opens the circuit
+    clock.now = 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff(attempt) <= min(5.0, 2**attempt)
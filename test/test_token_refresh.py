@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from braid_triggers.models import Token
+from braid_triggers.token_refresh import TokenRefreshScheduler
+
+
+def _token(expires_in: float) -> Token:
+    return Token(
+        access_token="_dummy_access",
+        scope="scope",
+        refresh_token="_dummy_refresh",
+        expiration_time=int(time.time() + expires_in),
+    )
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_refreshed_before_expiration():
+    refreshed: list[tuple[str, str, float]] = []
+
+    async def refresh(trigger_id: str, scope: str) -> Token:
+        refreshed.append((trigger_id, scope, time.monotonic()))
+        return _token(3600)
+
+    scheduler = TokenRefreshScheduler(refresh, lead=100, jitter=0, rate=20)
+    scheduler.start()
+    try:
+        scheduler.track("t1", {"a": _token(50), "b": _token(3600)})
+        scheduler.track("t2", {"a": _token(60), "b": _token(70)})
+        await asyncio.sleep(0.3)
+    finally:
+        await scheduler.stop()
+
+    assert sorted(r[:2] for r in refreshed) == [("t1", "a"), ("t2", "a"), ("t2", "b")]
+    # Refreshes are spaced by the rate limit
+    start_times = sorted(r[2] for r in refreshed)
+    assert start_times[-1] - start_times[0] >= 0.09
+    # Refreshed tokens are scheduled again ahead of their new expiration
+    assert scheduler.due_time("t1", "a") > time.time() + 3000
+
+
+@pytest.mark.asyncio
+async def test_failures_are_retried_and_untracked_triggers_are_not_refreshed():
+    attempts: list[str] = []
+
+    async def refresh(trigger_id: str, scope: str) -> Token | None:
+        attempts.append(trigger_id)
+        if len(attempts) == 1:
+            raise ValueError("Auth unavailable")
+        return None
+
+    scheduler = TokenRefreshScheduler(
+        refresh, lead=100, jitter=0, rate=100, retry_delay=0.05
+    )
+    scheduler.start()
+    try:
+        scheduler.track("t1", {"a": _token(50)})
+        scheduler.track("t2", {"a": _token(50)})
+        scheduler.untrack("t2")
+        await asyncio.sleep(0.2)
+    finally:
+        await scheduler.stop()
+
+    assert attempts == ["t1", "t1"]
+    # The token no longer exists, so it is no longer tracked
+    assert len(scheduler) == 0
+
+
+def test_shared_owners_are_tracked_until_all_untrack():
+    async def refresh(owner: str, scope: str) -> Token:
+        return _token(3600)
+
+    scheduler = TokenRefreshScheduler(refresh)
+    scheduler.track("pool:user", {"a": _token(3600)})
+    scheduler.track("pool:user", {"a": _token(3600)})
+    scheduler.untrack("pool:user")
+    assert scheduler.due_time("pool:user", "a") is not None
+    scheduler.untrack("pool:user")
+    assert scheduler.due_time("pool:user", "a") is None
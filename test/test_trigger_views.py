@@ -0,0 +1,314 @@
+import os
+import typing as t
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from braid_triggers import tasks, trigger_views
+from braid_triggers.activity import broker
+from braid_triggers.auth_utils import AuthInfo
+from braid_triggers.jsoncodec import loads
+from braid_triggers.models import InternalTrigger, Token, TokenSet, TriggerState
+from braid_triggers.persistence import (
+    init_persistence,
+    lookup_trigger,
+    store_trigger,
+    update_trigger,
+)
+from braid_triggers.trigger_views import (
+    app,
+    globus_auth_required_dependency,
+    route_prefix,
+)
+
+os.environ["TRIGGER_ENVIRONMENT"] = "pytest"
+
+init_persistence()
+
+
+class FakeAuthInfo(AuthInfo):
+    """The authorization of an identity, without introspecting a token"""
+
+    def __init__(self, sub: str):
+        super().__init__("_dummy_access")
+        self._token_resp = {"sub": sub}
+        self.sub = sub
+        self.identities_set = [sub]
+        self._tokenset = TokenSet(
+            user_token=Token(
+                access_token="_dummy_access",
+                scope="_dummy_scope",
+                refresh_token="",
+                expiration_time=123456789,
+            ),
+            dependent_tokens={},
+        )
+
+
+@pytest.fixture
+def auth_info() -> FakeAuthInfo:
+    # A new caller for each test, so that each sees only the triggers it stores
+    return FakeAuthInfo(str(uuid.uuid4()))
+
+
+@pytest.fixture
+def client(auth_info: FakeAuthInfo) -> t.Iterator[TestClient]:
+    app.dependency_overrides[globus_auth_required_dependency] = lambda: auth_info
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def stored_trigger(make_trigger, auth_info) -> t.Callable[..., InternalTrigger]:
+    """Store a trigger created by the caller, returning it as read back from storage"""
+
+    def _store(**fields: t.Any) -> InternalTrigger:
+        trigger = store_trigger(make_trigger(created_by=auth_info.sub, **fields))
+        stored = lookup_trigger(trigger.trigger_id)
+        assert stored is not None
+        return stored
+
+    return _store
+
+
+@pytest.fixture
+def running_trigger(stored_trigger) -> t.Iterator[InternalTrigger]:
+    """An enabled trigger with an event buffer, as though its poller is running here"""
+    trigger = stored_trigger(state=TriggerState.ENABLED)
+    tasks.set_trigger_state(trigger.trigger_id, TriggerState.ENABLED)
+    tasks._get_or_create_event_buffer(trigger.trigger_id)
+    yield trigger
+    tasks._event_buffers.pop(trigger.trigger_id, None)
+    tasks._internal_trigger_states.pop(trigger.trigger_id, None)
+
+
+def _buffered_bodies(trigger_id: str) -> list[dict[str, t.Any]]:
+    buffer = tasks.get_event_buffer(trigger_id)
+    assert buffer is not None
+    return [event.body for event in buffer.events()]
+
+
+def test_send_event(client, running_trigger):
+    trigger_id = running_trigger.trigger_id
+    resp = client.post(
+        f"{route_prefix}/triggers/{trigger_id}/event",
+        params={"event_id": "event-1"},
+        json={"value": 1},
+    )
+    assert resp.status_code == 202, resp.text
+    assert resp.json()["event_id"] == "event-1"
+    assert _buffered_bodies(trigger_id) == [{"value": 1}]
+
+
+def test_send_event_to_pending_trigger(client, stored_trigger):
+    trigger = stored_trigger(state=TriggerState.PENDING)
+    resp = client.post(
+        f"{route_prefix}/triggers/{trigger.trigger_id}/event", json={"value": 1}
+    )
+    assert resp.status_code == 409
+
+
+def test_send_events_as_json_array(client, running_trigger, stored_trigger):
+    trigger_id = running_trigger.trigger_id
+    pending_id = stored_trigger(state=TriggerState.PENDING).trigger_id
+    events = [
+        {"body": {"value": 1}, "event_id": "event-1"},
+        {"body": {"value": 2}, "trigger_id": pending_id},
+        {"body": [2]},
+    ]
+    resp = client.post(
+        f"{route_prefix}/events", params={"trigger_id": trigger_id}, json=events
+    )
+    assert resp.status_code == 200, resp.text
+    result = resp.json()
+    assert (result["accepted"], result["rejected"]) == (1, 2)
+    assert [r["status"] for r in result["results"]] == [202, 409, 400]
+    assert result["results"][0]["event_id"] == "event-1"
+    assert _buffered_bodies(trigger_id) == [{"value": 1}]
+
+
+def test_send_events_as_ndjson(client, running_trigger):
+    trigger_id = running_trigger.trigger_id
+    lines = [
+        f'{{"trigger_id": "{trigger_id}", "body": {{"value": 1}}}}',
+        "not json",
+        f'{{"trigger_id": "{trigger_id}", "body": {{"value": 2}}}}',
+    ]
+    resp = client.post(
+        f"{route_prefix}/events",
+        content="\n".join(lines) + "\n",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert resp.status_code == 200, resp.text
+    result = resp.json()
+    assert [r["status"] for r in result["results"]] == [202, 400, 202]
+    assert _buffered_bodies(trigger_id) == [{"value": 1}, {"value": 2}]
+
+
+def test_get_trigger_revalidation(client, stored_trigger):
+    trigger = stored_trigger()
+    path = f"{route_prefix}/triggers/{trigger.trigger_id}"
+    resp = client.get(path)
+    assert resp.status_code == 200, resp.text
+    etag = resp.headers["ETag"]
+    assert resp.json()["trigger_id"] == trigger.trigger_id
+
+    resp = client.get(path, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == etag
+
+    trigger.event_count += 1
+    update_trigger(trigger)
+    resp = client.get(path, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+
+def test_list_triggers_pages(client, stored_trigger):
+    created = {stored_trigger().trigger_id for _ in range(3)}
+    stored_trigger(state=TriggerState.PENDING)
+    listed: list[str] = []
+    params: dict[str, t.Any] = {"limit": 2, "state": "ENABLED"}
+    while True:
+        resp = client.get(f"{route_prefix}/triggers", params=params)
+        assert resp.status_code == 200, resp.text
+        page = resp.json()
+        assert len(page["triggers"]) <= 2
+        assert all(tr["state"] == "ENABLED" for tr in page["triggers"])
+        listed += [tr["trigger_id"] for tr in page["triggers"]]
+        if not page["has_next_page"]:
+            break
+        params["marker"] = page["marker"]
+    assert sorted(listed) == sorted(created)
+
+
+def test_list_triggers_invalid_marker(client):
+    resp = client.get(f"{route_prefix}/triggers", params={"marker": "not-a-marker"})
+    assert resp.status_code == 400
+
+
+def test_list_triggers_fields(client, stored_trigger):
+    stored_trigger()
+    resp = client.get(
+        f"{route_prefix}/triggers", params={"fields": "state,event_count"}
+    )
+    assert resp.status_code == 200, resp.text
+    triggers = resp.json()["triggers"]
+    assert len(triggers) == 1
+    assert all(
+        set(tr) == {"trigger_id", "state", "event_count"} for tr in triggers
+    ), triggers
+
+    resp = client.get(f"{route_prefix}/triggers", params={"fields": "token_set"})
+    assert resp.status_code == 400
+
+
+def test_list_triggers_revalidation(client, stored_trigger):
+    stored_trigger()
+    resp = client.get(f"{route_prefix}/triggers")
+    assert resp.status_code == 200, resp.text
+    etag = resp.headers["ETag"]
+    resp = client.get(f"{route_prefix}/triggers", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    stored_trigger()
+    resp = client.get(f"{route_prefix}/triggers", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+
+@pytest.fixture
+def started_pollers(monkeypatch) -> list[str]:
+    """The ids of the triggers whose pollers are started"""
+    started: list[str] = []
+
+    async def _start_poller(trigger: InternalTrigger) -> None:
+        started.append(trigger.trigger_id)
+
+    monkeypatch.setattr(trigger_views, "start_poller", _start_poller)
+    return started
+
+
+def _batch(client: TestClient, operation: str, **request: t.Any) -> list[dict]:
+    resp = client.post(
+        f"{route_prefix}/triggers/batch", json={"operation": operation, **request}
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()["results"]
+
+
+def test_batch_get(client, stored_trigger, make_trigger):
+    trigger = stored_trigger()
+    other = store_trigger(make_trigger())
+    results = _batch(
+        client,
+        "get",
+        trigger_ids=[trigger.trigger_id, other.trigger_id, "missing"],
+    )
+    assert [r["status"] for r in results] == [200, 401, 404]
+    assert results[0]["trigger"]["trigger_id"] == trigger.trigger_id
+
+
+def test_batch_enable(client, stored_trigger, running_trigger, started_pollers):
+    pending = stored_trigger(state=TriggerState.PENDING)
+    results = _batch(
+        client,
+        "enable",
+        trigger_ids=[pending.trigger_id, running_trigger.trigger_id],
+    )
+    assert [r["status"] for r in results] == [200, 200]
+    assert all(r["trigger"]["state"] == "ENABLED" for r in results)
+    # The running trigger isn't given a second poller
+    assert started_pollers == [pending.trigger_id]
+    stored = lookup_trigger(pending.trigger_id)
+    assert stored is not None and stored.state == TriggerState.ENABLED
+    tasks._internal_trigger_states.pop(pending.trigger_id, None)
+
+
+def test_batch_disable(client, running_trigger):
+    results = _batch(client, "disable", selector={"state": "ENABLED"})
+    assert [r["trigger_id"] for r in results] == [running_trigger.trigger_id]
+    assert results[0]["status"] == 200
+    assert tasks.get_trigger_state(running_trigger.trigger_id) is TriggerState.PENDING
+
+
+def test_batch_delete(client, stored_trigger, running_trigger):
+    pending = stored_trigger(state=TriggerState.PENDING)
+    results = _batch(
+        client,
+        "delete",
+        trigger_ids=[pending.trigger_id, running_trigger.trigger_id],
+    )
+    assert [r["status"] for r in results] == [200, 200]
+    assert lookup_trigger(pending.trigger_id) is None
+    # The poller of the enabled trigger removes it when it exits
+    assert lookup_trigger(running_trigger.trigger_id) is not None
+    assert tasks.get_trigger_state(running_trigger.trigger_id) is TriggerState.DELETING
+    tasks._internal_trigger_states.pop(pending.trigger_id, None)
+
+
+def test_activity_of_unknown_trigger(client):
+    resp = client.get(f"{route_prefix}/activity", params={"trigger_id": "missing"})
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_stream_activity(auth_info, stored_trigger):
+    trigger = stored_trigger()
+    subscriptions = len(broker)
+    # The stream never ends, so it is read from the endpoint's response directly
+    response = await trigger_views.stream_activity(trigger_id=None, auth_info=auth_info)
+    assert response.media_type == "text/event-stream"
+    stream = response.body_iterator
+    broker.publish(trigger.trigger_id, "other", "event_received", event_id="ignored")
+    broker.publish(trigger.trigger_id, auth_info.sub, "event_received", event_id="1")
+    message = await stream.__anext__()
+    kind, data = message.rstrip("\n").split("\n")
+    assert kind == "event: event_received"
+    activity = loads(data.removeprefix("data: "))
+    assert activity["trigger_id"] == trigger.trigger_id
+    assert activity["details"] == {"event_id": "1"}
+
+    await stream.aclose()
+    assert len(broker) == subscriptions